@@ -29,11 +29,14 @@ from bokeh.plotting import figure
 from caret_analyze import Architecture, Application, Lttng
 from caret_analyze.runtime.node import Node
 from caret_analyze.runtime.callback import CallbackBase, CallbackType
-from caret_analyze.plot import Plot
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
-from common.utils import create_logger, make_destination_dir, read_trace_data, export_graph, trail_df
-from common.utils import round_yaml, get_callback_legend
-from common.utils import ComponentManager
+from common.utils import create_logger, make_destination_dir, read_trace_data, export_graph
+from common.utils import round_yaml, get_callback_legend, run_in_parallel, FigureSpec, GraphExporter, flush_graph
+from common.utils import ComponentManager, TraceCache, load_trace_cache
+from common.utils_metrics import CallbackMetrics
+from common.utils_aggregate import TraceAggregate, AggregatedCallbackMetrics
+from common.utils_plot import create_histogram_figure
+from common.utils_stats import StatsSketch
 
 # Suppress log for CARET
 from logging import getLogger, FATAL
@@ -61,15 +64,19 @@ class StatsCallback():
 
     def calculate(self, data: pd.DataFrame):
         """Calculate stats"""
-        if len(data) > 1:
-            self.avg = round(float(data.mean()), 3)
-            self.std = round(float(data.std()), 3)
-            self.p50 = round(float(np.quantile(data, 0.5)), 3)
-            self.p95 = round(float(np.quantile(data, 0.95)), 3)
-            self.p99 = round(float(np.quantile(data, 0.99)), 3)
-        if len(data) > 0:
-            self.min = round(float(data.min()), 3)
-            self.max = round(float(data.max()), 3)
+        self.calculate_from_sketch(StatsSketch.from_values(data))
+
+    def calculate_from_sketch(self, sketch: StatsSketch):
+        """Calculate stats from sketch (which may be merged from multiple chunks)"""
+        if sketch.count > 1:
+            self.avg = round(sketch.mean(), 3)
+            self.std = round(sketch.std(), 3)
+            self.p50 = round(sketch.quantile(0.5), 3)
+            self.p95 = round(sketch.quantile(0.95), 3)
+            self.p99 = round(sketch.quantile(0.99), 3)
+        if sketch.count > 0:
+            self.min = round(sketch.min(), 3)
+            self.max = round(sketch.max(), 3)
 
     def set_filename_hist(self, filename_hist: str):
         self.filename_hist = filename_hist
@@ -95,18 +102,15 @@ class StatsNode():
         self.callbacks[callback.callback_name][metrics] = vars(callback_stats)
 
 
-def analyze_callback(df_callback: pd.DataFrame, node: Node, callback_name: str,
-                     metrics: str, dest_dir_path: str, method_hist, xaxis_type: str):
+def analyze_callback(sketch: StatsSketch, node: Node, callback_name: str,
+                     metrics: str, dest_dir_path: str):
     """Analyze a callback"""
     callback_stats = StatsCallback()
-    callback_stats.calculate(df_callback)
-    if len(df_callback) > 0:
+    callback_stats.calculate_from_sketch(sketch)
+    if sketch.count > 0:
         callback = node.get_callback(callback_name)
-        fig_hist = method_hist(callback).figure(xaxis_type=xaxis_type)
-        fig_hist.height = 350
-        fig_hist.width = 600
-        fig_hist.legend.visible = False
-        fig_hist.title = get_callback_legend(node, callback_name)
+        fig_hist = FigureSpec(create_histogram_figure, sketch, CallbackMetrics.Y_AXIS_LABEL[metrics.lower()],
+                              get_callback_legend(node, callback_name))
         filename_hist = f"{metrics}{callback.callback_name.replace('/', '_')}_hist"[:250]
         export_graph(fig_hist, dest_dir_path, filename_hist, with_png=False, logger=_logger)
         callback_stats.set_filename_hist(filename_hist)
@@ -114,50 +118,29 @@ def analyze_callback(df_callback: pd.DataFrame, node: Node, callback_name: str,
     return callback_stats
 
 
-def analyze_node(node: Node, dest_dir: str, xaxis_type: str, threshold_freq_not_display: int=200) -> dict:
+def analyze_node(node: Node, dest_dir: str, xaxis_type: str, callback_metrics: CallbackMetrics) -> dict:
     """Analyze a node"""
     _logger.info(f'Processing {node.node_name}')
-    all_metrics_dict = {'Frequency':(Plot.create_frequency_timeseries_plot, Plot.create_frequency_histogram_plot),
-                        'Period': (Plot.create_period_timeseries_plot, Plot.create_period_histogram_plot),
-                        'Latency': (Plot.create_latency_timeseries_plot, Plot.create_latency_histogram_plot)}
     node_stats = StatsNode()
 
-    callbacks_for_graph = node.callbacks  # callbacks with high frequency is not displayed
-    for metrics, method in all_metrics_dict.items():
-        try:
-            p_timeseries = method[0](node.callbacks)
-            measurement = p_timeseries.to_dataframe(xaxis_type=xaxis_type)
-        except:
+    for metrics in ['Frequency', 'Period', 'Latency']:
+        sketch_dict = callback_metrics.calculate_sketch(node.callbacks, metrics, start_strip_num=1, end_strip_num=2)
+        if not sketch_dict:
             _logger.info(f'This node is not called: {node.node_name}')
             return None
 
         has_valid_data = False
-        for key, value in measurement.items():
-            callback_name = key[0]
-            metrics_str = key[1]
-            df_callback = value
-            if 'callback_start_timestamp' in metrics_str:
-                continue
-
-            df_callback = trail_df(df_callback, end_strip_num=2, start_strip_num=1)
-            if len(df_callback) > 0:
+        for callback_name, sketch in sketch_dict.items():
+            if sketch.count > 0:
                 has_valid_data = True
-            callback_stats = analyze_callback(df_callback, node, callback_name, metrics, dest_dir, method[1], xaxis_type)
+            callback_stats = analyze_callback(sketch, node, callback_name, metrics, dest_dir)
             node_stats.set_callback(node.get_callback(callback_name), get_callback_legend(node, callback_name, False),
                                     metrics, callback_stats)
-            if metrics == 'Frequency':
-                freq = callback_stats.avg
-                if isinstance(freq, int) or isinstance(freq, float):
-                    if freq >= threshold_freq_not_display:
-                        _logger.info(f'{callback_name} is not displayed in graph')
-                        callbacks_for_graph.remove(node.get_callback(callback_name))
 
         if has_valid_data:
             try:
-                if metrics != 'Frequency':
-                    p_timeseries = method[0](callbacks_for_graph)
-                fig_timeseries = p_timeseries.figure(xaxis_type=xaxis_type)  # note: this API is heavy when callback runs with high frequency
-                fig_timeseries.y_range.start = 0
+                # Each series is downsampled, so callbacks with high frequency can be displayed
+                fig_timeseries = callback_metrics.create_timeseries_figure(node, node.callbacks, metrics, xaxis_type, y_range_start=0)
                 filename_timeseries = metrics + node.node_name.replace('/', '_')[:250]
                 export_graph(fig_timeseries, dest_dir, filename_timeseries, with_png=False, logger=_logger)
                 node_stats.set_filename_timeseries(metrics, filename_timeseries)
@@ -167,13 +150,14 @@ def analyze_node(node: Node, dest_dir: str, xaxis_type: str, threshold_freq_not_
     return node_stats
 
 
-def analyze_component(node_list: list[Node], dest_dir: str, xaxis_type: str):
+def analyze_component(node_list: list[Node], dest_dir: str, xaxis_type: str, callback_metrics: CallbackMetrics,
+                      jobs: int=1):
     """Analyze a component"""
     make_destination_dir(dest_dir, False, _logger)
 
+    node_stats_list = run_in_parallel(analyze_node, [(node, dest_dir, xaxis_type, callback_metrics) for node in node_list], jobs)
     stats = {}
-    for node in node_list:
-        node_stats = analyze_node(node, dest_dir, xaxis_type)
+    for node, node_stats in zip(node_list, node_stats_list):
         if node_stats:
             stats[node.node_name] = vars(node_stats)
 
@@ -199,19 +183,23 @@ def get_node_list(lttng: Lttng, app: Application, component_name: str) -> list[N
     return node_list
 
 
-def analyze(args, lttng: Lttng, arch: Architecture, app: Application, dest_dir: str):
-    """Analyze nodes"""
+def analyze(args, lttng: Lttng, arch: Architecture, app: Application, dest_dir: str,
+            trace_cache: TraceCache = None, trace_aggregate: TraceAggregate = None):
+    """Analyze nodes (from trace_aggregate if given, see common.utils_aggregate)"""
     global _logger
     if _logger is None:
         _logger = create_logger(__name__, logging.DEBUG if args.verbose else logging.INFO)
     _logger.info('<<< Analyze Nodes: Start >>>')
     make_destination_dir(dest_dir, args.force, _logger)
     ComponentManager().initialize(args.component_list_json, _logger)
+    callback_metrics = AggregatedCallbackMetrics(trace_aggregate) if trace_aggregate else CallbackMetrics(trace_cache)
 
     for component_name, _ in ComponentManager().component_dict.items():
         node_list = get_node_list(lttng, app, component_name)
-        analyze_component(node_list, f'{dest_dir}/{component_name}', 'sim_time' if args.sim_time else 'system_time')
+        analyze_component(node_list, f'{dest_dir}/{component_name}', 'sim_time' if args.sim_time else 'system_time',
+                          callback_metrics, args.jobs)
 
+    flush_graph()
     _logger.info('<<< Analyze Nodes: Finish >>>')
 
 
@@ -227,6 +215,12 @@ def parse_arg():
     parser.add_argument('--end_strip', type=float, default=0.0,
                         help='End strip [sec] to load trace data')
     parser.add_argument('--sim_time', type=strtobool, default=False)
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='The number of processes to analyze in parallel')
+    parser.add_argument('--export_jobs', type=int, default=0,
+                        help='The number of processes to export graphs in background (0: export in the main process)')
+    parser.add_argument('--trace_cache_dir', type=str, default='',
+                        help='Directory to store timestamps extracted from trace data (disabled if empty)')
     parser.add_argument('-f', '--force', action='store_true', default=False,
                         help='Overwrite report directory')
     parser.add_argument('-v', '--verbose', action='store_true', default=False)
@@ -245,13 +239,18 @@ def main():
     _logger.debug(f'component_list_json: {args.component_list_json}')
     _logger.debug(f'start_strip: {args.start_strip}, end_strip: {args.end_strip}')
     _logger.debug(f'sim_time: {args.sim_time}')
+    _logger.debug(f'jobs: {args.jobs}')
+    _logger.debug(f'export_jobs: {args.export_jobs}')
+    GraphExporter.start(args.export_jobs)
+    _logger.debug(f'trace_cache_dir: {args.trace_cache_dir}')
 
     lttng = read_trace_data(args.trace_data[0], args.start_strip, args.end_strip, False)
     arch = Architecture('lttng', str(args.trace_data[0]))
     app = Application(arch, lttng)
+    trace_cache = load_trace_cache(args.trace_cache_dir, args.trace_data[0], args.start_strip, args.end_strip, app, _logger)
 
     dest_dir = args.dest_dir[0]
-    analyze(args, lttng, arch, app, dest_dir + '/analyze_node')
+    analyze(args, lttng, arch, app, dest_dir + '/analyze_node', trace_cache)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,84 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Script to check that callback metrics calculated from timestamps (CallbackMetrics) are the same as CARET timeseries
+"""
+from __future__ import annotations
+import sys
+import os
+import argparse
+import re
+import logging
+from caret_analyze import Architecture, Application
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
+from common.utils import create_logger, read_trace_data
+from common.utils_metrics import CallbackMetrics, compare_with_caret
+
+# Suppress log for CARET
+from logging import getLogger, FATAL
+logger = getLogger()
+logger.setLevel(FATAL)
+
+_logger: logging.Logger = None
+
+
+def parse_arg():
+    """Parse arguments"""
+    parser = argparse.ArgumentParser(
+                description='Script to check callback metrics against CARET')
+    parser.add_argument('trace_data', nargs=1, type=str)
+    parser.add_argument('--start_strip', type=float, default=0.0,
+                        help='Start strip [sec] to load trace data')
+    parser.add_argument('--end_strip', type=float, default=0.0,
+                        help='End strip [sec] to load trace data')
+    parser.add_argument('--node_name_regexp', type=str, default='',
+                        help='Check only nodes whose name matches this regular expression (all if empty)')
+    parser.add_argument('-v', '--verbose', action='store_true', default=False)
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    """Main function"""
+    global _logger
+    args = parse_arg()
+    _logger = create_logger(__name__, logging.DEBUG if args.verbose else logging.INFO)
+
+    _logger.debug(f'trace_data: {args.trace_data[0]}')
+    _logger.debug(f'start_strip: {args.start_strip}, end_strip: {args.end_strip}')
+    _logger.debug(f'node_name_regexp: {args.node_name_regexp}')
+
+    lttng = read_trace_data(args.trace_data[0], args.start_strip, args.end_strip, False)
+    arch = Architecture('lttng', str(args.trace_data[0]))
+    app = Application(arch, lttng)
+    callback_metrics = CallbackMetrics()
+
+    mismatch_num = 0
+    for node in app.nodes:
+        if args.node_name_regexp and not re.search(args.node_name_regexp, node.node_name):
+            continue
+        _logger.debug(f'Processing {node.node_name}')
+        for metrics in ['frequency', 'period', 'latency']:
+            for mismatch in compare_with_caret(callback_metrics, node.callbacks, metrics):
+                _logger.warning(f'{node.node_name}: {mismatch}')
+                mismatch_num += 1
+
+    if mismatch_num > 0:
+        _logger.error(f'{mismatch_num} timeseries are different from CARET')
+        sys.exit(1)
+    _logger.info('All timeseries are the same as CARET')
+
+
+if __name__ == '__main__':
+    main()
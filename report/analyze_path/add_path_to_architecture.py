@@ -21,18 +21,17 @@ import sys
 import os
 import argparse
 import logging
-import threading
 import re
 import json
-import yaml
 from caret_analyze import Architecture
 from caret_analyze.value_objects import PathStructValue, NodePathStructValue
-from caret_analyze.value_objects.communication import CommunicationStructValue
 from caret_analyze.value_objects.message_context import MessageContextType
 from caret_analyze.value_objects.node_path import NodePathStructValue
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
-from common.utils import create_logger
+from common.utils import create_logger, PatternMatcher, load_yaml, dump_yaml
+from common.utils_path_search import PathSearcher, PathSearchAborted, PathSearchCache, search_list_in_process
+from common.utils_path_search import to_path_struct_list_in_process
 
 # Suppress log for CARET
 from logging import getLogger, FATAL
@@ -42,87 +41,54 @@ logger.setLevel(FATAL)
 _logger: logging.Logger = None
 
 
-def find_path(arch: Architecture, comm_filter: Callable[[str], bool], node_filter: Callable[[str], bool], target_path_json: list, max_node_depth: int, timeout: int):
-    """Find target path from architecture"""
-    def get_node_topic(info) -> tuple[str, str]:
-        if isinstance(info, str):
-            return info, None
-        elif isinstance(info, list) and len(info) == 2:
-            return info[0], info[1]
-        _logger.error('Invalid description in JSON file')
-        sys.exit(-1)
+def get_node_topic(info) -> tuple[str, str]:
+    if isinstance(info, str):
+        return info, None
+    elif isinstance(info, list) and len(info) == 2:
+        return info[0], info[1]
+    _logger.error('Invalid description in JSON file')
+    sys.exit(-1)
 
-    def search_paths_with_timeout(arch, node_names, max_node_depth, timeout) -> list:
-        def local_search_paths(arch, node_names, max_node_depth, result_obj):
-            try:
-                result_obj['result'] = arch.search_paths(*node_names, max_node_depth=max_node_depth,
-                                                         node_filter=node_filter, communication_filter=comm_filter)
-            except:
-                _logger.warning(f'path not found')
-                result_obj['result'] = []
-
-        result_obj = {}
-        thread = threading.Thread(target=local_search_paths, args=(arch, node_names, max_node_depth, result_obj), daemon=True)
-        thread.start()
-        thread.join(timeout=timeout)
-        if thread.is_alive():
-            return None
-        return result_obj['result']
-
-    # Find all candidate paths which have the same nodes as JSON
-    found_path_list = []
+
+def create_search_args(target_path_json: list, max_node_depth: int) -> tuple:
+    """Create arguments of PathSearcher.search from path description in JSON
+
+    Node names which don't contain regular expressions are used as waypoints, and
+    node/topic names in JSON (including regular expressions) are checked during search
+    """
     original_node_name_list = []
+    entry_list = []
     for node_topic in target_path_json:
-        node_name = get_node_topic(node_topic)[0]
+        node_name, topic_name = get_node_topic(node_topic)
+        entry_list.append((node_name, topic_name))
         if '[' not in node_name and '.' not in node_name and '*' not in node_name:
             # collect node name which doesn't contain regular expressions
             original_node_name_list.append(node_name)
-    _logger.info(f'node_name_list = {original_node_name_list}')
-
-    for depth in range(1, max_node_depth):
-        _logger.info(f'depth = {depth}')
-        found_path_list = search_paths_with_timeout(arch, original_node_name_list, max_node_depth=depth, timeout=timeout)
-        if found_path_list is None:
-            _logger.warning('Timeout happens. Please specify more details for the path')
-            break
-        _logger.info(f'found path num = {len(found_path_list)}')
-
-        # remove path which contains loop
-        for found_path in found_path_list.copy():
-            node_list = [node for node in found_path.node_names]
-            if len(node_list) != len(set(node_list)):
-                found_path_list.remove(found_path)
-
-        # check node name and topic name(if available)
-        for found_path in found_path_list.copy():
-            node_name_list = found_path.node_names
-            topic_name_list = found_path.topic_names
-            for index, _ in enumerate(target_path_json):
-                json_node_name, json_topic_name = get_node_topic(target_path_json[index])
-                is_ok = False
-                for index_node, node_name in enumerate(node_name_list):
-                    if re.fullmatch(json_node_name, node_name):
-                        is_ok = True
-                        if json_topic_name:
-                            # check topic name (sub or pub) if available
-                            is_ok = False
-                            if index_node > 0:
-                                # check sub topic name
-                                is_ok = re.fullmatch(json_topic_name, topic_name_list[index_node-1])
-                            if index_node < len(topic_name_list):
-                                # check pub topic name
-                                is_ok = is_ok or re.fullmatch(json_topic_name, topic_name_list[index_node])
-                    if is_ok:
-                        break
-                if not is_ok:
-                    found_path_list.remove(found_path)
-                    break
-
-        _logger.info(f'checked path num = {len(found_path_list)}')
-        if len(found_path_list) > 0:
-            break
-
-    if found_path_list is not None and len(found_path_list) > 0:
+    return original_node_name_list, entry_list, max_node_depth - 1
+
+
+def find_path(search_args: tuple, search_result, convert_result) -> list:
+    """Find target path from the result of path search (routes or PathSearchAborted) and its conversion into PathStructValue"""
+    _logger.info(f'node_name_list = {search_args[0]}')
+    if isinstance(search_result, PathSearchAborted):
+        _logger.warning(f'{search_result}. progress: {search_result.progress}')
+        _logger.warning('Search is stopped. Please specify more details for the path')
+        search_result = []
+    _logger.info(f'found route num = {len(search_result)}')
+    if isinstance(convert_result, PathSearchAborted):
+        _logger.warning(f'{convert_result}. progress: {convert_result.progress}')
+        _logger.warning('Conversion of found routes into paths is stopped')
+        convert_result = []
+
+    found_path_list = []
+    for route, path_list in zip(search_result, convert_result):
+        if isinstance(path_list, str):
+            _logger.warning(f'path not found: {route[0]}: {path_list}')
+            continue
+        found_path_list += path_list
+    _logger.info(f'checked path num = {len(found_path_list)}')
+
+    if len(found_path_list) > 0:
         for found_path in found_path_list:
             _logger.debug(found_path.summary)
         return found_path_list
@@ -147,8 +113,8 @@ def find_path(arch: Architecture, comm_filter: Callable[[str], bool], node_filte
 #         yaml.dump(yml, f_yaml, encoding='utf-8', allow_unicode=True, sort_keys=False)
 
 
-def remove_duplicate_subscriptions(architecture_file_path: str):
-    """Remove short-lived duplicate subscriptions from architecture YAML.
+def remove_duplicate_subscriptions(yml: dict) -> bool:
+    """Remove short-lived duplicate subscriptions from architecture (loaded from YAML).
 
     When multiple subscriptions to the same topic exist within a single node
     (e.g. VehicleStopChecker hardcodes /localization/kinematic_state while the
@@ -171,9 +137,6 @@ def remove_duplicate_subscriptions(architecture_file_path: str):
         - topic_name: /localization/kinematic_state
           callback_name: .../callback_5
     """
-    with open(architecture_file_path, encoding='UTF-8') as f:
-        yml = yaml.safe_load(f)
-
     # --- Step 1: Find nodes that have multiple subscriptions to the same topic ---
     duplicated_topics_by_node = {}  # {node_name: set(topic_name)}
     for node in yml.get('nodes', []):
@@ -186,7 +149,7 @@ def remove_duplicate_subscriptions(architecture_file_path: str):
             duplicated_topics_by_node[node['node_name']] = duplicated_topics
 
     if not duplicated_topics_by_node:
-        return
+        return False
 
     # --- Step 2: Clean up subscribes and message_contexts per node ---
     for node in yml.get('nodes', []):
@@ -268,7 +231,7 @@ def remove_duplicate_subscriptions(architecture_file_path: str):
             if chain_node.get('node_name', '') in duplicated_topics_by_node:
                 chain_node.pop('subscription_construction_order', None)
 
-        chain_key = yaml.dump(path['node_chain'], sort_keys=True)
+        chain_key = json.dumps(path['node_chain'], sort_keys=True)
         base_name = re.sub(r'_\d+$', '', path['path_name'])
         if base_name not in seen_paths:
             seen_paths[base_name] = (chain_key, path)
@@ -278,61 +241,64 @@ def remove_duplicate_subscriptions(architecture_file_path: str):
 
     yml['named_paths'] = new_paths
 
-    with open(architecture_file_path, 'w', encoding='UTF-8') as f:
-        yaml.dump(yml, f, encoding='utf-8', allow_unicode=True, sort_keys=False)
-
     _logger.info('remove_duplicate_subscriptions: cleaned up %s', duplicated_topics_by_node.keys())
+    return True
 
-def convert_context_type_to_use_latest_message(arch: Architecture):
-    """Convert context_type from UNDEFINED to use_latest_message"""
-    for target_path_name in arch.path_names:
-        target_path = arch.get_path(target_path_name)
-        child_list = target_path.child
-        for i, child in enumerate(child_list):
-            if type(child) is NodePathStructValue and i > 0 and i < len(child_list) - 1:
-                node_name = child.node_name
-                sub_topic = child_list[i - 1]
-                pub_topic = child_list[i + 1]
-                if type(sub_topic) is CommunicationStructValue and type(pub_topic) is CommunicationStructValue:
-                    sub_topic = sub_topic.topic_name
-                    pub_topic = pub_topic.topic_name
-                    arch.update_message_context(node_name, MessageContextType.USE_LATEST_MESSAGE.type_name, sub_topic, pub_topic)
-
-    # For some reasons, the path needs to be removed/added again to pass verify test
-    for path in arch.paths:
-        arch.remove_path(path.path_name)
-        arch.add_path(path.path_name, path)
+
+def convert_context_type_to_use_latest_message(yml: dict):
+    """Convert context_type of nodes in the middle of paths to use_latest_message
+
+    Architecture (loaded from YAML) is updated in place, so that paths don't need to be removed/added again
+    """
+    node_dict = {node['node_name']: node for node in yml.get('nodes', [])}
+    for path in yml.get('named_paths', []):
+        node_chain = path.get('node_chain', [])
+        for chain_node in node_chain[1:-1]:
+            node = node_dict.get(chain_node.get('node_name', ''))
+            if node is None:
+                continue
+            for message_context in node.get('message_contexts', []):
+                if message_context.get('subscription_topic_name') == chain_node.get('subscribe_topic_name') \
+                    and message_context.get('publisher_topic_name') == chain_node.get('publish_topic_name') \
+                    and message_context.get('subscription_construction_order', 0) == chain_node.get('subscription_construction_order', 0) \
+                    and message_context.get('publisher_construction_order', 0) == chain_node.get('publisher_construction_order', 0):
+                    message_context['context_type'] = MessageContextType.USE_LATEST_MESSAGE.type_name
+
+
+def postprocess_architecture(architecture_file_path: str, use_latest_message: bool):
+    """Convert context type and remove duplicate subscriptions in one pass (the file is read and written only once)"""
+    yml = load_yaml(architecture_file_path)
+    is_updated = False
+    if use_latest_message:
+        convert_context_type_to_use_latest_message(yml)
+        is_updated = True
+    is_updated |= remove_duplicate_subscriptions(yml)
+    if is_updated:
+        dump_yaml(yml, architecture_file_path)
 
 
 def create_search_paths_filter(ignore_topic_list: list[str], ignore_node_list: list[str]) -> tuple[Callable[[str], bool], Callable[[str], bool]]:
-    if ignore_topic_list:
-        topic_filter_list = [re.compile(topic) for topic in ignore_topic_list]
-    else:
-        topic_filter_list = [
-            re.compile('/tf'),
-            re.compile('/tf_static'),
-            re.compile('/diagnostics'),
+    if not ignore_topic_list:
+        ignore_topic_list = [
+            '/tf',
+            '/tf_static',
+            '/diagnostics',
         ]
 
-    if ignore_node_list:
-        node_filter_list = [re.compile(node) for node in ignore_node_list]
-    else:
-        node_filter_list = [
-            re.compile('/_ros2cli_/*'),
-            re.compile('/launch_ros_*'),
+    if not ignore_node_list:
+        ignore_node_list = [
+            '/_ros2cli_/*',
+            '/launch_ros_*',
         ]
 
+    topic_matcher = PatternMatcher(ignore_topic_list)
+    node_matcher = PatternMatcher(ignore_node_list)
+
     def comm_filter(topic_name: str) -> bool:
-        can_pass = True
-        for topic_filter in topic_filter_list:
-            can_pass &= not bool(topic_filter.search(topic_name))
-        return can_pass
+        return not topic_matcher.match_any(topic_name)
 
     def node_filter(node_name: str) -> bool:
-        can_pass = True
-        for node_filter in node_filter_list:
-            can_pass &= not bool(node_filter.search(node_name))
-        return can_pass
+        return not node_matcher.match_any(node_name)
 
     return comm_filter, node_filter
 
@@ -358,21 +324,47 @@ def add_path_to_architecture(args, arch: Architecture):
         target_path_json['ignore_node_list'] if 'ignore_node_list' in target_path_json else None)
 
     # arch.export('architecture_raw.yaml', force=True)
-
-    # Find path from architecture
-    for target_path in target_path_json['target_path_list']:
+    path_searcher = PathSearcher(arch, node_filter, comm_filter)
+
+    # target path can be separated into multiple blocks
+    target_path_info_list = [target_path['path_blocks'] if 'path_blocks' in target_path else [target_path['path']]
+                             for target_path in target_path_json['target_path_list']]
+
+    # Search all target paths and blocks in worker processes (killed on timeout or memory limit)
+    search_args_list = [create_search_args(target_path_block, args.max_node_depth)
+                        for target_path_info in target_path_info_list for target_path_block in target_path_info]
+    #   Results of the same search on the same communication graph are reused from cache
+    path_search_cache = PathSearchCache(args.path_search_cache_dir, path_searcher) if args.path_search_cache_dir else None
+    search_result_list = [path_search_cache.load(search_args) if path_search_cache else None for search_args in search_args_list]
+    search_index_list = [index for index, search_result in enumerate(search_result_list) if search_result is None]
+    _logger.info(f'Path search: {len(search_args_list) - len(search_index_list)} cached, {len(search_index_list)} to search')
+    for index, search_result in zip(search_index_list,
+                                    search_list_in_process(path_searcher, [search_args_list[index] for index in search_index_list],
+                                                           args.search_jobs, args.timeout, args.search_memory_limit, _logger)):
+        search_result_list[index] = search_result
+        if path_search_cache and not isinstance(search_result, PathSearchAborted):
+            try:
+                path_search_cache.save(search_args_list[index], search_result)
+            except:
+                _logger.warning(f'Unable to save path search cache: {args.path_search_cache_dir}')
+    #   Routes are converted into PathStructValue in worker processes too, because it searches paths in CARET architecture
+    convert_index_list = [index for index, search_result in enumerate(search_result_list) if not isinstance(search_result, PathSearchAborted)]
+    convert_result_list = [None] * len(search_result_list)
+    for index, convert_result in zip(convert_index_list,
+                                     to_path_struct_list_in_process(path_searcher, [search_result_list[index] for index in convert_index_list],
+                                                                    args.search_jobs, args.timeout, args.search_memory_limit, _logger)):
+        convert_result_list[index] = convert_result
+    search_result_iter = iter(zip(search_args_list, search_result_list, convert_result_list))
+
+    # Find path from architecture in the original order
+    for target_path, target_path_info in zip(target_path_json['target_path_list'], target_path_info_list):
         target_path_name = target_path['name']
 
-        # target path can be separated into multiple blocks
-        if 'path_blocks' in target_path:
-            target_path_info = target_path['path_blocks']
-        else:
-            target_path_info = [target_path['path']]
-
         found_path_list = []
-        for block_index, target_path_block in enumerate(target_path_info):
+        for block_index, _ in enumerate(target_path_info):
             _logger.info(f'<Processing: {target_path_name}_{block_index}>')
-            found_path_block_list = find_path(arch, comm_filter, node_filter, target_path_block, max_node_depth=args.max_node_depth, timeout=args.timeout)
+            search_args, search_result, convert_result = next(search_result_iter)
+            found_path_block_list = find_path(search_args, search_result, convert_result)
             if len(found_path_block_list) > 0:
                 _logger.info(f'Target path found: {target_path_name}_{block_index}')
                 found_path_list.append(found_path_block_list)
@@ -412,14 +404,9 @@ def add_path_to_architecture(args, arch: Architecture):
                     child.append(terminal_node)
             arch.add_path(target_path_name, PathStructValue(target_path_name, child))
 
-    if args.use_latest_message:
-        # convert_context_type_to_use_latest_message(args.architecture_file_path,
-        #                                            args.architecture_file_path)
-        convert_context_type_to_use_latest_message(arch)
-
     arch.export(args.architecture_file_path, force=True)
 
-    remove_duplicate_subscriptions(args.architecture_file_path)
+    postprocess_architecture(args.architecture_file_path, args.use_latest_message)
 
     _logger.info('<<< Add Path: Finish >>>')
     return arch
@@ -435,6 +422,12 @@ def parse_arg():
     parser.add_argument('--use_latest_message', action='store_true', default=True)
     parser.add_argument('--max_node_depth', type=int, default=15)
     parser.add_argument('--timeout', type=int, default=120)
+    parser.add_argument('--search_memory_limit', type=float, default=0,
+                        help='Memory limit [MB] of each path search process, excluding memory shared with the parent process (0: unlimited)')
+    parser.add_argument('--search_jobs', type=int, default=1,
+                        help='The number of processes to search target paths in parallel')
+    parser.add_argument('--path_search_cache_dir', type=str, default='',
+                        help='Directory to store path search results reused across runs (disabled if empty)')
     parser.add_argument('-v', '--verbose', action='store_true', default=False)
     args = parser.parse_args()
     return args
@@ -452,6 +445,9 @@ def main():
     _logger.debug(f'use_latest_message: {args.use_latest_message}')
     _logger.debug(f'max_node_depth: {args.max_node_depth}')
     _logger.debug(f'timeout: {args.timeout}')
+    _logger.debug(f'search_memory_limit: {args.search_memory_limit}')
+    _logger.debug(f'search_jobs: {args.search_jobs}')
+    _logger.debug(f'path_search_cache_dir: {args.path_search_cache_dir}')
 
     arch = Architecture('lttng', str(args.trace_data[0]))
 
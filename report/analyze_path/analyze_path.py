@@ -27,11 +27,16 @@ import json
 import yaml
 import numpy as np
 import pandas as pd
-from caret_analyze.record import RecordsInterface
+from caret_analyze.runtime.path import Path
 from caret_analyze import Architecture, Application, Lttng
 from caret_analyze.plot import Plot
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
 from common.utils import create_logger, make_destination_dir, read_trace_data, export_graph, round_yaml
+from common.utils import flush_graph, TraceCache, FigureSpec, load_architecture, run_in_parallel, GraphExporter
+from common.utils import TraceEventIndex
+from common.utils_plot import create_timeseries_figure, create_histogram_figure
+from common.utils_stats import StatsSketch
+from common.utils_aggregate import TraceAggregate
 
 # Suppress log for CARET
 from logging import getLogger, FATAL
@@ -44,6 +49,9 @@ warnings.simplefilter("ignore")
 
 _logger: logging.Logger = None
 
+MESSAGE_FLOW_SHORT_DURATION = 3 + 0.1     # [sec]
+MESSAGE_FLOW_SHORT_MARGIN = 1.0           # [sec] for message flows across the window boundaries
+
 
 class Stats():
     def __init__(self, target_path_name: str, node_names: list[str]):
@@ -76,23 +84,19 @@ class Stats():
         self.stacked_bar_worst: dict[str, dict] = {}
 
     def calc_stats(self, df_best: np.ndarray, df_worst: np.ndarray):
-        self.best_avg = round(float(np.average(df_best)), 3)
-        if len(df_best) > 1:
-            self.best_min = round(float(np.min(df_best)), 3)
-            self.best_max = round(float(np.max(df_best)), 3)
-            self.best_std = round(float(np.std(df_best)), 3)
-            self.best_p50 = round(float(np.quantile(df_best, 0.5)), 3)
-            self.best_p95 = round(float(np.quantile(df_best, 0.95)), 3)
-            self.best_p99 = round(float(np.quantile(df_best, 0.99)), 3)
-
-        self.worst_avg = round(float(np.average(df_worst)), 3)
-        if len(df_worst) > 1:
-            self.worst_min = round(float(np.min(df_worst)), 3)
-            self.worst_std = round(float(np.std(df_worst)), 3)
-            self.worst_max = round(float(np.max(df_worst)), 3)
-            self.worst_p50 = round(float(np.quantile(df_worst, 0.5)), 3)
-            self.worst_p95 = round(float(np.quantile(df_worst, 0.95)), 3)
-            self.worst_p99 = round(float(np.quantile(df_worst, 0.99)), 3)
+        self.calc_stats_from_sketch(StatsSketch.from_values(df_best), StatsSketch.from_values(df_worst))
+
+    def calc_stats_from_sketch(self, sketch_best: StatsSketch, sketch_worst: StatsSketch):
+        """Calculate stats from sketches (which may be merged from multiple chunks)"""
+        for case_str, sketch in [('best', sketch_best), ('worst', sketch_worst)]:
+            setattr(self, f'{case_str}_avg', round(sketch.mean(), 3))
+            if sketch.count > 1:
+                setattr(self, f'{case_str}_min', round(sketch.min(), 3))
+                setattr(self, f'{case_str}_max', round(sketch.max(), 3))
+                setattr(self, f'{case_str}_std', round(sketch.std(ddof=0), 3))
+                setattr(self, f'{case_str}_p50', round(sketch.quantile(0.5), 3))
+                setattr(self, f'{case_str}_p95', round(sketch.quantile(0.95), 3))
+                setattr(self, f'{case_str}_p99', round(sketch.quantile(0.99), 3))
 
     def store_filename(self, target_path_name: str, save_long_graph: bool):
         if save_long_graph:
@@ -107,8 +111,14 @@ class Stats():
 
 
     def calc_stats_stacked_bar(self, df_best: pd.DataFrame, df_worst: pd.DataFrame):
+        self.calc_stats_stacked_bar_from_sketch(
+            {name: StatsSketch.from_values(df_best[name]) for name in df_best.columns if name != 'start time'},
+            {name: StatsSketch.from_values(df_worst[name]) for name in df_worst.columns if name != 'start time'})
+
+    def calc_stats_stacked_bar_from_sketch(self, sketch_dict_best: dict[str, StatsSketch], sketch_dict_worst: dict[str, StatsSketch]):
+        """Calculate stats of each column of stacked bar from sketches (which may be merged from multiple chunks)"""
         class StatsValue():
-            def __init__(self, df: pd.DataFrame):
+            def __init__(self, sketch: StatsSketch):
                 self.avg = '---'
                 self.std = '---'
                 self.min = '---'
@@ -116,26 +126,23 @@ class Stats():
                 self.p50 = '---'
                 self.p95 = '---'
                 self.p99 = '---'
-                if len(df) > 1:
-                    self.avg = round(float(df.mean()), 3)
-                    self.std = round(float(df.std()), 3)
-                    self.p50 = round(float(df.quantile(0.50)), 3)
-                    self.p95 = round(float(df.quantile(0.95)), 3)
-                    self.p99 = round(float(df.quantile(0.99)), 3)
-                if len(df) > 0:
-                    self.min = round(float(df.min()), 3)
-                    self.max = round(float(df.max()), 3)
-
-        for name in df_best.columns:
-            if name == 'start time':
-                continue
-            self.stacked_bar_best[name] = vars(StatsValue(df_best[name]))
-            self.stacked_bar_worst[name] = vars(StatsValue(df_worst[name]))
-
-
-def get_messageflow_durationtime(records: RecordsInterface, check_by_input: bool = True):
+                if sketch.count > 1:
+                    self.avg = round(sketch.mean(), 3)
+                    self.std = round(sketch.std(), 3)
+                    self.p50 = round(sketch.quantile(0.50), 3)
+                    self.p95 = round(sketch.quantile(0.95), 3)
+                    self.p99 = round(sketch.quantile(0.99), 3)
+                if sketch.count > 0:
+                    self.min = round(sketch.min(), 3)
+                    self.max = round(sketch.max(), 3)
+
+        for name, sketch in sketch_dict_best.items():
+            self.stacked_bar_best[name] = vars(StatsValue(sketch))
+            self.stacked_bar_worst[name] = vars(StatsValue(sketch_dict_worst.get(name, StatsSketch())))
+
+
+def get_messageflow_durationtime(df_records: pd.DataFrame, check_by_input: bool = True):
     """Get duration time [sec] of message flow"""
-    df_records = records.to_dataframe()
     try:
         input_column = df_records.columns[0]
         input_time_min = df_records[input_column].min()
@@ -155,8 +162,7 @@ def get_messageflow_durationtime(records: RecordsInterface, check_by_input: bool
     return duration
 
 
-def check_the_first_last_callback_is_valid(records: RecordsInterface):
-    df_records = records.to_dataframe()
+def check_the_first_last_callback_is_valid(df_records: pd.DataFrame):
     is_first_valid = True
     is_last_valid = True
     if len(df_records.columns) == 0 or len(df_records[df_records.columns[0]]) == 0:
@@ -169,32 +175,117 @@ def check_the_first_last_callback_is_valid(records: RecordsInterface):
     return is_first_valid, is_last_valid
 
 
-def analyze_path(args, dest_dir: str, arch: Architecture, app: Application, target_path_name: str, include_first_last_callback: dict, xaxis_type: str):
-    """Analyze a path"""
-    _logger.info(f'Processing: {target_path_name}')
+def get_target_path(app: Application, target_path_name: str, include_first_last_callback: dict):
+    """Get path and its records (as dataframe). The first and last callback are included if availble"""
     target_path = app.get_path(target_path_name)
-
-    # Include the first and last callback if availble
     target_path.include_first_callback = include_first_last_callback[target_path_name][0]
     target_path.include_last_callback = include_first_last_callback[target_path_name][1]
-    records = target_path.to_records()
-    is_first_valid, is_last_valid = check_the_first_last_callback_is_valid(records)
+    df_records = target_path.to_records().to_dataframe()
+    is_first_valid, is_last_valid = check_the_first_last_callback_is_valid(df_records)
     if (not is_first_valid) or (not is_last_valid):
         target_path.include_first_callback = is_first_valid
         target_path.include_last_callback = is_last_valid
-        records = target_path.to_records()
+        df_records = target_path.to_records().to_dataframe()
+    return target_path, df_records
+
+
+def calc_response_time(target_path: Path, case_str: str, xaxis_type: str) -> tuple[np.ndarray, np.ndarray]:
+    """Calculate start timestamps [ns] and response time [ms] of path by CARET"""
+    df_response_time = Plot.create_response_time_timeseries_plot(target_path, case=case_str).to_dataframe(xaxis_type=xaxis_type).dropna()
+    return df_response_time.iloc[:, 0].to_numpy(dtype=np.int64), df_response_time.iloc[:, 1].to_numpy(dtype=float)
+
+
+def get_response_time(target_path: Path, case_str: str, xaxis_type: str,
+                      trace_cache: TraceCache = None) -> tuple[np.ndarray, np.ndarray]:
+    """Get start timestamps [ns] and response time [ms] of path (from trace cache if available)"""
+    response_time = trace_cache.get_path(target_path.path_name, case_str) if trace_cache and xaxis_type == 'system_time' else None
+    if response_time is not None:
+        return np.asarray(response_time[0], dtype=np.int64), np.asarray(response_time[1]) / 1e6
+    return calc_response_time(target_path, case_str, xaxis_type)
+
+
+def extract_response_time(args, arch: Architecture, app: Application,
+                          stacked_bar_dict: dict[str, pd.DataFrame] = None) -> dict[str, list[np.ndarray]]:
+    """Extract start timestamps [ns] and response time [ns] of each path and case to be stored in TraceCache ('path' group)
+
+    Dataframes of response time stacked bar (best and worst) are also stored into stacked_bar_dict if given (see TraceAggregate)
+    """
+    global _logger
+    if _logger is None:
+        _logger = create_logger(__name__, logging.DEBUG if args.verbose else logging.INFO)
+    include_first_last_callback = get_include_first_last_callback(args, arch)
+    response_time_dict = {}
+    for target_path in arch.paths:
+        target_path_name = target_path.path_name
+        try:
+            if not arch.get_path(target_path_name).verify():
+                continue
+            path, _ = get_target_path(app, target_path_name, include_first_last_callback)
+            for case_str in ['best', 'worst', 'all']:
+                start_timestamps, response_time_ms = calc_response_time(path, case_str, 'system_time')
+                response_time_dict[TraceCache.make_path_name(target_path_name, case_str)] = [
+                    start_timestamps, np.round(response_time_ms * 1e6).astype(np.int64)]
+        except:
+            _logger.debug(f'No response time in trace cache: {target_path_name}')
+            continue
+        if stacked_bar_dict is None:
+            continue
+        for case_str in ['best', 'worst']:
+            try:
+                stacked_bar_dict[TraceCache.make_path_name(target_path_name, case_str)] = \
+                    Plot.create_response_time_stacked_bar_plot(path, case=case_str).to_dataframe(xaxis_type='system_time')
+            except:
+                _logger.debug(f'No response time stacked bar in trace aggregate: {target_path_name}, {case_str}')
+    return response_time_dict
+
+
+def create_message_flow_short(event_index: TraceEventIndex, arch: Architecture, target_path: Path, df_records: pd.DataFrame, duration: float):
+    """Create message flow graph of the middle of trace (MESSAGE_FLOW_SHORT_DURATION)
+
+    Only events around the window are extracted if event_index is given (events are kept in memory by --message_flow_window),
+    so that records of the whole trace are not processed. Otherwise the whole records are stripped
+    """
+    lstrip_s = duration / 2
+    rstrip_s = max(duration / 2 - MESSAGE_FLOW_SHORT_DURATION, 0)
+    if event_index is not None and rstrip_s > MESSAGE_FLOW_SHORT_MARGIN:
+        start_timestamp = int(df_records[df_records.columns[0]].min() + lstrip_s * 1e9)
+        lttng_window = event_index.window(int(start_timestamp - MESSAGE_FLOW_SHORT_MARGIN * 1e9),
+                                          int(start_timestamp + (MESSAGE_FLOW_SHORT_DURATION + MESSAGE_FLOW_SHORT_MARGIN) * 1e9),
+                                          _logger)
+        if lttng_window is not None:
+            try:
+                path_window = Application(arch, lttng_window).get_path(target_path.path_name)
+                path_window.include_first_callback = target_path.include_first_callback
+                path_window.include_last_callback = target_path.include_last_callback
+                return Plot.create_message_flow_plot(path_window,
+                        lstrip_s=MESSAGE_FLOW_SHORT_MARGIN,
+                        rstrip_s=MESSAGE_FLOW_SHORT_MARGIN).figure(full_legends=True)
+            except:
+                _logger.debug(f'    Unable to create message flow from trace data window: {target_path.path_name}')
+    return Plot.create_message_flow_plot(target_path, lstrip_s=lstrip_s, rstrip_s=rstrip_s).figure(full_legends=True)
+
+
+def analyze_path(args, dest_dir: str, arch: Architecture, app: Application, target_path_name: str, include_first_last_callback: dict, xaxis_type: str,
+                 trace_cache: TraceCache = None, event_index: TraceEventIndex = None, trace_aggregate: TraceAggregate = None):
+    """Analyze a path
+
+    Records and response time of each case are calculated only once (or read from trace_cache),
+    then timeseries, histogram and stats are created from the same arrays.
+    If trace_aggregate is given, response time and stacked bar stats are of the whole trace (aggregated in windows),
+    while message flow and stacked bar graph are of lttng/app (a window of trace data)
+    """
+    _logger.info(f'Processing: {target_path_name}')
+    target_path, df_records = get_target_path(app, target_path_name, include_first_last_callback)
 
     stats = Stats(target_path_name, arch.get_path(target_path_name).node_names)
 
     _logger.info('  message flow')
-    duration = get_messageflow_durationtime(records)
+    duration = get_messageflow_durationtime(df_records)
     if duration is None:
         _logger.warning(f'    No-traffic and No-input in the path: {target_path_name}')
         return stats
 
-    graph_short = Plot.create_message_flow_plot(target_path,
-                lstrip_s=duration / 2,
-                rstrip_s=max(duration / 2 - (3 + 0.1), 0)).figure(full_legends=True)
+    graph_short = create_message_flow_short(event_index, arch, target_path, df_records, duration)
     message_flow_height = 18 * len(target_path.child_names) + 50
     graph_short.frame_height = message_flow_height  # height doesn't work for some reasons...
     export_graph(graph_short, dest_dir, f'{target_path_name}_messageflow_short', target_path_name, with_png=False)
@@ -205,23 +296,23 @@ def analyze_path(args, dest_dir: str, arch: Architecture, app: Application, targ
         export_graph(graph, dest_dir, f'{target_path_name}_messageflow', target_path_name, with_png=False)
 
     _logger.info('  response time')
-    if get_messageflow_durationtime(records, check_by_input=False) is None:
+    if get_messageflow_durationtime(df_records, check_by_input=False) is None:
         _logger.warning(f'    No-traffic in the path: {target_path_name}')
     else:
-        df_response_time = {}
+        sketch_dict = {}
         df_stacked_bar = {}
         for case_str in ['best', 'worst', 'all']:
-            plot_timeseries = Plot.create_response_time_timeseries_plot(target_path, case=case_str)
-            fig_timeseries = plot_timeseries.figure(full_legends=False, xaxis_type=xaxis_type)
-            df_response_time[case_str] = plot_timeseries.to_dataframe(xaxis_type=xaxis_type)
-            fig_hist = Plot.create_response_time_histogram_plot(target_path, case=case_str).figure(full_legends=False, xaxis_type=xaxis_type)
-            fig_timeseries.y_range.start = 0
-            fig_timeseries.legend.visible = False
-            fig_hist.legend.visible = False
-            fig_timeseries.frame_width = 500  # width doesn't work for some reasons...
-            fig_timeseries.frame_height = 320  # height doesn't work for some reasons...
-            fig_hist.width = 600
-            fig_hist.height = 400
+            if trace_aggregate:
+                series = trace_aggregate.get_series('path', TraceCache.make_path_name(target_path_name, case_str))
+                start_timestamps, response_time_ms = series.get_timeseries()
+                sketch_dict[case_str] = series.get_sketch()
+            else:
+                start_timestamps, response_time_ms = get_response_time(target_path, case_str, xaxis_type, trace_cache)
+                sketch_dict[case_str] = StatsSketch.from_values(response_time_ms, max_exact_num=max(len(response_time_ms), 1))
+            fig_timeseries = FigureSpec(create_timeseries_figure, {target_path_name: (start_timestamps, response_time_ms)},
+                                        'Response Time [ms]', width=600, height=400, y_range_start=0,
+                                        x_axis_label='system time [s]' if xaxis_type == 'system_time' else 'simulation time [s]')
+            fig_hist = FigureSpec(create_histogram_figure, sketch_dict[case_str], 'Response Time [ms]', width=600, height=400)
             export_graph(fig_timeseries, dest_dir, target_path_name + f'_timeseries_{case_str}', target_path_name, with_png=False)
             export_graph(fig_hist, dest_dir, target_path_name + f'_hist_{case_str}', target_path_name, with_png=False)
             try:
@@ -231,8 +322,13 @@ def analyze_path(args, dest_dir: str, arch: Architecture, app: Application, targ
             except Exception as e:
                 _logger.warning(f'    Failed to create stacked bar graph: {target_path_name}, {case_str}')
                 _logger.warning(str(e))
-        stats.calc_stats(df_response_time['best'].iloc[:, 1], df_response_time['worst'].iloc[:, 1])
-        stats.calc_stats_stacked_bar(df_stacked_bar['best'], df_stacked_bar['worst'])
+        stats.calc_stats_from_sketch(sketch_dict['best'], sketch_dict['worst'])
+        if trace_aggregate:
+            stats.calc_stats_stacked_bar_from_sketch(
+                *[{name: series.get_sketch() for name, series in trace_aggregate.get_stacked_bar(target_path_name, case_str).items()}
+                  for case_str in ['best', 'worst']])
+        elif 'best' in df_stacked_bar and 'worst' in df_stacked_bar:
+            stats.calc_stats_stacked_bar(df_stacked_bar['best'], df_stacked_bar['worst'])
 
     stats.store_filename(target_path_name, args.message_flow)
     _logger.info(f'---{target_path_name}---')
@@ -263,8 +359,9 @@ def get_include_first_last_callback(args, arch: Architecture):
     return include_first_last_callback
 
 
-def analyze(args, lttng: Lttng, arch: Architecture, app: Application, dest_dir: str):
-    """Analyze paths"""
+def analyze(args, lttng: Lttng, arch: Architecture, app: Application, dest_dir: str,
+            trace_cache: TraceCache = None, trace_aggregate: TraceAggregate = None):
+    """Analyze paths (response time from trace_aggregate if given, see common.utils_aggregate)"""
     global _logger
     if _logger is None:
         _logger = create_logger(__name__, logging.DEBUG if args.verbose else logging.INFO)
@@ -290,13 +387,19 @@ def analyze(args, lttng: Lttng, arch: Architecture, app: Application, dest_dir:
         _logger.warning(f'path has been removed {path_name}')
         arch.remove_path(path_name)
 
-    # Analyze each path
-    for target_path in arch.paths:
-        target_path_name = target_path.path_name
-        stats = analyze_path(args, dest_dir, arch, app, target_path_name, include_first_last_callback, xaxis_type)
+    # Index events kept in memory once to extract the short message flow window of each path
+    event_index = TraceEventIndex.from_lttng(lttng) if getattr(args, 'message_flow_window', False) else None
+
+    # Analyze each path (in parallel, the longest path first)
+    target_path_name_list = [target_path.path_name for target_path in arch.paths]
+    task_list = [(args, dest_dir, arch, app, target_path_name, include_first_last_callback, xaxis_type, trace_cache, event_index, trace_aggregate)
+                 for target_path_name in target_path_name_list]
+    cost_list = [len(arch.get_path(target_path_name).node_names) for target_path_name in target_path_name_list]
+    for stats in run_in_parallel(analyze_path, task_list, getattr(args, 'jobs', 1), cost_list):
         stats_list.append(vars(stats))
 
     # Save stats file
+    flush_graph()
     stat_file_path = f'{dest_dir}/stats_path.yaml'
     with open(stat_file_path, 'w', encoding='utf-8') as f_yaml:
         yaml.safe_dump(stats_list, f_yaml, encoding='utf-8', allow_unicode=True, sort_keys=False)
@@ -315,11 +418,17 @@ def parse_arg():
     parser.add_argument('--architecture_file_path', type=str, default='architecture_path.yaml')
     parser.add_argument('-m', '--message_flow', type=strtobool, default=False,
                         help='Output message flow graph')
+    parser.add_argument('--message_flow_window', type=strtobool, default=False,
+                        help='Keep events in memory to create the short message flow from events around it (faster for long traces, but uses more memory)')
     parser.add_argument('--start_strip', type=float, default=0.0,
                         help='Start strip [sec] to load trace data')
     parser.add_argument('--end_strip', type=float, default=0.0,
                         help='End strip [sec] to load trace data')
     parser.add_argument('--sim_time', type=strtobool, default=False)
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='The number of processes to analyze paths in parallel')
+    parser.add_argument('--export_jobs', type=int, default=0,
+                        help='The number of processes to export graphs in background (0: export in the main process)')
     parser.add_argument('-f', '--force', action='store_true', default=False,
                         help='Overwrite report directory')
     parser.add_argument('-v', '--verbose', action='store_true', default=False)
@@ -341,9 +450,14 @@ def main():
     _logger.debug(f'sim_time: {args.sim_time}')
     args.message_flow = True if args.message_flow == 1 else False
     _logger.debug(f'message_flow: {args.message_flow}')
-
-    lttng = read_trace_data(args.trace_data[0], args.start_strip, args.end_strip, False)
-    arch = Architecture('yaml', args.architecture_file_path)
+    _logger.debug(f'message_flow_window: {args.message_flow_window}')
+    _logger.debug(f'jobs: {args.jobs}')
+    _logger.debug(f'export_jobs: {args.export_jobs}')
+    GraphExporter.start(args.export_jobs)
+
+    # Events are kept in memory to extract the short message flow window without processing the whole records
+    lttng = read_trace_data(args.trace_data[0], args.start_strip, args.end_strip, False, store_events=args.message_flow_window)
+    arch = load_architecture(args.architecture_file_path, _logger)
     app = Application(arch, lttng)
 
     dest_dir = args.dest_dir[0]
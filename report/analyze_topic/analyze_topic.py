@@ -30,11 +30,14 @@ from bokeh.plotting import figure
 from caret_analyze import Architecture, Application, Lttng
 from caret_analyze.runtime.communication import Communication
 from caret_analyze.runtime.callback import CallbackBase, CallbackType
-from caret_analyze.plot import Plot, PlotBase
+from caret_analyze.plot import PlotBase
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
-from common.utils import create_logger, make_destination_dir, read_trace_data, export_graph, trail_df
-from common.utils import round_yaml, get_callback_legend
-from common.utils import ComponentManager
+from common.utils import create_logger, make_destination_dir, read_trace_data, export_graph
+from common.utils import round_yaml, get_callback_legend, run_in_parallel, GraphExporter, flush_graph
+from common.utils import ComponentManager, TraceCache, load_trace_cache
+from common.utils_metrics import CommunicationMetrics
+from common.utils_aggregate import TraceAggregate, AggregatedCommunicationMetrics
+from common.utils_stats import StatsSketch
 
 # Suppress log for CARET
 from logging import getLogger, FATAL
@@ -54,16 +57,6 @@ class Metrics(Enum):
     LATENCY = 3
 
 
-def get_comm_plot(comm: Communication, metrics: Metrics):
-    # todo: create_communication_frequency_plot doesn't work (it's stuck and consumes too much memory)
-    if metrics == Metrics.FREQUENCY:
-        return Plot.create_frequency_timeseries_plot([comm.publisher, comm.subscription])
-    elif metrics == Metrics.PERIOD:
-        return Plot.create_period_timeseries_plot([comm.publisher, comm.subscription])
-    elif metrics == Metrics.LATENCY:
-        return Plot.create_latency_timeseries_plot(comm)
-
-
 class StatsComm():
     """Statistics of comm"""
     def __init__(self, topic_name, publish_node_name, subscribe_node_name):
@@ -81,66 +74,58 @@ class StatsComm():
 
     def calculate(self, data: pd.DataFrame):
         """Calculate stats"""
-        if len(data) > 1:
-            self.avg = round(float(data.mean()), 3)
-            self.std = round(float(data.std()), 3)
-            self.p50 = round(float(np.quantile(data, 0.5)), 3)
-            self.p95 = round(float(np.quantile(data, 0.95)), 3)
-            self.p99 = round(float(np.quantile(data, 0.99)), 3)
-        if len(data) > 0:
-            self.min = round(float(data.min()), 3)
-            self.max = round(float(data.max()), 3)
-
-
-def create_stats_for_comm(comm: Communication, index: int, metrics: Metrics, dest_dir: str, xaxis_type: str, with_graph: bool) -> StatsComm:
+        self.calculate_from_sketch(StatsSketch.from_values(data))
+
+    def calculate_from_sketch(self, sketch: StatsSketch):
+        """Calculate stats from sketch (which may be merged from multiple chunks)"""
+        if sketch.count > 1:
+            self.avg = round(sketch.mean(), 3)
+            self.std = round(sketch.std(), 3)
+            self.p50 = round(sketch.quantile(0.5), 3)
+            self.p95 = round(sketch.quantile(0.95), 3)
+            self.p99 = round(sketch.quantile(0.99), 3)
+        if sketch.count > 0:
+            self.min = round(sketch.min(), 3)
+            self.max = round(sketch.max(), 3)
+
+
+def create_stats_for_comm(comm: Communication, index: int, metrics: Metrics, dest_dir: str, xaxis_type: str,
+                          comm_metrics: CommunicationMetrics) -> StatsComm:
     stats_comm = StatsComm(comm.topic_name, comm.publish_node_name, comm.subscribe_node_name)
     try:
-        timeseries_plot = get_comm_plot(comm, metrics)
-        if with_graph:
-            figure = timeseries_plot.figure(xaxis_type=xaxis_type)
-            figure.y_range.start = 0
-            graph_filename = metrics.name + comm.topic_name.replace('/', '_') + '_' + str(index)
-            graph_filefilename_suffix = comm.subscribe_node_name.replace('/', '_')
-            graph_filename = graph_filename + graph_filefilename_suffix[:120-len(graph_filename)]  # avoid too long file name
-            stats_comm.filename = graph_filename
-            export_graph(figure, dest_dir, graph_filename, with_png=False, logger=_logger)
-        df_comm = timeseries_plot.to_dataframe(xaxis_type=xaxis_type)
-        df_comm = df_comm.iloc[:, 1]                  # get metrics value only (use value of publish. df=|time|pub|time|sub|)
-        df_comm = trail_df(df_comm, end_strip_num=2)  # remove the last data because freq becomes small
-        stats_comm.calculate(df_comm)
+        df_comm = comm_metrics.to_dataframe(comm, metrics.name, xaxis_type)
+        figure = comm_metrics.create_timeseries_figure(comm, metrics.name, df_comm, xaxis_type, y_range_start=0)
+        graph_filename = metrics.name + comm.topic_name.replace('/', '_') + '_' + str(index)
+        graph_filefilename_suffix = comm.subscribe_node_name.replace('/', '_')
+        graph_filename = graph_filename + graph_filefilename_suffix[:120-len(graph_filename)]  # avoid too long file name
+        stats_comm.filename = graph_filename
+        export_graph(figure, dest_dir, graph_filename, with_png=False, logger=_logger)
+        # get metrics value of publish only (df=|time|pub|time|sub|), and remove the last data because freq becomes small
+        stats_comm.calculate_from_sketch(comm_metrics.get_sketch(comm, metrics.name, df_comm, end_strip_num=2))
     except:
         _logger.info(f'This comm is invalid: {comm.topic_name}: {comm.publish_node_name} -> {comm.subscribe_node_name}')
         return None
     return stats_comm
 
 
-def analyze_comms(topic_name: str, comm_list: list[Communication], dest_dir: str, xaxis_type: str, threshold_freq_not_display: int=300) -> dict[str, list[StatsComm]]:
+def analyze_comms(topic_name: str, comm_list: list[Communication], dest_dir: str, xaxis_type: str,
+                  comm_metrics: CommunicationMetrics) -> dict[str, list[StatsComm]]:
     """Analyze topic (communications)"""
     _logger.info(f'Processing {topic_name}')
 
     stats_dict: dict[str, list[StatsComm]] = {}
-    skip_list = []
 
     for metrics in Metrics:
         for index, comm in enumerate(comm_list):
-            with_graph = True
-            if comm in skip_list and metrics != Metrics.FREQUENCY:
-                with_graph = False
-            stats_comm = create_stats_for_comm(comm, index, metrics, dest_dir, xaxis_type, with_graph)
+            stats_comm = create_stats_for_comm(comm, index, metrics, dest_dir, xaxis_type, comm_metrics)
             if stats_comm is None:
                 continue
-            if metrics == Metrics.FREQUENCY:
-                freq = stats_comm.avg
-                if isinstance(freq, int) or isinstance(freq, float):
-                    if freq >= threshold_freq_not_display:
-                        _logger.info(f'{comm.topic_name} is not displayed in graph')
-                        skip_list.append(comm)
             stats_dict.setdefault(metrics.name, [])
             stats_dict[metrics.name].append(stats_comm)
     return stats_dict
 
 
-def analyze_topic(app: Application, topic_name: str, dest_dir: str, xaxis_type: str):
+def analyze_topic(app: Application, topic_name: str, dest_dir: str, xaxis_type: str, comm_metrics: CommunicationMetrics):
     """Analyze a topic"""
     try:
         comm_list: list[Communication] = app.get_communications(topic_name)
@@ -151,7 +136,7 @@ def analyze_topic(app: Application, topic_name: str, dest_dir: str, xaxis_type:
         return
 
     make_destination_dir(dest_dir, False, _logger)
-    stats_dict = analyze_comms(topic_name, comm_list, dest_dir, xaxis_type)
+    stats_dict = analyze_comms(topic_name, comm_list, dest_dir, xaxis_type, comm_metrics)
     if not stats_dict:
         return
     for metrics_name, stats_list in stats_dict.items():
@@ -164,32 +149,22 @@ def analyze_topic(app: Application, topic_name: str, dest_dir: str, xaxis_type:
         round_yaml(stat_file_path)
 
 
-def analyze_component(app: Application, topic_name_list: list[str], dest_dir: str, xaxis_type: str):
+def analyze_component(app: Application, topic_name_list: list[str], dest_dir: str, xaxis_type: str,
+                      comm_metrics: CommunicationMetrics, jobs: int=1):
     """Analyze a component"""
     make_destination_dir(dest_dir, False, _logger)
-    for topic_name in topic_name_list:
-        topic_dest_dir = f"{dest_dir}/{topic_name.replace('/', '_').lstrip('_')}"
-        analyze_topic(app, topic_name, topic_dest_dir, xaxis_type)
+    task_list = [(app, topic_name, f"{dest_dir}/{topic_name.replace('/', '_').lstrip('_')}", xaxis_type, comm_metrics)
+                 for topic_name in topic_name_list]
+    run_in_parallel(analyze_topic, task_list, jobs)
 
 
 def create_component_topic_dict(arch: Architecture) -> dict[str, list[str]]:
-    dict_component_name_topic: dict[str, list[str]] = {}
-    for topic_name in arch.topic_names:
-        is_match = False
-        for component_name, _ in ComponentManager().component_dict.items():
-            if ComponentManager().check_if_target(component_name, topic_name):
-                dict_component_name_topic.setdefault(component_name, [])
-                dict_component_name_topic[component_name].append(topic_name)
-                is_match = True
-                break
-        if not is_match:
-            dict_component_name_topic.setdefault('other', [])
-            dict_component_name_topic['other'].append(topic_name)
-    return dict_component_name_topic
-
-
-def analyze(args, lttng: Lttng, arch: Architecture, app: Application, dest_dir: str):
-    """Analyze topics"""
+    return ComponentManager().partition(arch.topic_names)
+
+
+def analyze(args, lttng: Lttng, arch: Architecture, app: Application, dest_dir: str,
+            trace_cache: TraceCache = None, trace_aggregate: TraceAggregate = None):
+    """Analyze topics (from trace_aggregate if given, see common.utils_aggregate)"""
     global _logger
     if _logger is None:
         _logger = create_logger(__name__, logging.DEBUG if args.verbose else logging.INFO)
@@ -197,10 +172,13 @@ def analyze(args, lttng: Lttng, arch: Architecture, app: Application, dest_dir:
     make_destination_dir(dest_dir, args.force, _logger)
     ComponentManager().initialize(args.component_list_json, _logger)
     dict_component_name_topic = create_component_topic_dict(arch)
+    comm_metrics = AggregatedCommunicationMetrics(trace_aggregate) if trace_aggregate else CommunicationMetrics(trace_cache)
 
     for component_name, topic_name_list in dict_component_name_topic.items():
-        analyze_component(app, topic_name_list, f'{dest_dir}/{component_name}', 'sim_time' if args.sim_time else 'system_time')
+        analyze_component(app, topic_name_list, f'{dest_dir}/{component_name}', 'sim_time' if args.sim_time else 'system_time',
+                          comm_metrics, args.jobs)
 
+    flush_graph()
     _logger.info('<<< Analyze Topic: Finish >>>')
 
 
@@ -216,6 +194,12 @@ def parse_arg():
     parser.add_argument('--end_strip', type=float, default=0.0,
                         help='End strip [sec] to load trace data')
     parser.add_argument('--sim_time', type=strtobool, default=False)
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='The number of processes to analyze in parallel')
+    parser.add_argument('--export_jobs', type=int, default=0,
+                        help='The number of processes to export graphs in background (0: export in the main process)')
+    parser.add_argument('--trace_cache_dir', type=str, default='',
+                        help='Directory to store timestamps extracted from trace data (disabled if empty)')
     parser.add_argument('-f', '--force', action='store_true', default=False,
                         help='Overwrite report directory')
     parser.add_argument('-v', '--verbose', action='store_true', default=False)
@@ -234,13 +218,18 @@ def main():
     _logger.debug(f'component_list_json: {args.component_list_json}')
     _logger.debug(f'start_strip: {args.start_strip}, end_strip: {args.end_strip}')
     _logger.debug(f'sim_time: {args.sim_time}')
+    _logger.debug(f'jobs: {args.jobs}')
+    _logger.debug(f'export_jobs: {args.export_jobs}')
+    GraphExporter.start(args.export_jobs)
+    _logger.debug(f'trace_cache_dir: {args.trace_cache_dir}')
 
     lttng = read_trace_data(args.trace_data[0], args.start_strip, args.end_strip, False)
     arch = Architecture('lttng', str(args.trace_data[0]))
     app = Application(arch, lttng)
+    trace_cache = load_trace_cache(args.trace_cache_dir, args.trace_data[0], args.start_strip, args.end_strip, app, _logger)
 
     dest_dir = args.dest_dir[0]
-    analyze(args, lttng, arch, app, dest_dir + '/analyze_topic')
+    analyze(args, lttng, arch, app, dest_dir + '/analyze_topic', trace_cache)
 
 
 if __name__ == '__main__':
@@ -22,6 +22,7 @@ import argparse
 import logging
 import statistics
 import yaml
+import numpy as np
 import pandas as pd
 from bokeh.plotting import figure
 from caret_analyze import Architecture, Application, Lttng
@@ -29,7 +30,7 @@ from caret_analyze.runtime.communication import Communication
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
 from common.utils import create_logger, make_destination_dir, read_trace_data, export_graph
 from common.utils import get_callback_legend, round_yaml
-from common.utils import ComponentManager
+from common.utils import ComponentManager, TraceCache, load_trace_cache
 
 # Suppress log for CARET
 from logging import getLogger, FATAL
@@ -41,32 +42,40 @@ _logger: logging.Logger = None
 
 def calc_frequency(timestamp_df: pd.DataFrame,
                    timestamp_name: str) -> tuple[list[float], list[int]]:
-    """Measure frequency per 1 second"""
-    timestamp_list: list[float] = []
-    frequency_list: list[int] = []
+    """Measure frequency per 1 second
 
+    A 1 second term starts at the first timestamp which is not in the previous term.
+    Each term is found by binary search, so the cost is O(number of terms * log(number of timestamps))
+    """
     timestamp_name = [s for s in timestamp_df.columns if timestamp_name in s][0]
-    timestamp_series = timestamp_df[timestamp_name]
-    timestamp_series = timestamp_series.sort_values()   # it seems time stamp is not sorted (?)
-
+    timestamp_series = timestamp_df[timestamp_name].dropna()
     if len(timestamp_series) < 2:
         return [], []
-    timestamp_series *= 1e-9    # from [nsec] to [sec]
-    timestamp_series -= timestamp_series[0]    # treat the first data as 0 [sec]
-
-    timestamp_start_1sec = timestamp_series[0]
-    timestamp_list.append(timestamp_start_1sec)
-    frequency_list.append(1)
 
-    for timestamp in timestamp_series:
-        if (timestamp - timestamp_start_1sec) < 1.0:
-            # keep incrementing frequency for the current 1 second term
-            frequency_list[-1] += 1
-        else:
-            # it reaches the next 1 second term
-            timestamp_start_1sec = timestamp
-            timestamp_list.append(timestamp_start_1sec)
-            frequency_list.append(1)
+    first_timestamp = timestamp_series.iloc[0] * 1e-9
+    timestamps = np.sort(timestamp_series.to_numpy() * 1e-9) - first_timestamp  # treat the first data as 0 [sec]
+    timestamp_num = len(timestamps)
+
+    def find_term_end(index_start: int, timestamp_start: float) -> int:
+        """Find the first index where (timestamp - timestamp_start) >= 1.0"""
+        index = int(np.searchsorted(timestamps, timestamp_start + 1.0, side='left'))
+        # adjust rounding error of (timestamp_start + 1.0)
+        while index > index_start and timestamps[index - 1] - timestamp_start >= 1.0:
+            index -= 1
+        while index < timestamp_num and timestamps[index] - timestamp_start < 1.0:
+            index += 1
+        return index
+
+    # the first term counts the first data twice (as the start and as the data) to keep the previous result
+    timestamp_list = [0.0]
+    index_end = find_term_end(0, 0.0)
+    frequency_list = [index_end + 1]
+    while index_end < timestamp_num:
+        index_start = index_end
+        timestamp_start = float(timestamps[index_start])
+        index_end = find_term_end(index_start + 1, timestamp_start)
+        timestamp_list.append(timestamp_start)
+        frequency_list.append(index_end - index_start)
 
     return timestamp_list, frequency_list
 
@@ -108,28 +117,31 @@ def match_pubsub_freq(pub_freq: tuple[list[float], list[int]],
     timestamp_list = []
     pub_freq_list = []
     sub_freq_list = []
-    index_to_start_check = 0
     maximum_gap_time = 1.0  # 1sec
+    sub_time_list = sub_freq[0]
+    sub_num = len(sub_time_list)
+    index_to_start_check = 0
+    index_sub = 0           # the first subscription after (or at) the current publication. it never goes back
+    is_last_matched = False
     for index_pub in range(len(pub_freq[0])):
         pub_time = pub_freq[0][index_pub]
-        matched_sub_index = -1
-        for index_sub in range(index_to_start_check, len(sub_freq[0])):
-            gap_time = sub_freq[0][index_sub] - pub_time
-            if gap_time < 0:
-                continue
-            gap_time_next = sub_freq[0][index_sub + 1] - pub_time if index_sub < len(sub_freq[0]) - 1 else -1
-            if gap_time_next < 0:
-                break    # ignore the last 1 sec because frequency may be calculated incorrectly
-            if gap_time < gap_time_next and gap_time < maximum_gap_time:
-                matched_sub_index = index_sub
-                break
-        if matched_sub_index != -1:
-            index_to_start_check = matched_sub_index + 1
+        index_sub = max(index_sub, index_to_start_check)
+        while index_sub < sub_num and sub_time_list[index_sub] - pub_time < 0:
+            index_sub += 1
+        if index_sub >= sub_num:
+            # no subscription after this publication
+            if is_last_matched:
+                _logger.warning('Corresponding subscription is not found')
+            continue
+        if index_sub < sub_num - 1 and sub_time_list[index_sub] - pub_time < maximum_gap_time:
+            index_to_start_check = index_sub + 1
             timestamp_list.append(pub_time)
             pub_freq_list.append(pub_freq[1][index_pub])
-            sub_freq_list.append(sub_freq[1][matched_sub_index])
-        elif gap_time_next > 0:
-            _logger.warning('Corresponding subscription is not found')
+            sub_freq_list.append(sub_freq[1][index_sub])
+            is_last_matched = True
+        else:
+            # the gap is too large, or it's the last 1 sec whose frequency may be calculated incorrectly
+            is_last_matched = False
 
     return timestamp_list, pub_freq_list, sub_freq_list
 
@@ -165,7 +177,19 @@ def create_stats(title,  graph_filename, topic_name, publisher_name,
     return stats
 
 
-def analyze_communication(args, dest_dir, app: Application, communication: Communication) -> tuple(dict, bool):
+def get_pubsub_df(communication: Communication, trace_cache: TraceCache = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Get timestamps of publication and subscription from trace cache if available"""
+    if trace_cache:
+        pub_timestamps = trace_cache.get_publisher(communication.publish_node_name, communication.topic_name)
+        sub_timestamps = trace_cache.get_subscription(communication.callback_subscription.callback_name)
+        if pub_timestamps is not None and sub_timestamps is not None:
+            return pd.DataFrame({'rclcpp_publish_timestamp': pub_timestamps}), \
+                   pd.DataFrame({'callback_start_timestamp': sub_timestamps})
+    return communication.publisher.to_dataframe(), communication.subscription.to_dataframe()
+
+
+def analyze_communication(args, dest_dir, app: Application, communication: Communication,
+                          trace_cache: TraceCache = None) -> tuple(dict, bool):
     """Analyze a subscription callback function"""
     title = f'{communication.topic_name} : {communication.publish_node_name} -> {communication.subscribe_node_name}'
     graph_filename = communication.topic_name.replace('/', '_')[1:] + communication.subscribe_node_name.replace('/', '_')
@@ -176,8 +200,7 @@ def analyze_communication(args, dest_dir, app: Application, communication: Commu
     _logger.debug(f'Processing {title}')
 
     try:
-        pub_df = communication.publisher.to_dataframe()
-        sub_df = communication.subscription.to_dataframe()
+        pub_df, sub_df = get_pubsub_df(communication, trace_cache)
         pub_freq = calc_pub_freq(pub_df)
         sub_freq = calc_sub_freq(sub_df)
     except:
@@ -216,7 +239,8 @@ def analyze_communication(args, dest_dir, app: Application, communication: Commu
         is_warning = True
     return stats, is_warning
 
-def analyze(args, lttng: Lttng, arch: Architecture, app: Application, dest_dir: str):
+def analyze(args, lttng: Lttng, arch: Architecture, app: Application, dest_dir: str,
+            trace_cache: TraceCache = None):
     """Analyze Subscription Callbacks"""
     global _logger
     if _logger is None:
@@ -242,7 +266,7 @@ def analyze(args, lttng: Lttng, arch: Architecture, app: Application, dest_dir:
         for communication in communication_list:
             if ComponentManager().check_if_ignore(communication.callback_subscription.callback_name):
                 continue
-            stats, is_warning = analyze_communication(args, dest_dir, app, communication)
+            stats, is_warning = analyze_communication(args, dest_dir, app, communication, trace_cache)
             if stats:
                 stats_all_list.append(stats)
             if is_warning:
@@ -278,6 +302,8 @@ def parse_arg():
                         help='Warning when callback_freq is less than "gap_threshold_ratio" * timer_period for "count_threshold" times')
     parser.add_argument('-n', '--count_threshold', type=int, default=10,
                         help='Warning when callback_freq is less than "gap_threshold_ratio" * timer_period for "count_threshold" times')
+    parser.add_argument('--trace_cache_dir', type=str, default='',
+                        help='Directory to store timestamps extracted from trace data (disabled if empty)')
     parser.add_argument('-v', '--verbose', action='store_true', default=False)
     parser.add_argument('-f', '--force', action='store_true', default=False,
                         help='Overwrite report directory')
@@ -297,13 +323,15 @@ def main():
     _logger.debug(f'start_strip: {args.start_strip}, end_strip: {args.end_strip}')
     _logger.debug(f'gap_threshold_ratio: {args.gap_threshold_ratio}')
     _logger.debug(f'count_threshold: {args.count_threshold}')
+    _logger.debug(f'trace_cache_dir: {args.trace_cache_dir}')
 
     lttng = read_trace_data(args.trace_data[0], args.start_strip, args.end_strip, False)
     arch = Architecture('lttng', str(args.trace_data[0]))
     app = Application(arch, lttng)
+    trace_cache = load_trace_cache(args.trace_cache_dir, args.trace_data[0], args.start_strip, args.end_strip, app, _logger)
 
     dest_dir = args.dest_dir[0]
-    analyze(args, lttng, arch, app, dest_dir + '/check_callback_sub')
+    analyze(args, lttng, arch, app, dest_dir + '/check_callback_sub', trace_cache)
 
 
 if __name__ == '__main__':
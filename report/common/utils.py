@@ -15,6 +15,7 @@
 Utility functions
 """
 from __future__ import annotations
+import atexit
 import datetime
 import os
 import sys
@@ -22,8 +23,12 @@ import shutil
 import logging
 import re
 import json
+import hashlib
+import heapq
 import itertools
 import multiprocessing
+import pickle
+import numpy as np
 import pandas as pd
 import subprocess
 import yaml
@@ -33,6 +38,14 @@ from caret_analyze.runtime.node import Node
 from bokeh.plotting import figure, save
 from bokeh.resources import CDN
 from bokeh.io import export_png, curdoc
+from bokeh.document import Document
+from bokeh.embed import json_item
+
+# libyaml is much faster for large files (e.g. architecture with many paths)
+try:
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
 
 
 def create_logger(name, level: int=logging.DEBUG, log_filename: str=None) -> logging.Logger:
@@ -70,11 +83,15 @@ def make_destination_dir(dest_dir: str, force: bool=False, logger: logging.Logge
 
 
 def read_trace_data(trace_data: str, start_strip: float, end_strip: float,
-                    force_conversion=False) -> Lttng:
-    """Read LTTng trace data"""
+                    force_conversion=False, store_events=False) -> Lttng:
+    """Read LTTng trace data
+
+    If store_events is True, events are kept in memory so that the trace can be re-windowed by rewindow_trace_data
+    """
+    kwargs = {'store_events': True} if store_events else {}
     return Lttng(trace_data, force_conversion=force_conversion, event_filters=[
         LttngEventFilter.strip_filter(start_strip, end_strip)
-    ])
+    ], **kwargs)
 
 
 def read_trace_data_duration(trace_data: str, start_point: float, duration: float,
@@ -92,6 +109,364 @@ def read_trace_data_duration(trace_data: str, start_point: float, duration: floa
         return Lttng(trace_data, force_conversion=force_conversion)
 
 
+def extract_timestamps(records_df: pd.DataFrame, column_names: list[str]) -> list[np.ndarray]:
+    """Extract timestamp columns [ns] as int64 arrays
+
+    Rows whose first column is missing are dropped, and other missing values are filled with TraceCache.MISSING
+    """
+    column_list = []
+    for column_name in column_names:
+        found_columns = [column for column in records_df.columns if column_name in column]
+        column_list.append(records_df[found_columns[0]] if len(found_columns) > 0 else None)
+    if column_list[0] is None:
+        return [np.empty(0, dtype=np.int64) for _ in column_names]
+    valid = column_list[0].notna()
+    value_list = []
+    for column in column_list:
+        if column is None:
+            value_list.append(np.full(int(valid.sum()), TraceCache.MISSING, dtype=np.int64))
+        else:
+            value_list.append(column[valid].fillna(TraceCache.MISSING).to_numpy(dtype=np.int64))
+    return value_list
+
+
+class TraceCache:
+    """Columnar cache of timestamps extracted from trace data
+
+    Timestamps of each group (callback, publisher, subscription, communication, path) are stored as flat int64 arrays
+    with offsets per key, so that a cache saved once can be memory-mapped by every report stage.
+    Missing timestamps (e.g. callback_end of a callback interrupted at the end of trace) are stored as -1.
+    The cache saves extracting records from CARET again. Trace data is still read,
+    because Application (and path analysis) needs it.
+    """
+    SCHEMA_VERSION = 2
+    MISSING = -1
+    GROUP_COLUMNS = {
+        'callback': ['callback_start_timestamp', 'callback_end_timestamp'],
+        'publisher': ['rclcpp_publish_timestamp'],
+        'subscription': ['callback_start_timestamp'],
+        'communication': ['rclcpp_publish_timestamp', 'callback_start_timestamp'],
+        'path': ['start_timestamp', 'response_time'],     # response time [ns] of each case (best/worst/all)
+    }
+
+    def __init__(self):
+        self.key_dict: dict[str, dict[str, int]] = {group: {} for group in self.GROUP_COLUMNS}
+        self.offsets: dict[str, np.ndarray] = {}
+        self.columns: dict[str, dict[str, np.ndarray]] = {}
+        for group in self.GROUP_COLUMNS:
+            self.set_group(group, {})
+
+    @staticmethod
+    def make_key(trace_data: str | list[str], start_strip: float, end_strip: float, chunk_duration: float=0) -> str:
+        """Make cache key from trace path, trace mtime, strip window and chunk duration"""
+        trace_data_list = trace_data if isinstance(trace_data, list) else [trace_data]
+        key_src = [TraceCache.SCHEMA_VERSION, float(start_strip), float(end_strip), float(chunk_duration)]
+        for trace_path in trace_data_list:
+            trace_path = os.path.abspath(trace_path)
+            mtime = os.path.getmtime(trace_path)
+            for root, _, files in os.walk(trace_path):
+                for file in files:
+                    mtime = max(mtime, os.path.getmtime(os.path.join(root, file)))
+            key_src += [trace_path, mtime]
+        return hashlib.sha1(json.dumps(key_src).encode()).hexdigest()
+
+    @staticmethod
+    def from_app(app: Application, logger: logging.Logger = None) -> TraceCache:
+        """Create cache by extracting timestamps from application (paths are not included. see set_group)"""
+        target_dict = {
+            'callback': [(callback.callback_name, callback) for callback in app.callbacks],
+            'publisher': [(TraceCache._make_name(publisher.node_name, publisher.topic_name), publisher)
+                          for publisher in app.publishers],
+            'subscription': [(subscription.callback_name, subscription) for subscription in app.subscriptions],
+            'communication': [(TraceCache._make_name(comm.topic_name, comm.publish_node_name, comm.subscribe_node_name), comm)
+                              for comm in app.communications],
+        }
+        trace_cache = TraceCache()
+        for group, target_list in target_dict.items():
+            column_names = TraceCache.GROUP_COLUMNS[group]
+            values_dict = {}
+            for name, target in target_list:
+                if name in values_dict:
+                    continue
+                try:
+                    records_df = target.to_dataframe()
+                    values_dict[name] = extract_timestamps(records_df, column_names)
+                except:
+                    if logger:
+                        logger.debug(f'No data in trace cache: {name}')
+                    values_dict[name] = [np.empty(0, dtype=np.int64) for _ in column_names]
+            trace_cache.set_group(group, values_dict)
+        return trace_cache
+
+    def set_group(self, group: str, values_dict: dict[str, list[np.ndarray]]):
+        """Set timestamps of all keys in a group. values_dict: pairs of key and arrays in the order of GROUP_COLUMNS"""
+        column_names = self.GROUP_COLUMNS[group]
+        column_values = {column_name: [] for column_name in column_names}
+        offsets = [0]
+        self.key_dict[group] = {}
+        for name, values in values_dict.items():
+            self.key_dict[group][name] = len(offsets) - 1
+            for column_name, value in zip(column_names, values):
+                column_values[column_name].append(np.asarray(value, dtype=np.int64))
+            offsets.append(offsets[-1] + len(values[0]))
+        self.offsets[group] = np.array(offsets, dtype=np.int64)
+        self.columns[group] = {
+            column_name: np.concatenate(value_list) if value_list else np.empty(0, dtype=np.int64)
+            for column_name, value_list in column_values.items()}
+
+    def save(self, cache_path: str):
+        """Save cache as npy files and an index file"""
+        tmp_cache_path = f'{cache_path}.tmp{os.getpid()}'
+        make_destination_dir(tmp_cache_path, True)
+        for group, column_dict in self.columns.items():
+            np.save(f'{tmp_cache_path}/{group}_offsets.npy', self.offsets[group])
+            for column_name, value in column_dict.items():
+                np.save(f'{tmp_cache_path}/{group}_{column_name}.npy', value)
+        index = {'schema_version': self.SCHEMA_VERSION, 'key_dict': self.key_dict}
+        with open(f'{tmp_cache_path}/index.yaml', 'w', encoding='utf-8') as f_yaml:
+            yaml.safe_dump(index, f_yaml, encoding='utf-8', allow_unicode=True, sort_keys=False)
+        if os.path.isdir(cache_path):
+            shutil.rmtree(cache_path)
+        os.replace(tmp_cache_path, cache_path)
+
+    @staticmethod
+    def load(cache_path: str) -> TraceCache | None:
+        """Load cache. Arrays are memory-mapped"""
+        try:
+            with open(f'{cache_path}/index.yaml', 'r', encoding='utf-8') as f_yaml:
+                index = yaml.safe_load(f_yaml)
+            if index['schema_version'] != TraceCache.SCHEMA_VERSION:
+                return None
+            trace_cache = TraceCache()
+            trace_cache.key_dict = index['key_dict']
+            for group, column_names in TraceCache.GROUP_COLUMNS.items():
+                trace_cache.offsets[group] = np.load(f'{cache_path}/{group}_offsets.npy', mmap_mode='r')
+                trace_cache.columns[group] = {
+                    column_name: np.load(f'{cache_path}/{group}_{column_name}.npy', mmap_mode='r')
+                    for column_name in column_names}
+        except:
+            return None
+        return trace_cache
+
+    @staticmethod
+    def _make_name(*names: str) -> str:
+        return '|'.join(names)
+
+    def _get(self, group: str, name: str) -> list[np.ndarray] | None:
+        if name not in self.key_dict[group]:
+            return None
+        index = self.key_dict[group][name]
+        begin, end = int(self.offsets[group][index]), int(self.offsets[group][index + 1])
+        return [self.columns[group][column_name][begin:end] for column_name in self.GROUP_COLUMNS[group]]
+
+    def get_callback(self, callback_name: str) -> tuple[np.ndarray, np.ndarray] | None:
+        """Get callback_start and callback_end timestamps [ns] of a callback"""
+        values = self._get('callback', callback_name)
+        return (values[0], values[1]) if values is not None else None
+
+    def get_publisher(self, node_name: str, topic_name: str) -> np.ndarray | None:
+        """Get rclcpp_publish timestamps [ns] of a publisher"""
+        values = self._get('publisher', self._make_name(node_name, topic_name))
+        return values[0] if values is not None else None
+
+    def get_subscription(self, callback_name: str) -> np.ndarray | None:
+        """Get callback_start timestamps [ns] of a subscription"""
+        values = self._get('subscription', callback_name)
+        return values[0] if values is not None else None
+
+    def get_communication(self, topic_name: str, publish_node_name: str, subscribe_node_name: str) -> tuple[np.ndarray, np.ndarray] | None:
+        """Get rclcpp_publish and callback_start timestamps [ns] of a communication"""
+        values = self._get('communication', self._make_name(topic_name, publish_node_name, subscribe_node_name))
+        return (values[0], values[1]) if values is not None else None
+
+    @staticmethod
+    def make_path_name(path_name: str, case: str) -> str:
+        """Make key of path group"""
+        return TraceCache._make_name(path_name, case)
+
+    def get_path(self, path_name: str, case: str) -> tuple[np.ndarray, np.ndarray] | None:
+        """Get start timestamps [ns] and response time [ns] of a path"""
+        values = self._get('path', self.make_path_name(path_name, case))
+        return (values[0], values[1]) if values is not None else None
+
+
+def _save_trace_cache(trace_cache: TraceCache, cache_path: str, logger: logging.Logger = None):
+    try:
+        trace_cache.save(cache_path)
+        if logger:
+            logger.info(f'Trace cache is created: {cache_path}')
+    except:
+        if logger:
+            logger.warning(f'Unable to save trace cache: {cache_path}')
+
+
+def load_trace_cache(trace_cache_dir: str, trace_data: str | list[str], start_strip: float, end_strip: float,
+                     app: Application = None, logger: logging.Logger = None) -> TraceCache | None:
+    """Load trace cache if exists, otherwise create it from application (if given)
+
+    Records are not extracted from application on a cache hit, but the application (and trace data) is still needed by the caller
+    """
+    if not trace_cache_dir:
+        return None
+    cache_path = f'{trace_cache_dir}/{TraceCache.make_key(trace_data, start_strip, end_strip)}'
+    trace_cache = TraceCache.load(cache_path)
+    if trace_cache:
+        if logger:
+            logger.info(f'Trace cache is loaded: {cache_path}')
+        return trace_cache
+    if app is None:
+        return None
+    trace_cache = TraceCache.from_app(app, logger)
+    _save_trace_cache(trace_cache, cache_path, logger)
+    return trace_cache
+
+
+def read_trace_data_window(trace_data: str | list[str], start_strip: float, end_strip: float, chunk_duration: float=0,
+                           force_conversion=False, store_events=False) -> Lttng:
+    """Read trace data after strip, or only the first window of chunk_duration [sec] if chunk_duration > 0"""
+    if chunk_duration > 0:
+        return read_trace_data_duration(trace_data, start_strip, chunk_duration, force_conversion)
+    return read_trace_data(trace_data, start_strip, end_strip, force_conversion, store_events)
+
+
+def rewindow_trace_data(lttng: Lttng, trace_data: str | list[str], start_strip: float, end_strip: float,
+                        chunk_duration: float=0, logger: logging.Logger = None, store_events=False) -> Lttng:
+    """Apply new strip to loaded trace data
+
+    Events stored in memory (see read_trace_data) are filtered again, so trace files are not parsed twice.
+    Events are kept stored in the new trace data only if store_events (e.g. for TraceEventIndex),
+    so that the stored events are freed with the old trace data otherwise.
+    Trace data is read again if events are not stored
+    """
+    if chunk_duration <= 0:
+        events = get_stored_events(lttng)
+        if events:
+            kwargs = {'store_events': True} if store_events else {}
+            return Lttng(events, event_filters=[LttngEventFilter.strip_filter(start_strip, end_strip)], **kwargs)
+        if logger:
+            logger.warning('Events are not stored in memory. Read trace data again to apply new strip')
+    return read_trace_data_window(trace_data, start_strip, end_strip, chunk_duration, store_events=store_events)
+
+
+def get_stored_events(lttng: Lttng) -> list[dict] | None:
+    """Events stored in memory (see read_trace_data). None if not stored"""
+    try:
+        return lttng.events
+    except (AttributeError, AssertionError):
+        # events are not stored (or not supported by this version of CARET)
+        return None
+
+
+class TraceEventIndex:
+    """Index of events stored in memory to create trace data of a time window
+
+    Runtime events are sorted by timestamp once, and a window is sliced by binary search,
+    so the cost of a window depends on the window size rather than the trace length.
+    The other events (e.g. initialization of nodes and callbacks, which are needed to build Application)
+    are put in every window. Unknown events are treated as the other events so that they are never lost
+    """
+    RUNTIME_EVENT_NAMES = {
+        'ros2:callback_start', 'ros2:callback_end',
+        'ros2:rclcpp_publish', 'ros2:rclcpp_intra_publish', 'ros2:rcl_publish', 'ros2:rmw_publish',
+        'ros2_caret:dds_write', 'ros2_caret:dds_bind_addr_to_stamp', 'ros2_caret:dds_bind_addr_to_addr',
+        'ros2:message_construct', 'ros2_caret:on_data_available',
+        'ros2:dispatch_subscription_callback', 'ros2:dispatch_intra_process_subscription_callback',
+        'ros2:rclcpp_ring_buffer_enqueue', 'ros2:rclcpp_ring_buffer_dequeue',
+        'ros2_caret:rclcpp_ring_buffer_enqueue', 'ros2_caret:rclcpp_ring_buffer_dequeue',
+        'ros2:rmw_take', 'ros2:rcl_take', 'ros2:rclcpp_take', 'ros2_caret:sim_time',
+    }
+
+    def __init__(self, events: list[dict]):
+        runtime_event_list = []
+        self.other_event_list = []
+        for event in events:
+            if event['_name'] in self.RUNTIME_EVENT_NAMES:
+                runtime_event_list.append(event)
+            else:
+                self.other_event_list.append(event)
+        timestamps = np.array([event['_timestamp'] for event in runtime_event_list], dtype=np.int64)
+        if np.any(timestamps[1:] < timestamps[:-1]):
+            order = np.argsort(timestamps, kind='stable')
+            runtime_event_list = [runtime_event_list[i] for i in order]
+            timestamps = timestamps[order]
+        self.runtime_event_list = runtime_event_list
+        self.timestamps = timestamps
+
+    @staticmethod
+    def from_lttng(lttng: Lttng) -> TraceEventIndex | None:
+        """Create index of events stored in lttng. None if events are not stored"""
+        events = get_stored_events(lttng) if lttng is not None else None
+        return TraceEventIndex(events) if events else None
+
+    def window(self, start_timestamp: int, end_timestamp: int, logger: logging.Logger = None) -> Lttng | None:
+        """Create trace data which has only runtime events in [start_timestamp, end_timestamp] [ns]. None if no events are in the window"""
+        begin_index = int(np.searchsorted(self.timestamps, start_timestamp, side='left'))
+        end_index = int(np.searchsorted(self.timestamps, end_timestamp, side='right'))
+        if begin_index >= end_index:
+            if logger:
+                logger.debug('No runtime events in trace data window')
+            return None
+        event_list = list(heapq.merge(self.other_event_list, self.runtime_event_list[begin_index:end_index],
+                                      key=lambda event: event['_timestamp']))
+        try:
+            return Lttng(event_list)
+        except Exception as e:
+            if logger:
+                logger.warning(f'Unable to create trace data window: {e}')
+            return None
+
+
+ARCHITECTURE_CACHE_SCHEMA_VERSION = 1
+
+
+def _make_architecture_cache_header(architecture_file_path: str) -> dict:
+    try:
+        from importlib.metadata import version
+        caret_version = version('caret_analyze')
+    except:
+        caret_version = ''
+    with open(architecture_file_path, 'rb') as f_yaml:
+        yaml_hash = hashlib.sha1(f_yaml.read()).hexdigest()
+    return {
+        'schema_version': ARCHITECTURE_CACHE_SCHEMA_VERSION,
+        'caret_version': caret_version,
+        'yaml_hash': yaml_hash,
+    }
+
+
+def load_architecture(architecture_file_path: str, logger: logging.Logger = None) -> Architecture:
+    """Load architecture from yaml file
+
+    Loaded architecture is pickled into a sidecar file (architecture_file_path + '.pickle'),
+    and it's loaded instead of the yaml file next time if the yaml file and CARET version are not changed
+    """
+    cache_path = architecture_file_path + '.pickle'
+    header = _make_architecture_cache_header(architecture_file_path)
+    try:
+        with open(cache_path, 'rb') as f_cache:
+            if pickle.load(f_cache) == header:
+                arch = pickle.load(f_cache)
+                if logger:
+                    logger.debug(f'Architecture is loaded from cache: {cache_path}')
+                return arch
+    except:
+        pass
+
+    arch = Architecture('yaml', architecture_file_path)
+    tmp_cache_path = f'{cache_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_cache_path, 'wb') as f_cache:
+            pickle.dump(header, f_cache, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(arch, f_cache, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_cache_path, cache_path)
+    except:
+        if logger:
+            logger.warning(f'Unable to save architecture cache: {cache_path}')
+        if os.path.exists(tmp_cache_path):
+            os.remove(tmp_cache_path)
+    return arch
+
+
 def create_architecture_from_lttng(func_add_path_to_architecture, args, trace_data):
     def _create_architecture_from_lttng(func_add_path_to_architecture, args, trace_data):
         # Note: Unable to use add_path_to_architecture() directly here to avoid circular import
@@ -104,6 +479,55 @@ def create_architecture_from_lttng(func_add_path_to_architecture, args, trace_da
     proc.join()
 
 
+_forked_task: tuple = None
+
+
+def _run_forked_task(index: int):
+    func, args_list = _forked_task
+    return func(*args_list[index])
+
+
+def run_in_parallel(func, args_list: list[tuple], jobs: int=1, cost_list: list[float]=None) -> list:
+    """Run func for each args, in forked worker processes if jobs > 1
+
+    Arguments are not pickled but inherited by fork, so objects loaded in the parent process
+    (e.g. Lttng, Application) are shared copy-on-write. Return values must be picklable.
+    Tasks with larger cost (expected processing time) are started first if cost_list is given.
+    Results are returned in the same order as args_list.
+    """
+    global _forked_task
+    if jobs <= 1 or len(args_list) <= 1 or multiprocessing.current_process().daemon:
+        return [func(*args) for args in args_list]
+    index_list = list(range(len(args_list)))
+    if cost_list is not None:
+        index_list.sort(key=lambda index: cost_list[index], reverse=True)
+    _forked_task = (func, args_list)
+    try:
+        with multiprocessing.get_context('fork').Pool(processes=min(jobs, len(args_list))) as pool:
+            result_list = pool.map(_run_forked_task, index_list, chunksize=1)
+        return [result for _, result in sorted(zip(index_list, result_list), key=lambda item: item[0])]
+    finally:
+        _forked_task = None
+
+
+def iterate_in_parallel(func, args_list: list[tuple], jobs: int=1):
+    """Run func for each args, in forked worker processes if jobs > 1, and yield results in the same order as args_list
+
+    Arguments are inherited by fork as run_in_parallel. Results can be consumed (e.g. merged) while the following tasks run
+    """
+    global _forked_task
+    if jobs <= 1 or len(args_list) <= 1 or multiprocessing.current_process().daemon:
+        for args in args_list:
+            yield func(*args)
+        return
+    _forked_task = (func, args_list)
+    try:
+        with multiprocessing.get_context('fork').Pool(processes=min(jobs, len(args_list))) as pool:
+            yield from pool.imap(_run_forked_task, range(len(args_list)), chunksize=1)
+    finally:
+        _forked_task = None
+
+
 def get_callback_legend(node: Node, callback_name: str, with_trigger: bool=True) -> str:
     callback_legend_dict = {}
     cnt_timer = 0
@@ -131,20 +555,129 @@ def get_callback_legend(node: Node, callback_name: str, with_trigger: bool=True)
     return callback_legend
 
 
-def export_graph(figure: figure, dest_dir: str, filename: str, title='graph',
-                 with_png=True, logger: logging.Logger = None) -> None:
-    """Export graph as html and image"""
+class FigureSpec:
+    """Data and styling to create a figure, so that the figure can be created in a worker process
+
+    create_func must be a module level function (picklable), and args must be picklable (e.g. numpy arrays)
+    """
+    def __init__(self, create_func, *args, **kwargs):
+        self.create_func = create_func
+        self.args = args
+        self.kwargs = kwargs
+
+    def create(self) -> figure:
+        return self.create_func(*self.args, **self.kwargs)
+
+
+class GraphExporter:
+    """Queue to export graphs in background worker processes while analysis continues
+
+    FigureSpec is sent to the worker process as it is. Other figures (e.g. created by CARET)
+    are serialized with bokeh.embed.json_item in the caller process, then restored in the worker process
+    """
+    MAX_PENDING_PER_PROCESS = 8
+    _pool = None
+    _process_num = 0
+    _owner_pid = None
+    _pending_list: list = []
+
+    @classmethod
+    def start(cls, process_num: int) -> None:
+        """Start worker processes. Graphs are exported synchronously if process_num <= 0"""
+        if process_num <= 0 or cls.is_active():
+            return
+        cls._pool = multiprocessing.get_context('fork').Pool(processes=process_num)
+        cls._process_num = process_num
+        cls._owner_pid = os.getpid()
+        cls._pending_list = []
+        atexit.register(cls.stop)
+
+    @classmethod
+    def is_active(cls) -> bool:
+        # Forked child processes (e.g. run_in_parallel) cannot use the parent's pool
+        return cls._pool is not None and cls._owner_pid == os.getpid()
+
+    @classmethod
+    def submit(cls, figure: figure | FigureSpec, dest_dir: str, filename: str, title: str,
+               with_png: bool, logger: logging.Logger = None) -> None:
+        if isinstance(figure, FigureSpec):
+            func, graph = _export_graph_spec, figure
+        else:
+            func, graph = _export_graph_json, json.dumps(json_item(figure)['doc'])
+        max_pending = cls._process_num * cls.MAX_PENDING_PER_PROCESS
+        while len(cls._pending_list) >= max_pending:
+            cls._wait(*cls._pending_list.pop(0))
+        result = cls._pool.apply_async(func, (graph, dest_dir, filename, title, with_png))
+        cls._pending_list.append((result, logger))
+
+    @classmethod
+    def flush(cls) -> None:
+        """Wait until all the submitted graphs are exported"""
+        if not cls.is_active():
+            return
+        while len(cls._pending_list) > 0:
+            cls._wait(*cls._pending_list.pop(0))
+
+    @classmethod
+    def stop(cls) -> None:
+        if not cls.is_active():
+            return
+        cls.flush()
+        cls._pool.close()
+        cls._pool.join()
+        cls._pool = None
+
+    @staticmethod
+    def _wait(result, logger: logging.Logger):
+        is_png_exported = result.get()
+        if not is_png_exported and logger:
+            logger.warning('Unable to export png')
+
+
+def _export_graph_spec(figure_spec: FigureSpec, dest_dir: str, filename: str, title: str, with_png: bool) -> bool:
+    return _export_graph(figure_spec.create(), dest_dir, filename, title, with_png)
+
+
+def _export_graph_json(doc_json: str, dest_dir: str, filename: str, title: str, with_png: bool) -> bool:
+    doc = Document.from_json(json.loads(doc_json))
+    figure = doc.roots[0]
+    doc.remove_root(figure)
+    return _export_graph(figure, dest_dir, filename, title, with_png)
+
+
+def _export_graph(figure: figure, dest_dir: str, filename: str, title: str, with_png: bool) -> bool:
     save(figure, filename=f'{dest_dir}/{filename}.html', title=title, resources=CDN)
     try:
         if with_png:
             export_png(figure, filename=f'{dest_dir}/{filename}.png')
+        return True
     except:
-        if logger:
-            logger.warning('Unable to export png')
+        return False
     finally:
         curdoc().clear()
 
 
+def export_graph(figure: figure | FigureSpec, dest_dir: str, filename: str, title='graph',
+                 with_png=True, logger: logging.Logger = None) -> None:
+    """Export graph as html and image
+
+    The graph is queued to GraphExporter if it's started. Call flush_graph() to wait for the export
+    """
+    if GraphExporter.is_active():
+        GraphExporter.submit(figure, dest_dir, filename, title, with_png, logger)
+        curdoc().clear()
+        return
+    if isinstance(figure, FigureSpec):
+        figure = figure.create()
+    if not _export_graph(figure, dest_dir, filename, title, with_png) and logger:
+        logger.warning('Unable to export png')
+
+
+def flush_graph() -> None:
+    """Wait until all the queued graphs are exported"""
+    GraphExporter.flush()
+
+
 def trail_df(df: pd.DataFrame, trail_val=0, start_strip_num=0, end_strip_num=0) -> pd.DataFrame:
     df = df.dropna()
     cnt_trail = start_strip_num
@@ -168,6 +701,18 @@ def trail_df(df: pd.DataFrame, trail_val=0, start_strip_num=0, end_strip_num=0)
     return df
 
 
+def load_yaml(filename: str):
+    """Load yaml file (using libyaml if available)"""
+    with open(filename, 'r', encoding='utf-8') as f_yaml:
+        return yaml.load(f_yaml, Loader=YamlLoader)
+
+
+def dump_yaml(obj, filename: str):
+    """Dump object into yaml file (using libyaml if available)"""
+    with open(filename, 'w', encoding='utf-8') as f_yaml:
+        yaml.dump(obj, f_yaml, Dumper=YamlDumper, encoding='utf-8', allow_unicode=True, sort_keys=False)
+
+
 def round_yaml(filename):
     '''Round float value in yaml file'''
     with open(filename, 'r', encoding='utf-8') as f_yaml:
@@ -186,6 +731,44 @@ def round_yaml(filename):
         f_yaml.write(new_yaml)
 
 
+class PatternMatcher:
+    """Match names against regular expressions (re.search)
+
+    Patterns are compiled once (and combined into one alternation to check if any pattern matches),
+    and results are memoized per name
+    """
+    def __init__(self, pattern_list: list[str]):
+        self.pattern_list = list(pattern_list)
+        self._regexp_list = [re.compile(pattern) for pattern in self.pattern_list]
+        self._any_regexp = None
+        if self._regexp_list and all(regexp.groups == 0 for regexp in self._regexp_list):
+            try:
+                self._any_regexp = re.compile('|'.join(f'(?:{pattern})' for pattern in self.pattern_list))
+            except re.error:
+                pass    # e.g. global flags in the middle of the combined pattern
+        self._index_cache: dict[str, int] = {}
+        self._any_cache: dict[str, bool] = {}
+
+    def find(self, name: str) -> int:
+        """Index of the first pattern in the list which matches name (-1 if none)"""
+        index = self._index_cache.get(name)
+        if index is None:
+            index = next((i for i, regexp in enumerate(self._regexp_list) if regexp.search(name)), -1)
+            self._index_cache[name] = index
+        return index
+
+    def match_any(self, name: str) -> bool:
+        """Check if any pattern matches name"""
+        is_match = self._any_cache.get(name)
+        if is_match is None:
+            if self._any_regexp is not None:
+                is_match = bool(self._any_regexp.search(name))
+            else:
+                is_match = self.find(name) >= 0
+            self._any_cache[name] = is_match
+        return is_match
+
+
 class ComponentManager:
     def __new__(cls, *args, **kargs):
         if not hasattr(cls, "_instance"):
@@ -194,6 +777,7 @@ class ComponentManager:
             cls.external_in_topic_list = []
             cls.external_out_topic_list = []
             cls.ignore_list = []
+            cls._instance._compile()
         return cls._instance
 
     def initialize(self, component_list_json_path: str, logger: logging.Logger = None):
@@ -222,6 +806,7 @@ class ComponentManager:
                 self.external_out_topic_list = component_list_json['external_out_topic_list']
             if 'ignore_list' in component_list_json:
                 self.ignore_list = component_list_json['ignore_list']
+        self._compile()
 
         if logger:
             logger.debug(f'component_dict = {self.component_dict}')
@@ -229,27 +814,47 @@ class ComponentManager:
             logger.debug(f'external_out_topic_list = {self.external_out_topic_list}')
             logger.debug(f'ignore_list = {self.ignore_list}')
 
+    def _compile(self):
+        """Compile patterns. Memoized results are kept if patterns are not changed (e.g. initialized by each stage)"""
+        config = json.dumps([self.component_dict, self.external_in_topic_list, self.external_out_topic_list, self.ignore_list])
+        if getattr(self, '_config', None) == config:
+            return
+        self._config = config
+        self._component_name_list = list(self.component_dict.keys())
+        self._component_matcher = PatternMatcher(list(self.component_dict.values()))
+        self._ignore_matcher = PatternMatcher(self.ignore_list)
+        self._external_topic_list = {
+            'in': [(re.compile(topic_regexp), re.compile(node_regexp) if node_regexp != '' else None)
+                   for topic_regexp, node_regexp in self.external_in_topic_list],
+            'out': [(re.compile(topic_regexp), re.compile(node_regexp) if node_regexp != '' else None)
+                    for topic_regexp, node_regexp in self.external_out_topic_list],
+        }
+        self._external_cache: dict[tuple[str, str, str], bool] = {}
+        self._comm_component_pair_cache: dict[tuple[str, str, str], tuple[str, str]] = {}
+
     def get_component_name(self, node_name: str) -> str:
-        for component_name, regexp in self.component_dict.items():
-            if re.search(regexp, node_name):
-                return component_name
-        return 'other'
+        index = self._component_matcher.find(node_name)
+        return self._component_name_list[index] if index >= 0 else 'other'
+
+    def _check_if_external(self, direction: str, topic_name: str, node_name: str) -> bool:
+        key = (direction, topic_name, node_name)
+        is_external = self._external_cache.get(key)
+        if is_external is None:
+            is_external = False
+            for topic_regexp, node_regexp in self._external_topic_list[direction]:
+                if topic_regexp.search(topic_name):
+                    if (node_name != '') and (node_regexp is not None) and (not node_regexp.search(node_name)):
+                        continue
+                    is_external = True
+                    break
+            self._external_cache[key] = is_external
+        return is_external
 
     def check_if_external_in_topic(self, topic_name: str, sub_node_name: str='') -> bool:
-        for topic_regexp, node_regexp in self.external_in_topic_list:
-            if re.search(topic_regexp, topic_name):
-                if (sub_node_name != '') and (node_regexp != '') and (not re.search(node_regexp, sub_node_name)):
-                    continue
-                return True
-        return False
+        return self._check_if_external('in', topic_name, sub_node_name)
 
     def check_if_external_out_topic(self, topic_name: str, pub_node_name: str='') -> bool:
-        for topic_regexp, node_regexp in self.external_out_topic_list:
-            if re.search(topic_regexp, topic_name):
-                if (pub_node_name != '') and (node_regexp != '') and (not re.search(node_regexp, pub_node_name)):
-                    continue
-                return True
-        return False
+        return self._check_if_external('out', topic_name, pub_node_name)
 
     def get_component_pair_list(self, with_external: bool=False) -> list[str, str]:
         component_name_list = list(self.component_dict.keys())
@@ -261,10 +866,7 @@ class ComponentManager:
         return component_pair_list
 
     def check_if_ignore(self, node_name: str) -> bool:
-        for ignore in self.ignore_list:
-            if re.search(ignore, node_name):
-                return True
-        return False
+        return self._ignore_matcher.match_any(node_name)
 
     def check_if_target(self, component_name: str, node_name: str) -> bool:
         if node_name is None:
@@ -275,6 +877,32 @@ class ComponentManager:
             return True
         return False
 
+    def get_comm_component_pair(self, topic_name: str, publish_node_name: str, subscribe_node_name: str) -> tuple[str, str] | None:
+        """Get component pair (publish, subscribe) of communication considering external topics. None if ignored"""
+        key = (topic_name, publish_node_name, subscribe_node_name)
+        if key not in self._comm_component_pair_cache:
+            component_pair = None
+            if not (self.check_if_ignore(publish_node_name) or self.check_if_ignore(subscribe_node_name)
+                    or self.check_if_ignore(topic_name)):
+                publish_component_name = self.get_component_name(publish_node_name)
+                subscribe_component_name = self.get_component_name(subscribe_node_name)
+                if self.check_if_external_in_topic(topic_name, subscribe_node_name):
+                    publish_component_name = 'external'
+                elif self.check_if_external_out_topic(topic_name, publish_node_name):
+                    subscribe_component_name = 'external'
+                component_pair = (publish_component_name, subscribe_component_name)
+            self._comm_component_pair_cache[key] = component_pair
+        return self._comm_component_pair_cache[key]
+
+    def partition(self, name_list: list[str]) -> dict[str, list[str]]:
+        """Partition names (e.g. node names, topic names) into components. Ignored names and names of no component go to 'other'"""
+        partition_dict: dict[str, list[str]] = {}
+        for name in name_list:
+            is_target = name is not None and not self.check_if_ignore(name)
+            component_name = self.get_component_name(name) if is_target else 'other'
+            partition_dict.setdefault(component_name, []).append(name)
+        return partition_dict
+
 
 def read_note_text(trace_data_dir, dest_dir, note_text_top_path, note_text_bottom_path) -> tuple[str, str]:
     note_text_top = ''
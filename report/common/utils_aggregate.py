@@ -0,0 +1,613 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Mergeable aggregates of time windows of trace data (chunked mode)
+"""
+from __future__ import annotations
+import gc
+import math
+import os
+import logging
+import pickle
+import numpy as np
+import pandas as pd
+from caret_analyze import Application, Lttng
+from caret_analyze.runtime.callback import CallbackBase, CallbackType
+from caret_analyze.runtime.communication import Communication
+from common.utils import TraceCache, extract_timestamps, read_trace_data_duration, iterate_in_parallel
+from common.utils_metrics import CallbackMetrics, CommunicationMetrics, calc_period, calc_latency, FREQUENCY_INTERVAL_NS
+from common.utils_plot import downsample_minmax
+from common.utils_stats import StatsSketch
+
+CHUNK_MARGIN = 5.0            # [sec] trace data is read until this margin after each window for records across the window end
+CHUNK_ROUNDING_MARGIN = 0.001 # [sec] trace data is read from a little before each window for rounding error of the window start
+
+
+class FrequencyBins:
+    """The number of events in each interval from the base timestamp, and the first/last event timestamps [ns]"""
+    def __init__(self, first_index: int=0, counts: np.ndarray=None, first_timestamp: int=-1, last_timestamp: int=-1):
+        self.first_index = first_index
+        self.counts = counts if counts is not None else np.empty(0, dtype=np.int64)
+        self.first_timestamp = first_timestamp
+        self.last_timestamp = last_timestamp
+
+    @staticmethod
+    def from_timestamps(timestamps: np.ndarray, base_timestamp: int, interval_ns: int=FREQUENCY_INTERVAL_NS) -> FrequencyBins:
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if len(timestamps) == 0:
+            return FrequencyBins()
+        interval_index = (timestamps - base_timestamp) // interval_ns
+        first_index = int(interval_index.min())
+        counts = np.bincount(interval_index - first_index).astype(np.int64)
+        return FrequencyBins(first_index, counts, int(timestamps.min()), int(timestamps.max()))
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    @property
+    def last_index(self) -> int:
+        return self.first_index + len(self.counts) - 1
+
+    def merge(self, other: FrequencyBins) -> None:
+        """Merge other bins (of any time window) into these bins"""
+        if len(other.counts) == 0:
+            return
+        if len(self.counts) == 0:
+            self.first_index, self.counts = other.first_index, other.counts.copy()
+            self.first_timestamp, self.last_timestamp = other.first_timestamp, other.last_timestamp
+            return
+        first_index = min(self.first_index, other.first_index)
+        counts = np.zeros(max(self.last_index, other.last_index) - first_index + 1, dtype=np.int64)
+        for bins in [self, other]:
+            counts[bins.first_index - first_index:bins.last_index - first_index + 1] += bins.counts
+        self.first_index, self.counts = first_index, counts
+        self.first_timestamp = min(self.first_timestamp, other.first_timestamp)
+        self.last_timestamp = max(self.last_timestamp, other.last_timestamp)
+
+
+def _calc_runs(mask: np.ndarray) -> tuple[int, int, int, int]:
+    """The number of True, the leading run, the trailing run and the longest run of True"""
+    if len(mask) == 0:
+        return 0, 0, 0, 0
+    false_position = np.flatnonzero(~mask)
+    if len(false_position) == 0:
+        return len(mask), len(mask), len(mask), len(mask)
+    boundary = np.r_[-1, false_position, len(mask)]
+    return int(mask.sum()), int(false_position[0]), int(len(mask) - 1 - false_position[-1]), int(np.diff(boundary).max() - 1)
+
+
+class LimitViolation:
+    """The number and the runs of values out of limits, to calculate ratio and burst num of series merged in time order
+
+    The result is the same as RaggedSeries.calc_limit_violation (common.utils_validation) of the whole series
+    """
+    NAME_LIST = ['lower_limit', 'upper_limit']
+
+    def __init__(self, lower_limit: float, upper_limit: float):
+        self.lower_limit = lower_limit
+        self.upper_limit = upper_limit
+        self.count = 0
+        self._runs = {name: (0, 0, 0, 0) for name in self.NAME_LIST}  # (violation num, leading run, trailing run, longest run)
+
+    def match(self, lower_limit: float, upper_limit: float) -> bool:
+        return math.isclose(self.lower_limit, lower_limit) and math.isclose(self.upper_limit, upper_limit)
+
+    def add(self, values: np.ndarray) -> None:
+        """Add values which follow the values added so far"""
+        other = LimitViolation(self.lower_limit, self.upper_limit)
+        other.count = len(values)
+        other._runs['lower_limit'] = _calc_runs(values < self.lower_limit)
+        other._runs['upper_limit'] = _calc_runs(values > self.upper_limit)
+        self.merge(other)
+
+    def merge(self, other: LimitViolation) -> None:
+        """Merge other which follows this in time"""
+        for name in self.NAME_LIST:
+            num, leading, trailing, longest = self._runs[name]
+            other_num, other_leading, other_trailing, other_longest = other._runs[name]
+            self._runs[name] = (num + other_num,
+                                leading if leading < self.count else self.count + other_leading,
+                                other_trailing if other_trailing < other.count else other.count + trailing,
+                                max(longest, other_longest, trailing + other_leading))
+        self.count += other.count
+
+    def to_dict(self) -> dict[str, float]:
+        """ratio_lower_limit, ratio_upper_limit, burst_num_lower_limit and burst_num_upper_limit"""
+        violation_dict = {}
+        for name in self.NAME_LIST:
+            num, _, _, longest = self._runs[name]
+            violation_dict[f'ratio_{name}'] = num / max(self.count, 1)
+            violation_dict[f'burst_num_{name}'] = longest
+        return violation_dict
+
+
+class SeriesAggregate:
+    """Summary of a timeseries (e.g. latency of a callback) which can be merged with the following timeseries
+
+    The first HEAD_NUM and the last TAIL_NUM values are kept as they are, so that they can be stripped after merge (see trail_df).
+    The other values are summarized into StatsSketch and LimitViolation of the given limits.
+    Timeseries downsampled to about TIMESERIES_POINT_NUM points is kept for graphs.
+    Note: leading/trailing 0 are not stripped unlike trail_df
+    """
+    HEAD_NUM = 1
+    TAIL_NUM = 2
+    TIMESERIES_POINT_NUM = 4000
+    SKETCH_EXACT_NUM = 10000
+
+    def __init__(self, limit_list: list[tuple[float, float]]=[]):
+        self.head = np.empty(0, dtype=float)
+        self.tail = np.empty(0, dtype=float)
+        self.sketch = StatsSketch(max_exact_num=self.SKETCH_EXACT_NUM)
+        self.violation_list = [LimitViolation(lower_limit, upper_limit) for lower_limit, upper_limit in limit_list]
+        self.timestamps = np.empty(0, dtype=np.int64)
+        self.values = np.empty(0, dtype=float)
+
+    @staticmethod
+    def from_timeseries(timestamps: np.ndarray, values: np.ndarray, limit_list: list[tuple[float, float]]=[]) -> SeriesAggregate:
+        series = SeriesAggregate(limit_list)
+        series.add(timestamps, values)
+        return series
+
+    @property
+    def count(self) -> int:
+        return len(self.head) + self.sketch.count + len(self.tail)
+
+    def add(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        """Add timeseries which follows the timeseries added so far. NaN is ignored"""
+        values = np.asarray(values, dtype=float)
+        valid = ~np.isnan(values)
+        self._add_timeseries(np.asarray(timestamps, dtype=np.int64)[valid], values[valid])
+        self._push(values[valid])
+
+    def merge(self, other: SeriesAggregate) -> None:
+        """Merge other which follows this in time"""
+        self._add_timeseries(other.timestamps, other.values)
+        if other.sketch.count == 0:
+            self._push(np.concatenate([other.head, other.tail]))
+            return
+        # head of other is full, so all the values of this are in the middle after merge
+        self._push(other.head)
+        self._add_to_middle(self.tail)
+        self.sketch.merge(other.sketch)
+        for violation in self.violation_list:
+            other_violation = next((other_violation for other_violation in other.violation_list
+                                    if violation.match(other_violation.lower_limit, other_violation.upper_limit)), None)
+            if other_violation is not None:
+                violation.merge(other_violation)
+        self.tail = other.tail.copy()
+
+    def get_timeseries(self) -> tuple[np.ndarray, np.ndarray]:
+        """Downsampled timestamps [ns] and values"""
+        return self.timestamps, self.values
+
+    def get_sketch(self, start_strip_num: int=0, end_strip_num: int=0) -> StatsSketch:
+        """Sketch of values except for the first start_strip_num and the last end_strip_num values"""
+        head, tail = self._strip(start_strip_num, end_strip_num)
+        sketch = StatsSketch(max_exact_num=self.SKETCH_EXACT_NUM)
+        sketch.add(head)
+        sketch.merge(self.sketch)
+        sketch.add(tail)
+        return sketch
+
+    def calc_limit_violation(self, lower_limit: float, upper_limit: float,
+                             start_strip_num: int=0, end_strip_num: int=0) -> dict[str, float] | None:
+        """Ratio and burst num of values out of limits (see LimitViolation). None if the limits are not given at creation"""
+        middle_violation = next((violation for violation in self.violation_list if violation.match(lower_limit, upper_limit)), None)
+        if middle_violation is None:
+            return None
+        head, tail = self._strip(start_strip_num, end_strip_num)
+        violation = LimitViolation(lower_limit, upper_limit)
+        violation.add(head)
+        violation.merge(middle_violation)
+        violation.add(tail)
+        return violation.to_dict()
+
+    def _strip(self, start_strip_num: int, end_strip_num: int) -> tuple[np.ndarray, np.ndarray]:
+        if start_strip_num > self.HEAD_NUM or end_strip_num > self.TAIL_NUM:
+            raise ValueError(f'Unable to strip more than {self.HEAD_NUM} (start) and {self.TAIL_NUM} (end) values')
+        if self.sketch.count == 0:
+            values = np.concatenate([self.head, self.tail])
+            return values[start_strip_num:max(len(values) - end_strip_num, start_strip_num)], np.empty(0, dtype=float)
+        return self.head[start_strip_num:], self.tail[:len(self.tail) - end_strip_num]
+
+    def _push(self, values: np.ndarray) -> None:
+        if self.sketch.count == 0:
+            values = np.concatenate([self.head, self.tail, values])
+            self.head, values = values[:self.HEAD_NUM], values[self.HEAD_NUM:]
+        else:
+            values = np.concatenate([self.tail, values])
+        if len(values) <= self.TAIL_NUM:
+            self.tail = values
+            return
+        self._add_to_middle(values[:-self.TAIL_NUM])
+        self.tail = values[-self.TAIL_NUM:]
+
+    def _add_to_middle(self, values: np.ndarray) -> None:
+        if len(values) == 0:
+            return
+        self.sketch.add(values)
+        for violation in self.violation_list:
+            violation.add(values)
+
+    def _add_timeseries(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        self.timestamps = np.concatenate([self.timestamps, timestamps])
+        self.values = np.concatenate([self.values, values])
+        if len(self.timestamps) > self.TIMESERIES_POINT_NUM * 2:
+            self.timestamps, self.values = downsample_minmax(self.timestamps, self.values, self.TIMESERIES_POINT_NUM // 2)
+
+
+class TraceAggregate:
+    """Aggregates of callbacks, publishers, subscriptions, communications and paths of time windows of trace data
+
+    An aggregate is created from each window (see from_app), and aggregates are merged in time order, so that memory doesn't grow
+    with the length of trace data. Records belong to the window where they start, and each window is read with CHUNK_MARGIN
+    after its end, so records across window boundaries (e.g. a callback ending in the next window) are neither dropped nor duplicated.
+    Frequency is counted in intervals from base_timestamp (the start of the analyzed duration), so it has all the values.
+    Period, latency and response time are kept as SeriesAggregate. Period across window boundaries is added at merge
+    """
+    SCHEMA_VERSION = 1
+    FREQUENCY_GROUPS = ['callback', 'publisher', 'subscription']
+    # series group: frequency group of the events whose period is the series (None if the series isn't period)
+    SERIES_GROUPS = {
+        'callback_period': 'callback',
+        'callback_latency': None,
+        'publisher_period': 'publisher',
+        'subscription_period': 'subscription',
+        'communication_latency': None,
+        'path': None,               # response time [ms] of each case (see TraceCache.make_path_name)
+        'path_stacked_bar': None,   # latency [ms] of each column of response time stacked bar of each case
+    }
+
+    def __init__(self, base_timestamp: int, start_point: float=0, end_point: float=0):
+        self.base_timestamp = base_timestamp
+        self.start_point = start_point   # [sec] from the beginning of trace data
+        self.end_point = end_point       # [sec] from the beginning of trace data
+        self.frequency_dict: dict[str, dict[str, FrequencyBins]] = {group: {} for group in self.FREQUENCY_GROUPS}
+        self.series_dict: dict[str, dict[str, SeriesAggregate]] = {group: {} for group in self.SERIES_GROUPS}
+
+    @staticmethod
+    def get_callback_latency_limit_list(callback: CallbackBase) -> list[tuple[float, float]]:
+        """Limits of latency [ms] to be validated (the same as latency expectation of timer callback in validate_callback)"""
+        if callback.callback_type == CallbackType.TIMER:
+            return [(0, callback.timer.period_ns * 1e-6)]
+        return []
+
+    @staticmethod
+    def from_app(app: Application, base_timestamp: int, begin_timestamp: int, end_timestamp: int,
+                 logger: logging.Logger = None) -> TraceAggregate:
+        """Create aggregate of records starting in [begin_timestamp, end_timestamp) [ns] (paths are not included. see set_path_group)"""
+        trace_aggregate = TraceAggregate(base_timestamp)
+
+        def _extract(target, group: str) -> list[np.ndarray]:
+            try:
+                timestamps_list = extract_timestamps(target.to_dataframe(), TraceCache.GROUP_COLUMNS[group])
+            except:
+                if logger:
+                    logger.debug(f'No data in trace aggregate: {group}')
+                return [np.empty(0, dtype=np.int64) for _ in TraceCache.GROUP_COLUMNS[group]]
+            is_owned = (timestamps_list[0] >= begin_timestamp) & (timestamps_list[0] < end_timestamp)
+            return [timestamps[is_owned] for timestamps in timestamps_list]
+
+        for callback in app.callbacks:
+            name = callback.callback_name
+            if name in trace_aggregate.frequency_dict['callback']:
+                continue
+            start_timestamps, end_timestamps = _extract(callback, 'callback')
+            trace_aggregate.frequency_dict['callback'][name] = FrequencyBins.from_timestamps(start_timestamps, base_timestamp)
+            trace_aggregate.series_dict['callback_period'][name] = SeriesAggregate.from_timeseries(*calc_period(start_timestamps))
+            trace_aggregate.series_dict['callback_latency'][name] = SeriesAggregate.from_timeseries(
+                *calc_latency(start_timestamps, end_timestamps), TraceAggregate.get_callback_latency_limit_list(callback))
+        for group, target_list in [('publisher', [(TraceCache._make_name(publisher.node_name, publisher.topic_name), publisher)
+                                                  for publisher in app.publishers]),
+                                   ('subscription', [(subscription.callback_name, subscription) for subscription in app.subscriptions])]:
+            for name, target in target_list:
+                if name in trace_aggregate.frequency_dict[group]:
+                    continue
+                timestamps = _extract(target, group)[0]
+                trace_aggregate.frequency_dict[group][name] = FrequencyBins.from_timestamps(timestamps, base_timestamp)
+                trace_aggregate.series_dict[f'{group}_period'][name] = SeriesAggregate.from_timeseries(*calc_period(timestamps))
+        for comm in app.communications:
+            name = TraceCache._make_name(comm.topic_name, comm.publish_node_name, comm.subscribe_node_name)
+            if name not in trace_aggregate.series_dict['communication_latency']:
+                trace_aggregate.series_dict['communication_latency'][name] = SeriesAggregate.from_timeseries(
+                    *calc_latency(*_extract(comm, 'communication')))
+        return trace_aggregate
+
+    def set_path_group(self, response_time_dict: dict[str, list[np.ndarray]], stacked_bar_dict: dict[str, pd.DataFrame],
+                       begin_timestamp: int, end_timestamp: int) -> None:
+        """Set response time of paths starting in [begin_timestamp, end_timestamp) [ns]
+
+        Parameters
+        ----------
+        response_time_dict : dict[str, list[np.ndarray]]
+            pairs of path name of each case (see TraceCache.make_path_name) and [start timestamps [ns], response time [ns]]
+        stacked_bar_dict : dict[str, pd.DataFrame]
+            pairs of path name of each case and dataframe of response time stacked bar (|start time|latency [ms]|...)
+        """
+        for name, (start_timestamps, response_time) in response_time_dict.items():
+            is_owned = (start_timestamps >= begin_timestamp) & (start_timestamps < end_timestamp)
+            self.series_dict['path'][name] = SeriesAggregate.from_timeseries(start_timestamps[is_owned], response_time[is_owned] / 1e6)
+        for name, df_stacked_bar in stacked_bar_dict.items():
+            start_timestamps = df_stacked_bar['start time'].to_numpy(dtype=np.int64)
+            is_owned = (start_timestamps >= begin_timestamp) & (start_timestamps < end_timestamp)
+            for column in df_stacked_bar.columns:
+                if column == 'start time':
+                    continue
+                self.series_dict['path_stacked_bar'][TraceCache._make_name(name, column)] = SeriesAggregate.from_timeseries(
+                    start_timestamps[is_owned], df_stacked_bar[column].to_numpy(dtype=float)[is_owned])
+
+    def merge(self, other: TraceAggregate) -> None:
+        """Merge aggregate of the following window. other must not be used after merge"""
+        for group, frequency_group in self.SERIES_GROUPS.items():
+            for name, other_series in other.series_dict[group].items():
+                series = self.series_dict[group].get(name)
+                if series is None:
+                    self.series_dict[group][name] = other_series
+                    continue
+                if frequency_group is not None and name in self.frequency_dict[frequency_group] and name in other.frequency_dict[frequency_group]:
+                    # period between the last event of this and the first event of other
+                    last_timestamp = self.frequency_dict[frequency_group][name].last_timestamp
+                    first_timestamp = other.frequency_dict[frequency_group][name].first_timestamp
+                    if last_timestamp >= 0 and first_timestamp >= 0:
+                        series.merge(SeriesAggregate.from_timeseries(*calc_period([last_timestamp, first_timestamp])))
+                series.merge(other_series)
+        for group in self.FREQUENCY_GROUPS:
+            for name, other_bins in other.frequency_dict[group].items():
+                self.frequency_dict[group].setdefault(name, FrequencyBins()).merge(other_bins)
+        self.end_point = max(self.end_point, other.end_point)
+
+    def get_frequency(self, group_name_list: list[tuple[str, str]]) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Frequency timeseries of each (group, name) in the common intervals (from the first interval of all until the last)
+
+        Intervals start at base_timestamp rather than the first timestamp (calc_frequency_list), so values may differ at the edges
+        """
+        bins_list = [self.frequency_dict[group].get(name, FrequencyBins()) for group, name in group_name_list]
+        valid_bins_list = [bins for bins in bins_list if bins.count > 0]
+        if len(valid_bins_list) == 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=float)) for _ in group_name_list]
+        first_index = min(bins.first_index for bins in valid_bins_list)
+        interval_num = max(bins.last_index for bins in valid_bins_list) - first_index + 1
+        interval_timestamps = self.base_timestamp + (first_index + np.arange(interval_num, dtype=np.int64)) * FREQUENCY_INTERVAL_NS
+        timeseries_list = []
+        for bins in bins_list:
+            if bins.count == 0:
+                timeseries_list.append((np.empty(0, dtype=np.int64), np.empty(0, dtype=float)))
+                continue
+            frequency = np.zeros(interval_num, dtype=float)
+            frequency[bins.first_index - first_index:bins.last_index - first_index + 1] = bins.counts
+            timeseries_list.append((interval_timestamps, frequency))
+        return timeseries_list
+
+    def get_count(self, group: str, name: str) -> int:
+        return self.frequency_dict[group][name].count if name in self.frequency_dict[group] else 0
+
+    def get_series(self, group: str, name: str) -> SeriesAggregate:
+        """Get series aggregate (empty if not found)"""
+        return self.series_dict[group].get(name) or SeriesAggregate()
+
+    def get_stacked_bar(self, path_name: str, case: str) -> dict[str, SeriesAggregate]:
+        """Get pairs of column and series aggregate of response time stacked bar of a path"""
+        prefix = TraceCache._make_name(TraceCache.make_path_name(path_name, case), '')
+        return {name[len(prefix):]: series for name, series in self.series_dict['path_stacked_bar'].items() if name.startswith(prefix)}
+
+    def save(self, cache_path: str) -> None:
+        tmp_cache_path = f'{cache_path}.tmp{os.getpid()}'
+        with open(tmp_cache_path, 'wb') as f_pickle:
+            pickle.dump((self.SCHEMA_VERSION, self), f_pickle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_cache_path, cache_path)
+
+    @staticmethod
+    def load(cache_path: str) -> TraceAggregate | None:
+        try:
+            with open(cache_path, 'rb') as f_pickle:
+                schema_version, trace_aggregate = pickle.load(f_pickle)
+        except:
+            return None
+        return trace_aggregate if schema_version == TraceAggregate.SCHEMA_VERSION else None
+
+
+def _create_window_aggregate(trace_data: str | list[str], window_start: float, window_end: float, trace_begin_timestamp: int,
+                             base_timestamp: int, func_create_aggregate, logger: logging.Logger = None, lttng: Lttng = None) -> TraceAggregate:
+    """Create aggregate of records starting in [window_start, window_end) [sec from the beginning of trace data]"""
+    if logger:
+        logger.info(f'Read trace data window: {window_start:.1f} - {window_end:.1f} [sec]')
+    if lttng is None:
+        read_start = max(window_start - CHUNK_ROUNDING_MARGIN, 0)
+        lttng = read_trace_data_duration(trace_data, read_start, window_end - read_start + CHUNK_MARGIN)
+    window_aggregate = func_create_aggregate(lttng, base_timestamp, trace_begin_timestamp + int(window_start * 1e9),
+                                             trace_begin_timestamp + int(window_end * 1e9))
+    window_aggregate.end_point = window_end
+    del lttng
+    gc.collect()
+    return window_aggregate
+
+
+def create_trace_aggregate_by_chunk(trace_data: str | list[str], start_strip: float, end_strip: float, chunk_duration: float,
+                                    func_create_aggregate, logger: logging.Logger = None,
+                                    jobs: int=1) -> tuple[TraceAggregate, Lttng | None]:
+    """Walk trace data in windows of chunk_duration [sec] and merge aggregates created from each window
+
+    Only one window of trace data is loaded at a time in each process, so peak memory is bounded by the window size (x jobs).
+    Windows are processed in forked worker processes if jobs > 1, and the aggregates are merged in time order as they arrive.
+    Note that CARET filters a window while reading the whole trace data (its converted cache after the first read),
+    so reading time grows with the number of windows and this is slower than reading trace data at once.
+    Use this only when trace data doesn't fit in memory
+
+    Parameters
+    ----------
+    func_create_aggregate : Callable[[Lttng, int, int, int], TraceAggregate]
+        function to create aggregate from trace data of a window, base timestamp [ns] of frequency,
+        and the begin and end timestamps [ns] of the window (records starting in [begin, end) belong to the window)
+
+    Returns
+    -------
+    tuple[TraceAggregate, Lttng | None]
+        merged aggregate, and trace data of the middle window (kept to create graphs without reading it again)
+    """
+    lttng = read_trace_data_duration(trace_data, start_strip, chunk_duration + CHUNK_MARGIN)
+    begin_time, end_time = lttng.get_trace_range()
+    trace_begin_timestamp = int(begin_time.timestamp() * 1e9)
+    end_point = (end_time - begin_time).total_seconds() - end_strip
+    base_timestamp = trace_begin_timestamp + int(start_strip * 1e9)
+    window_list = []
+    window_start = start_strip
+    while window_start < end_point:
+        window_list.append((window_start, min(window_start + chunk_duration, end_point)))
+        window_start += chunk_duration
+
+    trace_aggregate = TraceAggregate(base_timestamp, start_strip, start_strip)
+    if len(window_list) == 0:
+        return trace_aggregate, None
+    if logger:
+        logger.info(f'Trace data is read {len(window_list)} times for {len(window_list)} windows')
+
+    # The first window is already loaded to get the trace range, and the middle window is processed in this process
+    # to keep its trace data for graphs. The other windows are processed in worker processes
+    middle_index = (len(window_list) - 1) // 2
+    aggregate_dict = {0: _create_window_aggregate(trace_data, *window_list[0], trace_begin_timestamp, base_timestamp,
+                                                  func_create_aggregate, logger, lttng)}
+    if middle_index > 0:
+        read_start = max(window_list[middle_index][0] - CHUNK_ROUNDING_MARGIN, 0)
+        lttng = read_trace_data_duration(trace_data, read_start, window_list[middle_index][1] - read_start + CHUNK_MARGIN)
+        aggregate_dict[middle_index] = _create_window_aggregate(trace_data, *window_list[middle_index], trace_begin_timestamp,
+                                                                base_timestamp, func_create_aggregate, logger, lttng)
+    index_list = [index for index in range(len(window_list)) if index not in aggregate_dict]
+    args_list = [(trace_data, *window_list[index], trace_begin_timestamp, base_timestamp, func_create_aggregate, logger)
+                 for index in index_list]
+    next_index = 0
+    for index, window_aggregate in zip(index_list, iterate_in_parallel(_create_window_aggregate, args_list, jobs)):
+        aggregate_dict[index] = window_aggregate
+        # merge in time order
+        while next_index in aggregate_dict:
+            trace_aggregate.merge(aggregate_dict.pop(next_index))
+            next_index += 1
+    while next_index in aggregate_dict:
+        trace_aggregate.merge(aggregate_dict.pop(next_index))
+        next_index += 1
+    return trace_aggregate, lttng
+
+
+def load_trace_aggregate_by_chunk(trace_cache_dir: str, trace_data: str | list[str], start_strip: float, end_strip: float,
+                                  chunk_duration: float, func_create_aggregate, logger: logging.Logger = None,
+                                  jobs: int=1) -> tuple[TraceAggregate, Lttng | None]:
+    """Load trace aggregate if exists, otherwise create it by walking trace data in windows (see create_trace_aggregate_by_chunk)
+
+    Trace data of the middle window is None if trace aggregate is loaded
+    """
+    cache_path = None
+    if trace_cache_dir:
+        cache_path = f'{trace_cache_dir}/{TraceCache.make_key(trace_data, start_strip, end_strip, chunk_duration)}_aggregate.pickle'
+        trace_aggregate = TraceAggregate.load(cache_path)
+        if trace_aggregate:
+            if logger:
+                logger.info(f'Trace aggregate is loaded: {cache_path}')
+            return trace_aggregate, None
+    trace_aggregate, lttng = create_trace_aggregate_by_chunk(trace_data, start_strip, end_strip, chunk_duration,
+                                                             func_create_aggregate, logger, jobs)
+    if cache_path:
+        try:
+            os.makedirs(trace_cache_dir, exist_ok=True)
+            trace_aggregate.save(cache_path)
+            if logger:
+                logger.info(f'Trace aggregate is created: {cache_path}')
+        except:
+            if logger:
+                logger.warning(f'Unable to save trace aggregate: {cache_path}')
+    return trace_aggregate, lttng
+
+
+class AggregatedCallbackMetrics(CallbackMetrics):
+    """CallbackMetrics calculated from TraceAggregate (chunked mode)
+
+    Frequency has all the intervals (counted from the start of the analyzed duration, see TraceAggregate.get_frequency).
+    Period and latency are downsampled timeseries for graphs, so use calculate_sketch and calc_limit_violation for stats and validation
+    """
+    DOWNSAMPLED_METRICS = {'period', 'latency'}
+
+    def __init__(self, trace_aggregate: TraceAggregate):
+        super().__init__(None)
+        self.trace_aggregate = trace_aggregate
+
+    def calculate(self, callbacks: list[CallbackBase], metrics: str) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+        metrics = metrics.lower()
+        callback_name_list = [callback.callback_name for callback in callbacks]
+        if all(self.trace_aggregate.get_count('callback', callback_name) == 0 for callback_name in callback_name_list):
+            return {}
+        if metrics == 'frequency':
+            return dict(zip(callback_name_list, self.trace_aggregate.get_frequency([('callback', callback_name) for callback_name in callback_name_list])))
+        elif metrics in ['period', 'latency']:
+            return {callback_name: self.trace_aggregate.get_series(f'callback_{metrics}', callback_name).get_timeseries()
+                    for callback_name in callback_name_list}
+        raise ValueError(f'Invalid metrics: {metrics}')
+
+    def calculate_sketch(self, callbacks: list[CallbackBase], metrics: str,
+                         start_strip_num: int=0, end_strip_num: int=0) -> dict[str, StatsSketch]:
+        if self.has_all_values(metrics):
+            return super().calculate_sketch(callbacks, metrics, start_strip_num, end_strip_num)
+        if not self.calculate(callbacks, 'frequency'):
+            return {}
+        return {callback.callback_name: self.trace_aggregate.get_series(f'callback_{metrics.lower()}', callback.callback_name)
+                .get_sketch(start_strip_num, end_strip_num) for callback in callbacks}
+
+    def calc_limit_violation(self, callback: CallbackBase, metrics: str, lower_limit: float, upper_limit: float,
+                             end_strip_num: int=0) -> dict[str, float] | None:
+        """Ratio and burst num of values out of limits. None if the limits are not aggregated"""
+        return self.trace_aggregate.get_series(f'callback_{metrics.lower()}', callback.callback_name) \
+            .calc_limit_violation(lower_limit, upper_limit, end_strip_num=end_strip_num)
+
+
+class AggregatedCommunicationMetrics(CommunicationMetrics):
+    """CommunicationMetrics calculated from TraceAggregate (chunked mode)
+
+    Frequency has all the intervals (see TraceAggregate.get_frequency).
+    Period and latency are downsampled timeseries for graphs, so use get_sketch for stats
+    """
+    DOWNSAMPLED_METRICS = {'period', 'latency'}
+
+    def __init__(self, trace_aggregate: TraceAggregate):
+        super().__init__(None)
+        self.trace_aggregate = trace_aggregate
+
+    def _calculate(self, comm: Communication, metrics: str) -> list[tuple[str, tuple[np.ndarray, np.ndarray]]] | None:
+        if metrics == 'latency':
+            name = TraceCache._make_name(comm.topic_name, comm.publish_node_name, comm.subscribe_node_name)
+            return [('communication', self.trace_aggregate.get_series('communication_latency', name).get_timeseries())]
+        name_list = [TraceCache._make_name(comm.publish_node_name, comm.topic_name), comm.subscription.callback_name]
+        if metrics == 'frequency':
+            timeseries_list = self.trace_aggregate.get_frequency(list(zip(['publisher', 'subscription'], name_list)))
+        elif metrics == 'period':
+            timeseries_list = [self.trace_aggregate.get_series(f'{group}_period', name).get_timeseries()
+                               for group, name in zip(['publisher', 'subscription'], name_list)]
+        else:
+            raise ValueError(f'Invalid metrics: {metrics}')
+        return list(zip(['publish', 'subscribe'], timeseries_list))
+
+    def _calculate_callback(self, callback: CallbackBase, metrics: str) -> tuple[np.ndarray, np.ndarray] | None:
+        if metrics == 'frequency':
+            return self.trace_aggregate.get_frequency([('subscription', callback.callback_name)])[0]
+        elif metrics == 'period':
+            return self.trace_aggregate.get_series('subscription_period', callback.callback_name).get_timeseries()
+        return None
+
+    def get_sketch(self, comm: Communication, metrics: str, df_comm: pd.DataFrame, end_strip_num: int=0) -> StatsSketch:
+        if self.has_all_values(metrics):
+            return super().get_sketch(comm, metrics, df_comm, end_strip_num)
+        metrics = metrics.lower()
+        if metrics == 'latency':
+            series = self.trace_aggregate.get_series('communication_latency',
+                                                     TraceCache._make_name(comm.topic_name, comm.publish_node_name, comm.subscribe_node_name))
+        else:
+            series = self.trace_aggregate.get_series('publisher_period', TraceCache._make_name(comm.publish_node_name, comm.topic_name))
+        return series.get_sketch(end_strip_num=end_strip_num)
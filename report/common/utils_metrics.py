@@ -0,0 +1,314 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Metrics (Frequency, Period, Latency) calculation from timestamps
+"""
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+from caret_analyze.runtime.callback import CallbackBase
+from caret_analyze.runtime.communication import Communication
+from caret_analyze.runtime.node import Node
+from caret_analyze.plot import Plot
+from common.utils import TraceCache, FigureSpec, extract_timestamps, get_callback_legend, trail_df
+from common.utils_plot import create_timeseries_figure, timeseries_from_dataframe
+from common.utils_stats import StatsSketch
+
+FREQUENCY_INTERVAL_NS = 1000000000
+
+Y_AXIS_LABEL = {
+    'frequency': 'frequency [Hz]',
+    'period': 'period [ms]',
+    'latency': 'latency [ms]',
+}
+
+
+def calc_frequency(timestamps: np.ndarray, base_timestamp: int, until_timestamp: int,
+                   interval_ns: int=FREQUENCY_INTERVAL_NS) -> tuple[np.ndarray, np.ndarray]:
+    """Count timestamps in each interval from base_timestamp until until_timestamp
+
+    This is intended to be the same as CARET's frequency timeseries: intervals start at base_timestamp,
+    the last (partial) interval containing until_timestamp is included, and intervals without timestamps are 0.
+    Use compare_with_caret (or analyze_node/check_callback_metrics.py) to check it against CARET on real trace data
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    timestamps = timestamps[timestamps >= base_timestamp]
+    if len(timestamps) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=float)
+    interval_index = (timestamps - base_timestamp) // interval_ns
+    interval_num = int(max(interval_index.max(), (until_timestamp - base_timestamp) // interval_ns)) + 1
+    frequency = np.bincount(interval_index, minlength=interval_num).astype(float)
+    interval_timestamps = base_timestamp + np.arange(interval_num, dtype=np.int64) * interval_ns
+    return interval_timestamps, frequency
+
+
+def calc_frequency_list(timestamps_list: list[np.ndarray]) -> list[tuple[np.ndarray, np.ndarray]]:
+    """Calculate frequency of each timestamps in the common intervals (from the first timestamp of all until the last)"""
+    valid_timestamps_list = [timestamps for timestamps in timestamps_list if len(timestamps) > 0]
+    if len(valid_timestamps_list) == 0:
+        return [calc_frequency(timestamps, 0, 0) for timestamps in timestamps_list]
+    base_timestamp = min(int(timestamps[0]) for timestamps in valid_timestamps_list)
+    until_timestamp = max(int(timestamps[-1]) for timestamps in valid_timestamps_list)
+    return [calc_frequency(timestamps, base_timestamp, until_timestamp) for timestamps in timestamps_list]
+
+
+def calc_period(timestamps: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Calculate period [ms] between consecutive timestamps"""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if len(timestamps) < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=float)
+    return timestamps[:-1], np.diff(timestamps) / 1e6
+
+
+def calc_latency(start_timestamps: np.ndarray, end_timestamps: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Calculate latency [ms] from start to end. Rows without end are ignored"""
+    start_timestamps = np.asarray(start_timestamps, dtype=np.int64)
+    end_timestamps = np.asarray(end_timestamps, dtype=np.int64)
+    valid = end_timestamps != TraceCache.MISSING
+    return start_timestamps[valid], (end_timestamps[valid] - start_timestamps[valid]) / 1e6
+
+
+class CallbackMetrics:
+    """Frequency/Period/Latency of callbacks
+
+    callback_start/callback_end timestamps of each callback are read only once (from trace cache if available),
+    then all metrics are derived from the same arrays
+    """
+    Y_AXIS_LABEL = Y_AXIS_LABEL
+    DOWNSAMPLED_METRICS: set[str] = set()   # metrics whose values are downsampled (e.g. aggregated in chunked mode)
+
+    def __init__(self, trace_cache: TraceCache = None):
+        self.trace_cache = trace_cache
+        self._timestamps_dict: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+
+    def get_timestamps(self, callback: CallbackBase) -> tuple[np.ndarray, np.ndarray]:
+        """Get callback_start and callback_end timestamps [ns]"""
+        callback_name = callback.callback_name
+        if callback_name not in self._timestamps_dict:
+            timestamps = self.trace_cache.get_callback(callback_name) if self.trace_cache else None
+            if timestamps is None:
+                try:
+                    timestamps = tuple(extract_timestamps(callback.to_dataframe(), TraceCache.GROUP_COLUMNS['callback']))
+                except:
+                    timestamps = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+            self._timestamps_dict[callback_name] = timestamps
+        return self._timestamps_dict[callback_name]
+
+    def calculate(self, callbacks: list[CallbackBase], metrics: str) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+        """Calculate metrics of callbacks
+
+        Parameters
+        ----------
+        callbacks : list[CallbackBase]
+            callbacks to be calculated. Frequency of each callback is counted in the common intervals
+        metrics : str
+            'frequency', 'period' or 'latency' (case insensitive)
+
+        Returns
+        -------
+        dict[str, tuple[np.ndarray, np.ndarray]]
+            pairs of callback name and (timestamps [ns], values). Empty if none of the callbacks is called
+        """
+        metrics = metrics.lower()
+        timestamps_dict = {callback.callback_name: self.get_timestamps(callback) for callback in callbacks}
+        start_timestamps_list = [start for start, _ in timestamps_dict.values() if len(start) > 0]
+        if len(start_timestamps_list) == 0:
+            return {}
+
+        if metrics == 'frequency':
+            return dict(zip(timestamps_dict.keys(), calc_frequency_list([start for start, _ in timestamps_dict.values()])))
+        elif metrics == 'period':
+            return {callback_name: calc_period(start) for callback_name, (start, _) in timestamps_dict.items()}
+        elif metrics == 'latency':
+            return {callback_name: calc_latency(start, end) for callback_name, (start, end) in timestamps_dict.items()}
+        raise ValueError(f'Invalid metrics: {metrics}')
+
+    def has_all_values(self, metrics: str) -> bool:
+        """Whether calculate returns all the values of metrics (otherwise, values are downsampled for graphs)"""
+        return metrics.lower() not in self.DOWNSAMPLED_METRICS
+
+    def calculate_sketch(self, callbacks: list[CallbackBase], metrics: str,
+                         start_strip_num: int=0, end_strip_num: int=0) -> dict[str, StatsSketch]:
+        """Calculate sketch of metrics of callbacks after trail_df (common.utils). Empty if none of the callbacks is called"""
+        return {callback_name: StatsSketch.from_values(trail_df(pd.Series(values, dtype=float), start_strip_num=start_strip_num,
+                                                                end_strip_num=end_strip_num))
+                for callback_name, (_, values) in self.calculate(callbacks, metrics).items()}
+
+    def create_timeseries_figure(self, node: Node, callbacks: list[CallbackBase], metrics: str, xaxis_type: str,
+                                 y_range_start: float=None) -> FigureSpec:
+        """Create timeseries graph of callbacks in a node
+
+        FigureSpec is returned so that the figure can be created when exported (see export_graph)
+        """
+        metrics = metrics.lower()
+        if xaxis_type != 'system_time':
+            # Conversion to sim_time is supported by CARET only
+            create_plot = {
+                'frequency': Plot.create_frequency_timeseries_plot,
+                'period': Plot.create_period_timeseries_plot,
+                'latency': Plot.create_latency_timeseries_plot,
+            }[metrics]
+            df = create_plot(callbacks).to_dataframe(xaxis_type=xaxis_type)
+            timeseries_dict = {get_callback_legend(node, column[0]): timeseries
+                               for column, timeseries in timeseries_from_dataframe(df).items()}
+            return FigureSpec(create_timeseries_figure, timeseries_dict, self.Y_AXIS_LABEL[metrics],
+                              y_range_start=y_range_start, x_axis_label='simulation time [s]')
+        timeseries_dict = {get_callback_legend(node, callback_name): timeseries
+                           for callback_name, timeseries in self.calculate(callbacks, metrics).items()}
+        return FigureSpec(create_timeseries_figure, timeseries_dict, self.Y_AXIS_LABEL[metrics], y_range_start=y_range_start)
+
+
+class CommunicationMetrics:
+    """Frequency/Period/Latency of communications
+
+    Timestamps are read from trace cache if available (system time only), otherwise metrics are calculated by CARET
+    """
+    DOWNSAMPLED_METRICS: set[str] = set()   # metrics whose values are downsampled (e.g. aggregated in chunked mode)
+
+    def __init__(self, trace_cache: TraceCache = None):
+        self.trace_cache = trace_cache
+
+    def to_dataframe(self, comm: Communication, metrics: str, xaxis_type: str) -> pd.DataFrame:
+        """Create dataframe in the same layout as CARET timeseries plot
+
+        Returns
+        -------
+        pd.DataFrame
+            |timestamp|publish|timestamp|subscribe| for frequency and period, |timestamp|latency| for latency
+        """
+        metrics = metrics.lower()
+        timeseries_list = self._calculate(comm, metrics) if xaxis_type == 'system_time' else None
+        if timeseries_list is None:
+            # todo: create_communication_frequency_plot doesn't work (it's stuck and consumes too much memory)
+            if metrics == 'frequency':
+                return Plot.create_frequency_timeseries_plot([comm.publisher, comm.subscription]).to_dataframe(xaxis_type=xaxis_type)
+            elif metrics == 'period':
+                return Plot.create_period_timeseries_plot([comm.publisher, comm.subscription]).to_dataframe(xaxis_type=xaxis_type)
+            elif metrics == 'latency':
+                return Plot.create_latency_timeseries_plot(comm).to_dataframe(xaxis_type=xaxis_type)
+            raise ValueError(f'Invalid metrics: {metrics}')
+
+        series_list = []
+        for name, (timestamps, values) in timeseries_list:
+            series_list.append(pd.Series(timestamps, name=f'{name} [ns]'))
+            series_list.append(pd.Series(values, name=f'{name} {Y_AXIS_LABEL[metrics]}'))
+        return pd.concat(series_list, axis=1)
+
+    def has_all_values(self, metrics: str) -> bool:
+        """Whether to_dataframe returns all the values of metrics (otherwise, values are downsampled for graphs)"""
+        return metrics.lower() not in self.DOWNSAMPLED_METRICS
+
+    def get_sketch(self, comm: Communication, metrics: str, df_comm: pd.DataFrame, end_strip_num: int=0) -> StatsSketch:
+        """Get sketch of metrics (publish side for frequency and period) from dataframe created by to_dataframe"""
+        return StatsSketch.from_values(trail_df(df_comm.iloc[:, 1], end_strip_num=end_strip_num))
+
+    def callback_to_dataframe(self, callback: CallbackBase, metrics: str, xaxis_type: str) -> pd.DataFrame | None:
+        """Create dataframe (|timestamp|value|) of frequency or period of subscription callback. None if not available"""
+        metrics = metrics.lower()
+        timeseries = self._calculate_callback(callback, metrics) if xaxis_type == 'system_time' else None
+        if timeseries is None:
+            return None
+        timestamps, values = timeseries
+        return pd.concat([pd.Series(timestamps, name=f'{callback.callback_name} [ns]'),
+                          pd.Series(values, name=f'{callback.callback_name} {Y_AXIS_LABEL[metrics]}')], axis=1)
+
+    def _calculate_callback(self, callback: CallbackBase, metrics: str) -> tuple[np.ndarray, np.ndarray] | None:
+        timestamps = self.trace_cache.get_subscription(callback.callback_name) if self.trace_cache else None
+        if timestamps is None:
+            return None
+        if metrics == 'frequency':
+            return calc_frequency_list([timestamps])[0]
+        elif metrics == 'period':
+            return calc_period(timestamps)
+        return None
+
+    def _calculate(self, comm: Communication, metrics: str) -> list[tuple[str, tuple[np.ndarray, np.ndarray]]] | None:
+        if self.trace_cache is None:
+            return None
+        if metrics == 'latency':
+            timestamps = self.trace_cache.get_communication(comm.topic_name, comm.publish_node_name, comm.subscribe_node_name)
+            if timestamps is None:
+                return None
+            return [('communication', calc_latency(*timestamps))]
+        publish_timestamps = self.trace_cache.get_publisher(comm.publish_node_name, comm.topic_name)
+        subscribe_timestamps = self.trace_cache.get_subscription(comm.subscription.callback_name)
+        if publish_timestamps is None or subscribe_timestamps is None:
+            return None
+        if metrics == 'frequency':
+            timeseries_list = calc_frequency_list([publish_timestamps, subscribe_timestamps])
+        elif metrics == 'period':
+            timeseries_list = [calc_period(publish_timestamps), calc_period(subscribe_timestamps)]
+        else:
+            raise ValueError(f'Invalid metrics: {metrics}')
+        return list(zip(['publish', 'subscribe'], timeseries_list))
+
+    @staticmethod
+    def create_timeseries_figure(comm: Communication, metrics: str, df_comm: pd.DataFrame, xaxis_type: str,
+                                 y_range_start: float=None) -> FigureSpec:
+        """Create timeseries graph from dataframe created by to_dataframe
+
+        Graph is created from the dataframe and each series is downsampled, so topics with high frequency can be displayed
+        """
+        metrics = metrics.lower()
+        if metrics == 'latency':
+            legend_list = [f'{comm.publish_node_name} -> {comm.subscribe_node_name}']
+        else:
+            legend_list = [f'publish: {comm.publish_node_name}', f'subscribe: {comm.subscribe_node_name}']
+        timeseries_dict = dict(zip(legend_list, timeseries_from_dataframe(df_comm).values()))
+        return FigureSpec(create_timeseries_figure, timeseries_dict, Y_AXIS_LABEL[metrics], y_range_start=y_range_start,
+                          x_axis_label='system time [s]' if xaxis_type == 'system_time' else 'simulation time [s]')
+
+
+def compare_with_caret(callback_metrics: CallbackMetrics, callbacks: list[CallbackBase], metrics: str,
+                       rtol: float=1e-9, timestamp_atol_ns: int=1000) -> list[str]:
+    """Compare timeseries calculated by CallbackMetrics with CARET timeseries plot (system time) of the same callbacks
+
+    Timestamps are compared with tolerance of timestamp_atol_ns, because columns with NaN are float in dataframe
+    (float64 has a resolution of 256 ns around the current epoch time)
+
+    Returns
+    -------
+    list[str]
+        description of each mismatch. Empty if all the timeseries are the same
+    """
+    metrics = metrics.lower()
+    create_plot = {
+        'frequency': Plot.create_frequency_timeseries_plot,
+        'period': Plot.create_period_timeseries_plot,
+        'latency': Plot.create_latency_timeseries_plot,
+    }[metrics]
+    measurement = callback_metrics.calculate(callbacks, metrics)
+    try:
+        df = create_plot(callbacks).to_dataframe(xaxis_type='system_time')
+        caret_dict = {column[0]: timeseries for column, timeseries in timeseries_from_dataframe(df).items()}
+    except Exception as e:
+        # CARET raises an error if none of the callbacks is called
+        if len(measurement) > 0:
+            return [f'CARET failed but CallbackMetrics has data ({metrics}): {e}']
+        return []
+    mismatch_list = []
+    for callback in callbacks:
+        callback_name = callback.callback_name
+        caret_timestamps, caret_values = caret_dict.get(callback_name, (np.empty(0, dtype=np.int64), np.empty(0)))
+        timestamps, values = measurement.get(callback_name, (np.empty(0, dtype=np.int64), np.empty(0)))
+        if len(caret_timestamps) != len(timestamps):
+            mismatch_list.append(f'{callback_name} ({metrics}): length {len(timestamps)} (CARET: {len(caret_timestamps)})')
+            continue
+        diff = np.flatnonzero((np.abs(caret_timestamps - timestamps) > timestamp_atol_ns) |
+                              ~np.isclose(caret_values, values, rtol=rtol, atol=0, equal_nan=True))
+        if len(diff) > 0:
+            index = int(diff[0])
+            mismatch_list.append(f'{callback_name} ({metrics}): {len(diff)} points differ. first: '
+                                 f'({timestamps[index]}, {values[index]}) (CARET: ({caret_timestamps[index]}, {caret_values[index]}))')
+    return mismatch_list
@@ -0,0 +1,425 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Path search over communication graph with constraints of target_path.json
+"""
+from __future__ import annotations
+from typing import Callable
+import collections
+import hashlib
+import json
+import math
+import multiprocessing
+import multiprocessing.connection
+import os
+import re
+import signal
+import time
+from caret_analyze import Architecture
+
+
+class PathSearchAborted(Exception):
+    """Path search is stopped before completion. progress has the last reported progress"""
+    def __init__(self, message: str, progress: dict = None):
+        super().__init__(message)
+        self.progress = progress or {}
+
+
+class PathSearchTimeout(PathSearchAborted):
+    pass
+
+
+class PathSearchMemoryExceeded(PathSearchAborted):
+    pass
+
+
+class PathSearcher:
+    """Search paths over communication graph (node -[topic]-> node)
+
+    Ignore filters, loop detection and constraints of target_path.json (node/topic regular expressions in order)
+    are applied during traversal, so only routes which satisfy all constraints are returned.
+    Branches which can no longer reach the next waypoint within the depth bound are pruned.
+    Routes are returned as (node_names, topic_names), and converted into PathStructValue by to_path_struct.
+    """
+    def __init__(self, arch: Architecture, node_filter: Callable[[str], bool], comm_filter: Callable[[str], bool]):
+        self.arch = arch
+        self.node_filter = node_filter
+        self.comm_filter = comm_filter
+        edge_set = set()
+        for comm in arch.communications:
+            if not comm_filter(comm.topic_name) \
+                or not node_filter(comm.publish_node_name) \
+                or not node_filter(comm.subscribe_node_name):
+                continue
+            edge_set.add((comm.publish_node_name, comm.topic_name, comm.subscribe_node_name))
+        self._edge_dict: dict[str, list[tuple[str, str]]] = {}
+        self._reverse_edge_dict: dict[str, set[str]] = {}
+        for publish_node_name, topic_name, subscribe_node_name in sorted(edge_set):
+            self._edge_dict.setdefault(publish_node_name, []).append((topic_name, subscribe_node_name))
+            self._reverse_edge_dict.setdefault(subscribe_node_name, set()).add(publish_node_name)
+        self._distance_cache: dict[str, dict[str, int]] = {}
+
+    def fingerprint(self) -> str:
+        """Hash of communication graph used for search (after ignore filters)"""
+        edge_list = [[publish_node_name, topic_name, subscribe_node_name]
+                     for publish_node_name, edge_list in sorted(self._edge_dict.items())
+                     for topic_name, subscribe_node_name in edge_list]
+        return hashlib.sha1(json.dumps(edge_list).encode()).hexdigest()
+
+    def _distance_to(self, node_name: str) -> dict[str, int]:
+        """The number of communications from each node to node_name"""
+        if node_name not in self._distance_cache:
+            distance = {node_name: 0}
+            queue = collections.deque([node_name])
+            while queue:
+                current = queue.popleft()
+                for prev in self._reverse_edge_dict.get(current, []):
+                    if prev not in distance:
+                        distance[prev] = distance[current] + 1
+                        queue.append(prev)
+            self._distance_cache[node_name] = distance
+        return self._distance_cache[node_name]
+
+    def search(self, waypoint_list: list[str], entry_list: list[tuple[str, str]], max_depth: int,
+               timeout: float=None, progress_callback: Callable[[dict], None]=None) -> list[tuple[list[str], list[str]]]:
+        """Search routes from the first waypoint to the last waypoint via the other waypoints in order
+
+        Parameters
+        ----------
+        waypoint_list : list[str]
+            node names the route must go through in order (at least 2)
+        entry_list : list[tuple[str, str]]
+            pairs of node name and topic name (None if not specified) in regular expression.
+            Each entry must match a node (and its sub or pub topic) in order
+        max_depth : int
+            max number of communications between consecutive waypoints
+        timeout : float
+            timeout [sec]. PathSearchTimeout is raised
+        progress_callback : Callable[[dict], None]
+            called periodically with progress (the number of expanded nodes, current depth bound, the number of found routes)
+
+        Returns
+        -------
+        list[tuple[list[str], list[str]]]
+            routes (node_names, topic_names) whose depth between waypoints is the smallest
+        """
+        if len(waypoint_list) < 2:
+            return []
+        entry_list = [(re.compile(node_name), re.compile(topic_name) if topic_name else None)
+                      for node_name, topic_name in entry_list]
+        # index of entry which is matched to each waypoint. Entries until it must be matched when leaving the waypoint
+        waypoint_entry_index_list = []
+        for waypoint in waypoint_list:
+            index_list = [i for i, (node_re, _) in enumerate(entry_list) if node_re.pattern == waypoint]
+            waypoint_entry_index_list.append(index_list[0] if index_list else -1)
+        distance_list = [self._distance_to(waypoint) for waypoint in waypoint_list]
+        deadline = time.monotonic() + timeout if timeout else None
+
+        def match_entry(entry_index: int, node_name: str, sub_topic_name: str, pub_topic_name: str) -> int:
+            while entry_index < len(entry_list):
+                node_re, topic_re = entry_list[entry_index]
+                if not node_re.fullmatch(node_name):
+                    break
+                if topic_re and not ((sub_topic_name and topic_re.fullmatch(sub_topic_name))
+                                     or (pub_topic_name and topic_re.fullmatch(pub_topic_name))):
+                    break
+                entry_index += 1
+            return entry_index
+
+        route_list: list[tuple[list[str], list[str]]] = []
+        best_depth = max_depth
+        node_names = [waypoint_list[0]]
+        topic_names: list[str] = []
+        visited = {waypoint_list[0]}
+        expand_count = 0
+
+        def visit(node_name: str, waypoint_index: int, segment_depth: int, route_depth: int, entry_index: int,
+                  required_entry_index: int):
+            """waypoint_index: index of waypoint to go next, required_entry_index: entry index to be reached when leaving this node"""
+            nonlocal best_depth, expand_count
+            expand_count += 1
+            if expand_count % 1000 == 0:
+                progress = {'expanded_num': expand_count, 'depth_bound': best_depth, 'found_num': len(route_list)}
+                if progress_callback:
+                    progress_callback(progress)
+                if deadline and time.monotonic() > deadline:
+                    raise PathSearchTimeout('Timeout', progress)
+            sub_topic_name = topic_names[-1] if topic_names else None
+            if waypoint_index == len(waypoint_list):
+                if match_entry(entry_index, node_name, sub_topic_name, None) == len(entry_list):
+                    if route_depth < best_depth:
+                        route_list.clear()
+                        best_depth = route_depth
+                    route_list.append((node_names.copy(), topic_names.copy()))
+                return
+            distance = distance_list[waypoint_index]
+            for topic_name, next_node_name in self._edge_dict.get(node_name, []):
+                if next_node_name in visited:
+                    continue
+                next_segment_depth = segment_depth + 1
+                if next_segment_depth + distance.get(next_node_name, math.inf) > best_depth:
+                    continue
+                next_entry_index = match_entry(entry_index, node_name, sub_topic_name, topic_name)
+                if next_entry_index < required_entry_index:
+                    # entries until the last waypoint must have been matched
+                    continue
+                next_waypoint_index = waypoint_index
+                next_route_depth = route_depth
+                next_required_entry_index = required_entry_index
+                if next_node_name == waypoint_list[waypoint_index]:
+                    next_required_entry_index = waypoint_entry_index_list[waypoint_index] + 1
+                    next_waypoint_index += 1
+                    next_route_depth = max(route_depth, next_segment_depth)
+                    next_segment_depth = 0
+                visited.add(next_node_name)
+                node_names.append(next_node_name)
+                topic_names.append(topic_name)
+                visit(next_node_name, next_waypoint_index, next_segment_depth, next_route_depth, next_entry_index,
+                      next_required_entry_index)
+                visited.discard(next_node_name)
+                node_names.pop()
+                topic_names.pop()
+
+        # The first waypoint is the start node
+        visit(waypoint_list[0], 1, 0, 0, 0, waypoint_entry_index_list[0] + 1)
+        return sorted(route_list)
+
+    def to_path_struct(self, route: tuple[list[str], list[str]]) -> list:
+        """Convert route into PathStructValue (multiple if there are multiple node paths in the same route)"""
+        node_names, topic_names = route
+        # Each hop of the route is a direct communication, so CARET only needs to check adjacent nodes
+        candidate_list = self.arch.search_paths(*node_names, max_node_depth=2,
+                                                node_filter=self.node_filter, communication_filter=self.comm_filter)
+        return [path for path in candidate_list
+                if list(path.node_names) == node_names and list(path.topic_names) == topic_names]
+
+    def to_path_struct_list(self, route_list: list[tuple[list[str], list[str]]],
+                            progress_callback: Callable[[dict], None]=None) -> list[list | str]:
+        """Convert each route by to_path_struct. Error message (str) is returned for a route which fails"""
+        result_list = []
+        for index, route in enumerate(route_list):
+            try:
+                result_list.append(self.to_path_struct(route))
+            except Exception as e:
+                result_list.append(f'{type(e).__name__}: {e}')
+            if progress_callback:
+                progress_callback({'converted_route_num': index + 1, 'route_num': len(route_list)})
+        return result_list
+
+
+class PathSearchCache:
+    """Cache of path search results (routes) across runs
+
+    Key is hash of communication graph used for search and search arguments, so results are reused
+    as long as node/topic graph is the same (e.g. the same build of the application).
+    Routes are converted into PathStructValue by PathSearcher.to_path_struct every time, so message contexts are up-to-date
+    """
+    SCHEMA_VERSION = 1
+
+    def __init__(self, cache_dir: str, path_searcher: PathSearcher):
+        self.cache_dir = cache_dir
+        self.fingerprint = path_searcher.fingerprint()
+
+    def make_key(self, search_args: tuple) -> str:
+        key_src = [self.SCHEMA_VERSION, self.fingerprint, list(search_args)]
+        return hashlib.sha1(json.dumps(key_src).encode()).hexdigest()
+
+    def load(self, search_args: tuple) -> list[tuple[list[str], list[str]]] | None:
+        """Load routes. None if not cached"""
+        try:
+            with open(f'{self.cache_dir}/{self.make_key(search_args)}.json', encoding='utf-8') as f_json:
+                cache = json.load(f_json)
+            return [(node_names, topic_names) for node_names, topic_names in cache['route_list']]
+        except:
+            return None
+
+    def save(self, search_args: tuple, route_list: list[tuple[list[str], list[str]]]):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cache_path = f'{self.cache_dir}/{self.make_key(search_args)}.json'
+        tmp_cache_path = f'{cache_path}.tmp{os.getpid()}'
+        with open(tmp_cache_path, 'w', encoding='utf-8') as f_json:
+            json.dump({'search_args': list(search_args), 'route_list': route_list}, f_json)
+        os.replace(tmp_cache_path, cache_path)
+
+
+def _get_rss_mb(pid: int) -> float:
+    """Resident set size [MB] of process (0 if unknown)"""
+    try:
+        with open(f'/proc/{pid}/status', encoding='utf-8') as f_status:
+            for line in f_status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except:
+        pass
+    return 0
+
+
+def _get_private_dirty_mb(pid: int) -> float | None:
+    """Private dirty memory [MB] of process, i.e. pages written by the process itself (None if unknown)
+
+    Pages inherited by fork are not counted until the process writes them (copy-on-write)
+    """
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', encoding='utf-8') as f_smaps:
+            for line in f_smaps:
+                if line.startswith('Private_Dirty:'):
+                    return int(line.split()[1]) / 1024
+    except:
+        pass
+    return None
+
+
+def _search_worker(conn, func: Callable, args: tuple):
+    last_sent_time = 0.0
+
+    def send_progress(progress: dict):
+        nonlocal last_sent_time
+        if time.monotonic() - last_sent_time > 0.5:
+            last_sent_time = time.monotonic()
+            conn.send(('progress', progress))
+
+    try:
+        conn.send(('result', func(*args, progress_callback=send_progress)))
+    except PathSearchAborted as e:
+        # Exception type and progress are sent as they are, because custom exceptions lose progress by pickle
+        conn.send(('aborted', (type(e), str(e), e.progress)))
+    except Exception as e:
+        conn.send(('error', str(e)))
+    conn.close()
+
+
+class _SearchWorker:
+    """Forked worker process running a method of PathSearcher (e.g. search) for a search"""
+    def __init__(self, index: int, func: Callable, args: tuple, timeout: float):
+        self.index = index
+        self.progress = {}
+        self.conn, send_conn = multiprocessing.Pipe(duplex=False)
+        self.proc = multiprocessing.get_context('fork').Process(
+            target=_search_worker, args=(send_conn, func, args), daemon=True)
+        self.proc.start()
+        send_conn.close()
+        self.deadline = time.monotonic() + timeout if timeout else None
+        # RSS just after fork includes pages shared with this process. It's used if smaps_rollup is not available
+        self.base_rss_mb = _get_rss_mb(self.proc.pid)
+
+    def get_memory_usage_mb(self) -> float:
+        """Memory [MB] used by the worker after fork (pages shared with this process are not counted)"""
+        private_dirty_mb = _get_private_dirty_mb(self.proc.pid)
+        if private_dirty_mb is not None:
+            return private_dirty_mb
+        return max(_get_rss_mb(self.proc.pid) - self.base_rss_mb, 0)
+
+    def stop(self):
+        self.conn.close()
+        if self.proc.is_alive():
+            os.kill(self.proc.pid, signal.SIGKILL)
+        self.proc.join()
+
+
+def search_list_in_process(path_searcher: PathSearcher, search_args_list: list[tuple], jobs: int=1,
+                           timeout: float=None, memory_limit_mb: float=0, logger=None) -> list:
+    """Run PathSearcher.search for each search in forked worker processes supervised by this process
+
+    Up to jobs workers run at the same time. Each worker is killed when it exceeds timeout [sec] from its start
+    or memory_limit_mb (memory [MB] used after fork, 0 for unlimited), so a bad search doesn't keep consuming CPU and memory
+    after it's given up. Memory inherited from this process (e.g. architecture) is not counted
+
+    Parameters
+    ----------
+    search_args_list : list[tuple]
+        arguments of PathSearcher.search (waypoint_list, entry_list, max_depth)
+
+    Returns
+    -------
+    list
+        routes, or PathSearchAborted (PathSearchTimeout, PathSearchMemoryExceeded) with the last reported progress,
+        in the same order as search_args_list
+    """
+    return _run_list_in_process(path_searcher.search, search_args_list, jobs, timeout, memory_limit_mb, logger)
+
+
+def to_path_struct_list_in_process(path_searcher: PathSearcher, route_list_list: list[list], jobs: int=1,
+                                   timeout: float=None, memory_limit_mb: float=0, logger=None) -> list:
+    """Run PathSearcher.to_path_struct_list for routes of each search in forked worker processes (see search_list_in_process)
+
+    Conversion searches paths in CARET architecture, so it's supervised by the same timeout and memory limit as search
+
+    Returns
+    -------
+    list
+        result of to_path_struct_list, or PathSearchAborted, in the same order as route_list_list
+    """
+    return _run_list_in_process(path_searcher.to_path_struct_list, [(route_list,) for route_list in route_list_list],
+                                jobs, timeout, memory_limit_mb, logger)
+
+
+def _run_list_in_process(func: Callable, args_list: list[tuple], jobs: int=1,
+                         timeout: float=None, memory_limit_mb: float=0, logger=None) -> list:
+    result_list = [None] * len(args_list)
+    waiting_index_list = list(range(len(args_list)))
+    worker_list: list[_SearchWorker] = []
+    try:
+        while waiting_index_list or worker_list:
+            while waiting_index_list and len(worker_list) < max(jobs, 1):
+                index = waiting_index_list.pop(0)
+                worker_list.append(_SearchWorker(index, func, args_list[index], timeout))
+            multiprocessing.connection.wait([worker.conn for worker in worker_list], timeout=0.5)
+            for worker in worker_list.copy():
+                result = None
+                # Check liveness before poll, so that the result sent just before exit is not missed
+                is_alive = worker.proc.is_alive()
+                if worker.conn.poll():
+                    try:
+                        kind, value = worker.conn.recv()
+                        if kind == 'progress':
+                            worker.progress = value
+                            if logger:
+                                logger.debug(f'search progress ({worker.index}): {worker.progress}')
+                        elif kind == 'result':
+                            result = value
+                        elif kind == 'aborted':
+                            exception_type, message, progress = value
+                            result = exception_type(message, progress)
+                        else:
+                            result = PathSearchAborted(f'Search failed: {value}', worker.progress)
+                    except EOFError:
+                        result = PathSearchAborted(f'Search process exited unexpectedly (exit code: {worker.proc.exitcode})', worker.progress)
+                elif not is_alive:
+                    result = PathSearchAborted(f'Search process exited unexpectedly (exit code: {worker.proc.exitcode})', worker.progress)
+                if result is None and worker.deadline and time.monotonic() > worker.deadline:
+                    result = PathSearchTimeout(f'Timeout ({timeout} sec)', worker.progress)
+                if result is None and memory_limit_mb > 0:
+                    memory_mb = worker.get_memory_usage_mb()
+                    if memory_mb > memory_limit_mb:
+                        result = PathSearchMemoryExceeded(f'Memory limit exceeded ({memory_mb:.0f} MB > {memory_limit_mb} MB)', worker.progress)
+                if result is not None:
+                    result_list[worker.index] = result
+                    worker.stop()
+                    worker_list.remove(worker)
+    finally:
+        for worker in worker_list:
+            worker.stop()
+    return result_list
+
+
+def search_in_process(path_searcher: PathSearcher, waypoint_list: list[str], entry_list: list[tuple[str, str]], max_depth: int,
+                      timeout: float=None, memory_limit_mb: float=0, logger=None) -> list[tuple[list[str], list[str]]]:
+    """Run PathSearcher.search in a forked worker process (see search_list_in_process)
+
+    PathSearchTimeout or PathSearchMemoryExceeded is raised if the worker is killed
+    """
+    result = search_list_in_process(path_searcher, [(waypoint_list, entry_list, max_depth)], 1, timeout, memory_limit_mb, logger)[0]
+    if isinstance(result, PathSearchAborted):
+        raise result
+    return result
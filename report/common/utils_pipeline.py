@@ -0,0 +1,274 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Shared steps of report drivers (analyze_all, validate_all, report_all)
+"""
+from __future__ import annotations
+import os
+import shutil
+import argparse
+from distutils.util import strtobool
+import logging
+from caret_analyze import Architecture, Application, Lttng
+from common.utils import read_trace_data, read_trace_data_duration, rewindow_trace_data
+from common.utils import create_architecture_from_lttng, load_architecture, load_trace_cache, GraphExporter, TraceCache
+from common.utils_aggregate import TraceAggregate, load_trace_aggregate_by_chunk
+from common.utils_validation import GraphOnDemand
+from analyze_path import add_path_to_architecture, analyze_path
+from find_valid_duration import find_valid_duration
+
+
+def add_report_arguments(parser: argparse.ArgumentParser):
+    """Add arguments shared by report drivers"""
+    parser.add_argument('trace_data', nargs=1, type=str)
+    parser.add_argument('dest_dir', nargs=1, type=str,
+                        help='Directory of report (architecture and path report are created here)')
+    parser.add_argument('--sub_trace_data', type=str, default='')
+    parser.add_argument('--component_list_json', type=str, default='')
+    parser.add_argument('--start_strip', type=float, default=0.0,
+                        help='Start strip [sec] to load trace data')
+    parser.add_argument('--end_strip', type=float, default=0.0,
+                        help='End strip [sec] to load trace data')
+    parser.add_argument('--sim_time', type=strtobool, default=False)
+    parser.add_argument('--is_path_analysis_only', type=strtobool, default=False)
+    parser.add_argument('--trace_cache_dir', type=str, default='',
+                        help='Directory to store timestamps extracted from trace data (disabled if empty)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='The number of processes to analyze in parallel')
+    parser.add_argument('--export_jobs', type=int, default=0,
+                        help='The number of processes to export graphs in background (0: export in the main process)')
+    parser.add_argument('--chunk_duration', type=float, default=0.0,
+                        help='Duration [sec] of time window to read trace data chunk by chunk to bound memory usage (0: read all at once). '
+                             'Trace data is read once per window, so it takes longer. Windows are processed by --jobs processes')
+    parser.add_argument('-f', '--force', action='store_true', default=False,
+                        help='Overwrite report directory')
+    parser.add_argument('-v', '--verbose', action='store_true', default=False)
+
+    # options for add_path
+    parser.add_argument('--target_path_json', type=str, default='target_path.json')
+    parser.add_argument('--architecture_file', type=str, default='architecture.yaml')
+    parser.add_argument('--architecture_file_path', type=str, default='architecture_path.yaml')
+    parser.add_argument('--use_latest_message', action='store_true', default=True)
+    parser.add_argument('--max_node_depth', type=int, default=15)
+    parser.add_argument('--timeout', type=int, default=120)
+    parser.add_argument('--search_memory_limit', type=float, default=0,
+                        help='Memory limit [MB] of each path search process, excluding memory shared with the parent process (0: unlimited)')
+    parser.add_argument('--search_jobs', type=int, default=1,
+                        help='The number of processes to search target paths in parallel')
+    parser.add_argument('--path_search_cache_dir', type=str, default='',
+                        help='Directory to store path search results reused across runs (disabled if empty)')
+
+    # options for path analysis
+    parser.add_argument('-m', '--message_flow', type=strtobool, default=False,
+                        help='Output message flow graph')
+    parser.add_argument('--message_flow_window', type=strtobool, default=False,
+                        help='Keep events in memory to create the short message flow from events around it (faster for long traces, but uses more memory)')
+
+    # options for find_valid_duration
+    parser.add_argument('--find_valid_duration', type=strtobool, default=False)
+    parser.add_argument('--duration', type=float, default=1200.0,
+                        help='Duration [sec] to load trace data')
+    parser.add_argument('--skip_first_num', type=int, default=1,
+                        help='The number to skip the first n-th trace data')
+
+
+def add_validation_arguments(parser: argparse.ArgumentParser):
+    """Add arguments shared by report drivers which validate"""
+    parser.add_argument('--callback_list_filename', type=str, default='callback_list.csv')
+    parser.add_argument('--topic_list_filename', type=str, default='topic_list.csv')
+    parser.add_argument('--expectation_topic_csv_filename', type=str, default='expectation_topic.csv')
+    parser.add_argument('--expectation_callback_csv_filename', type=str, default='expectation_callback.csv')
+    parser.add_argument('--graph_mode', type=str, default='all', choices=['all', 'failed'],
+                        help='failed: export graphs of FAILED/NOT_MEASURED items only, and defer the others (see export_deferred_graphs.py)')
+    parser.add_argument('--graph_allowlist', type=str, default='',
+                        help='Regular expression of topic/node names whose graphs are always exported in failed graph mode')
+
+
+def prepare_report_arguments(args, logger: logging.Logger):
+    """Normalize and log arguments added by add_report_arguments"""
+    args.trace_data = args.trace_data[0]
+    logger.debug(f'trace_data: {args.trace_data}')
+    args.dest_dir = args.dest_dir[0]
+    logger.debug(f'dest_dir: {args.dest_dir}')
+    logger.debug(f'sub_trace_data: {args.sub_trace_data}')
+    logger.debug(f'component_list_json: {args.component_list_json}')
+    logger.debug(f'start_strip: {args.start_strip}, end_strip: {args.end_strip}')
+    logger.debug(f'sim_time: {args.sim_time}')
+    logger.debug(f'is_path_analysis_only: {args.is_path_analysis_only}')
+    logger.debug(f'trace_cache_dir: {args.trace_cache_dir}')
+    logger.debug(f'jobs: {args.jobs}')
+    logger.debug(f'export_jobs: {args.export_jobs}')
+    logger.debug(f'chunk_duration: {args.chunk_duration}')
+    logger.debug(f'target_path_json: {args.target_path_json}')
+    if not os.path.isabs(args.architecture_file):
+        args.architecture_file = os.path.join(args.dest_dir, args.architecture_file)
+    logger.debug(f'architecture_file: {args.architecture_file}')
+    if not os.path.isabs(args.architecture_file_path):
+        args.architecture_file_path = os.path.join(args.dest_dir, args.architecture_file_path)
+    logger.debug(f'architecture_file_path: {args.architecture_file_path}')
+    logger.debug(f'use_latest_message: {args.use_latest_message}')
+    logger.debug(f'max_node_depth: {args.max_node_depth}')
+    logger.debug(f'timeout: {args.timeout}')
+    logger.debug(f'search_memory_limit: {args.search_memory_limit}')
+    logger.debug(f'search_jobs: {args.search_jobs}')
+    logger.debug(f'path_search_cache_dir: {args.path_search_cache_dir}')
+    args.message_flow = True if args.message_flow == 1 else False
+    logger.debug(f'message_flow: {args.message_flow}')
+    logger.debug(f'message_flow_window: {args.message_flow_window}')
+    logger.debug(f'find_valid_duration: {args.find_valid_duration}')
+    logger.debug(f'duration: {args.duration}')
+    logger.debug(f'skip_first_num: {args.skip_first_num}')
+
+
+def prepare_validation_arguments(args, logger: logging.Logger):
+    """Log arguments added by add_validation_arguments, and configure graph export of validation"""
+    logger.debug(f'callback_list_filename: {args.callback_list_filename}')
+    logger.debug(f'topic_list_filename: {args.topic_list_filename}')
+    logger.debug(f'expectation_topic_csv_filename: {args.expectation_topic_csv_filename}')
+    logger.debug(f'expectation_callback_csv_filename: {args.expectation_callback_csv_filename}')
+    logger.debug(f'graph_mode: {args.graph_mode}, graph_allowlist: {args.graph_allowlist}')
+    GraphOnDemand.configure(args.graph_mode, args.graph_allowlist)
+
+
+def share_files(src_dir: str, dst_dir: str, name_list: list[str], logger: logging.Logger):
+    """Copy files or directories created for one report to the other report"""
+    for name in name_list:
+        src_path = os.path.join(src_dir, name)
+        dst_path = os.path.join(dst_dir, name)
+        if not os.path.exists(src_path):
+            continue
+        logger.debug(f'Copy {src_path} to {dst_path}')
+        if os.path.isdir(src_path):
+            if os.path.exists(dst_path):
+                shutil.rmtree(dst_path)
+            shutil.copytree(src_path, dst_path)
+        else:
+            shutil.copy2(src_path, dst_path)
+
+
+def create_trace_aggregate(args, arch: Architecture, arch_path: Architecture, lttng: Lttng,
+                           base_timestamp: int, begin_timestamp: int, end_timestamp: int) -> TraceAggregate:
+    """Create aggregate of callbacks, communications and paths starting in [begin_timestamp, end_timestamp) [ns] of a window of trace data"""
+    trace_aggregate = TraceAggregate.from_app(Application(arch, lttng), base_timestamp, begin_timestamp, end_timestamp)
+    stacked_bar_dict = {}
+    response_time_dict = analyze_path.extract_response_time(args, arch_path, Application(arch_path, lttng), stacked_bar_dict)
+    trace_aggregate.set_path_group(response_time_dict, stacked_bar_dict, begin_timestamp, end_timestamp)
+    return trace_aggregate
+
+
+def read_trace_data_for_report(args, trace_data: str | list[str], arch: Architecture, arch_path: Architecture,
+                               logger: logging.Logger) -> tuple[Lttng, TraceAggregate | None]:
+    """Read trace data to be analyzed, applying valid duration (find_valid_duration) to args.start_strip and args.end_strip
+
+    In chunked mode (args.chunk_duration > 0), trace data is walked window by window and aggregated (see common.utils_aggregate),
+    and only the middle window is returned as trace data for graphs of CARET (message flow, stacked bar)
+    """
+    if args.chunk_duration > 0 and args.sim_time:
+        logger.warning('sim_time is not supported in chunked mode. Trace data is read at once')
+        args.chunk_duration = 0
+
+    if args.chunk_duration > 0:
+        # Find duration to be analyzed, reading trace data window by window until the paths start
+        #  Note: each window reads the whole trace data in CARET, so chunked mode is slower than reading at once
+        if args.find_valid_duration:
+            valid_start, valid_end = find_valid_duration.analyze_by_chunk(args, trace_data, arch_path, args.chunk_duration)
+            args.start_strip = valid_start + args.start_strip
+            args.end_strip = valid_end + args.end_strip
+            logger.info(f'Find valid duration. start_strip: {args.start_strip}, end_strip: {args.end_strip}')
+        trace_aggregate, lttng = load_trace_aggregate_by_chunk(
+            args.trace_cache_dir, trace_data, args.start_strip, args.end_strip, args.chunk_duration,
+            lambda lttng_window, base_timestamp, begin_timestamp, end_timestamp: create_trace_aggregate(
+                args, arch, arch_path, lttng_window, base_timestamp, begin_timestamp, end_timestamp), logger, args.jobs)
+        if lttng is None:
+            # Trace aggregate is loaded from cache
+            window_start = max(trace_aggregate.start_point,
+                               (trace_aggregate.start_point + trace_aggregate.end_point - args.chunk_duration) / 2)
+            logger.info(f'Read the middle window of trace data for graphs: {window_start:.1f} - {window_start + args.chunk_duration:.1f} [sec]')
+            lttng = read_trace_data_duration(trace_data, window_start, args.chunk_duration)
+        return lttng, trace_aggregate
+
+    # Read trace data
+    #  Events are kept in memory to apply the valid duration found below without reading trace data again,
+    #  and to extract the short message flow window of each path without processing the whole records (message_flow_window)
+    start_strip, end_strip = (0, 0) if args.find_valid_duration else (args.start_strip, args.end_strip)
+    lttng = read_trace_data(trace_data, start_strip, end_strip, False,
+                            store_events=args.find_valid_duration or args.message_flow_window)
+
+    # Find duration to be analyzed
+    #  Run path analysis and find start point(sec) where the topic runs in the paths
+    if args.find_valid_duration:
+        app_path = Application(arch_path, lttng)
+        valid_start, valid_end = find_valid_duration.analyze(args, lttng, arch_path, app_path)
+        args.start_strip = valid_start + args.start_strip
+        args.end_strip = valid_end + args.end_strip
+        logger.info(f'Find valid duration. start_strip: {args.start_strip}, end_strip: {args.end_strip}')
+        logger.info(f'Apply valid duration to trace data')
+        del app_path
+        lttng = rewindow_trace_data(lttng, trace_data, args.start_strip, args.end_strip, logger=logger,
+                                    store_events=args.message_flow_window)
+    return lttng, None
+
+
+def run_report(args, logger: logging.Logger, func_analyze_components, report_dir_list: list[str]=None, keep_trace_cache=False):
+    """Run the pipeline shared by report drivers
+
+    Architecture is created, trace data is read (see read_trace_data_for_report) and paths are analyzed,
+    then func_analyze_components(args, lttng, arch, app, trace_cache, trace_aggregate) analyzes or validates components
+    unless args.is_path_analysis_only.
+    Architecture and path report are created once in args.dest_dir and shared with the other directories in report_dir_list.
+    If keep_trace_cache is True, trace cache is kept in memory even if args.trace_cache_dir is not given
+    """
+    report_dir_list = report_dir_list or [args.dest_dir]
+    trace_data = args.trace_data if args.sub_trace_data == '' else [args.trace_data, args.sub_trace_data]
+
+    # Start graph export processes before reading trace data to keep them small
+    GraphExporter.start(args.export_jobs)
+
+    # Create architecture for path analysis
+    # 　Run add_path_to_architecture in a subprocess to avoid memory leak from search_paths
+    create_architecture_from_lttng(add_path_to_architecture.add_path_to_architecture, args, trace_data)
+    arch = load_architecture(args.architecture_file, logger)
+    arch_path = load_architecture(args.architecture_file_path, logger)
+    for report_dir in report_dir_list:
+        if report_dir != args.dest_dir:
+            share_files(args.dest_dir, report_dir,
+                        [os.path.basename(filename) + ext for filename in [args.architecture_file, args.architecture_file_path]
+                         for ext in ['', '.pickle']], logger)
+
+    # Read trace data, and find duration to be analyzed
+    #  Trace data is aggregated window by window in chunked mode, and only the middle window is kept as lttng
+    lttng, trace_aggregate = read_trace_data_for_report(args, trace_data, arch, arch_path, logger)
+
+    # Analyze paths once, and share the report
+    src_dir = next((report_dir for report_dir in report_dir_list if os.path.exists(report_dir + '/analyze_path/index.html')), None)
+    if src_dir:
+        logger.info(f'Skip creating path report to save time')
+    else:
+        src_dir = args.dest_dir
+        app_path = Application(arch_path, lttng)
+        analyze_path.analyze(args, lttng, arch_path, app_path, src_dir + '/analyze_path', trace_aggregate=trace_aggregate)
+        del app_path
+    for report_dir in report_dir_list:
+        if report_dir != src_dir and not os.path.exists(report_dir + '/analyze_path/index.html'):
+            share_files(src_dir, report_dir, ['analyze_path'], logger)
+
+    if args.is_path_analysis_only:
+        return
+
+    # Extract timestamps of callbacks and communications once. They are shared by analyses (and by worker processes)
+    app = Application(arch, lttng)
+    trace_cache = None if trace_aggregate else load_trace_cache(args.trace_cache_dir, trace_data, args.start_strip, args.end_strip, app, logger)
+    if keep_trace_cache and trace_cache is None and trace_aggregate is None:
+        trace_cache = TraceCache.from_app(app, logger)
+    func_analyze_components(args, lttng, arch, app, trace_cache, trace_aggregate)
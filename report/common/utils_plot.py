@@ -0,0 +1,121 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Utility functions to create graphs from calculated data
+"""
+from __future__ import annotations
+import itertools
+import numpy as np
+import pandas as pd
+from bokeh.plotting import figure
+from bokeh.models import HoverTool
+from bokeh.palettes import Category10_10
+from common.utils_stats import StatsSketch
+
+
+def downsample_minmax(timestamps: np.ndarray, values: np.ndarray, bucket_num: int) -> tuple[np.ndarray, np.ndarray]:
+    """Downsample timeseries by keeping min and max values in each time bucket
+
+    Spikes are kept unlike decimation. The first and the last points are also kept
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    timestamps, values = timestamps[valid], values[valid]
+    if bucket_num <= 0 or len(timestamps) <= bucket_num * 2:
+        return timestamps, values
+    if np.any(timestamps[1:] < timestamps[:-1]):
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, values = timestamps[order], values[order]
+    span = int(timestamps[-1]) - int(timestamps[0]) + 1
+    bucket = (timestamps - timestamps[0]) * bucket_num // span
+    bucket_start = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    bucket_size = np.diff(np.r_[bucket_start, len(bucket)])
+    position = np.arange(len(values))
+    index_list = [[0, len(values) - 1]]
+    for reduce in [np.minimum, np.maximum]:
+        # the first position which has the min (max) value in each bucket
+        is_extreme = values == np.repeat(reduce.reduceat(values, bucket_start), bucket_size)
+        index_list.append(np.minimum.reduceat(np.where(is_extreme, position, len(values)), bucket_start))
+    index = np.unique(np.concatenate(index_list))
+    return timestamps[index], values[index]
+
+
+def timeseries_from_dataframe(df: pd.DataFrame) -> dict:
+    """Convert dataframe of CARET timeseries plot (|timestamp|value|timestamp|value|...) into pairs of value column and (timestamps, values)"""
+    timeseries_dict = {}
+    for i in range(0, len(df.columns) - 1, 2):
+        series = df.iloc[:, [i, i + 1]].dropna()
+        timeseries_dict[df.columns[i + 1]] = (series.iloc[:, 0].to_numpy(dtype=np.int64), series.iloc[:, 1].to_numpy(dtype=float))
+    return timeseries_dict
+
+
+def create_timeseries_figure(timeseries_dict: dict[str, tuple[np.ndarray, np.ndarray]],
+                             y_axis_label: str, width: int=1000, height: int=350, y_range_start: float=None,
+                             x_axis_label: str='system time [s]', max_points: int=2000) -> figure:
+    """Create timeseries graph
+
+    Parameters
+    ----------
+    timeseries_dict : dict[str, tuple[np.ndarray, np.ndarray]]
+        pairs of legend and (timestamps [ns], values)
+    y_axis_label : str
+        label of y axis
+    y_range_start : float
+        start of y axis (auto if None)
+    max_points : int
+        each series is downsampled to about this number of points (min/max in each bucket). 0 to disable
+
+    Returns
+    -------
+    figure
+        graph whose x axis is time [s] from the first timestamp
+    """
+    first_timestamp_list = [int(timestamps[0]) for timestamps, _ in timeseries_dict.values() if len(timestamps) > 0]
+    base_timestamp = min(first_timestamp_list) if len(first_timestamp_list) > 0 else 0
+
+    graph = figure(x_axis_label=x_axis_label, y_axis_label=y_axis_label,
+                   width=width, height=height, active_scroll='wheel_zoom')
+    graph.add_tools(HoverTool(tooltips=[('legend', '$name'), ('x', '@x'), ('y', '@y')]))
+    for (legend, (timestamps, values)), color in zip(timeseries_dict.items(), itertools.cycle(Category10_10)):
+        if len(timestamps) == 0:
+            continue
+        timestamps, values = downsample_minmax(timestamps, values, max_points // 2)
+        x = (timestamps - base_timestamp) * 1e-9
+        graph.line(x, values, legend_label=legend, name=legend, line_color=color, line_width=1)
+        graph.scatter(x, values, legend_label=legend, name=legend, color=color, size=3)
+    if graph.legend:
+        graph.legend.click_policy = 'hide'
+        graph.legend.location = 'top_left'
+    if y_range_start is not None:
+        graph.y_range.start = y_range_start
+    return graph
+
+
+def create_histogram_figure(values: np.ndarray | StatsSketch, x_axis_label: str, title: str='',
+                            width: int=600, height: int=350) -> figure:
+    """Create histogram graph whose y axis is probability
+
+    values can be StatsSketch, so that histogram of trace data aggregated in windows can be created
+    """
+    if not isinstance(values, StatsSketch):
+        values = np.asarray(values, dtype=float)
+        values = StatsSketch.from_values(values, max_exact_num=max(len(values), 1))
+    graph = figure(title=title, x_axis_label=x_axis_label, y_axis_label='Probability',
+                   width=width, height=height)
+    if values.count == 0:
+        return graph
+    hist, edges = values.histogram(100)
+    graph.quad(top=hist, bottom=0, left=edges[:-1], right=edges[1:], fill_alpha=0.5, line_color='white')
+    return graph
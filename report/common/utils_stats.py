@@ -0,0 +1,204 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Mergeable statistics (avg/std/min/max/quantile) with bounded memory
+"""
+from __future__ import annotations
+import math
+import numpy as np
+import pandas as pd
+
+
+class StatsSketch:
+    """Summary of values to calculate avg/std/min/max/quantile
+
+    Values are kept as they are up to max_exact_num, so the result is the same as pandas.
+    Once the number of values exceeds max_exact_num, values are folded into a log scale histogram
+    (like DDSketch) whose memory is bounded by the range of values rather than their number
+    (about 3500 buckets for values spanning 1000x with the default accuracy). Then, quantile (and histogram) is
+    within relative error of relative_accuracy (|estimate - exact| <= relative_accuracy * |exact|),
+    while count/avg/std/min/max are still exact (except for rounding error).
+    max_exact_num is small by default so that memory is bounded even with many sketches.
+    Set it to the number of values for exact quantile of values already in memory.
+    Sketches can be merged (e.g. sketches of time chunks, or sketches returned from worker processes)
+    """
+    DEFAULT_MAX_EXACT_NUM = 10000
+
+    def __init__(self, relative_accuracy: float=0.001, max_exact_num: int=DEFAULT_MAX_EXACT_NUM):
+        self.relative_accuracy = relative_accuracy
+        self.max_exact_num = max_exact_num
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._min = math.inf
+        self._max = -math.inf
+        self._exact_list: list[np.ndarray] = []   # None after folded into histogram
+        self._bucket_dict: dict[int, int] = {}    # positive value: key > 0, negative value: key < 0
+        self._zero_count = 0
+
+    @staticmethod
+    def from_values(values, relative_accuracy: float=0.001, max_exact_num: int=DEFAULT_MAX_EXACT_NUM) -> StatsSketch:
+        sketch = StatsSketch(relative_accuracy, max_exact_num)
+        sketch.add(values)
+        return sketch
+
+    @property
+    def is_exact(self) -> bool:
+        return self._exact_list is not None
+
+    def add(self, values) -> None:
+        """Add values. NaN is ignored"""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self._update_moments(len(values), float(values.mean()), float(((values - values.mean()) ** 2).sum()))
+        self._min = min(self._min, float(values.min()))
+        self._max = max(self._max, float(values.max()))
+        if self.is_exact:
+            self._exact_list.append(values)
+            if self.count > self.max_exact_num:
+                self._fold()
+        else:
+            self._add_to_histogram(values)
+
+    def merge(self, other: StatsSketch) -> None:
+        """Merge other sketch into this sketch"""
+        if other.count == 0:
+            return
+        self._update_moments(other.count, other._mean, other._m2)
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+        if self.is_exact and other.is_exact:
+            self._exact_list.extend(other._exact_list)
+            if self.count > self.max_exact_num:
+                self._fold()
+            return
+        if self.is_exact:
+            self._fold()
+        if other.is_exact:
+            for values in other._exact_list:
+                self._add_to_histogram(values)
+        else:
+            for key, count in other._bucket_dict.items():
+                self._bucket_dict[key] = self._bucket_dict.get(key, 0) + count
+            self._zero_count += other._zero_count
+
+    def mean(self) -> float:
+        if self.is_exact:
+            return float(self._exact_series().mean())
+        return self._mean
+
+    def std(self, ddof: int=1) -> float:
+        if self.is_exact:
+            return float(self._exact_series().std(ddof=ddof))
+        return math.sqrt(self._m2 / (self.count - ddof)) if self.count > ddof else math.nan
+
+    def min(self) -> float:
+        return self._min
+
+    def max(self) -> float:
+        return self._max
+
+    def quantile(self, q: float) -> float:
+        """Quantile with linear interpolation (the same as numpy/pandas default) in exact mode"""
+        if self.is_exact:
+            return float(self._exact_series().quantile(q))
+        values, counts = self._histogram()
+        cumulative_counts = np.cumsum(counts)
+        rank = q * (self.count - 1)
+        lower = self._value_at_rank(values, cumulative_counts, math.floor(rank))
+        upper = self._value_at_rank(values, cumulative_counts, math.ceil(rank))
+        return lower + (upper - lower) * (rank - math.floor(rank))
+
+    def mean_between(self, lower_value: float, upper_value: float) -> tuple[float, int]:
+        """Average and count of values in [lower_value, upper_value]"""
+        if self.is_exact:
+            series = self._exact_series()
+            series = series[(series >= lower_value) & (series <= upper_value)]
+            return float(series.mean()) if len(series) > 0 else math.nan, len(series)
+        values, counts = self._histogram()
+        in_range = (values >= lower_value) & (values <= upper_value)
+        count = int(counts[in_range].sum())
+        return float((values[in_range] * counts[in_range]).sum() / count) if count > 0 else math.nan, count
+
+    def histogram(self, max_bin_num: int=100) -> tuple[np.ndarray, np.ndarray]:
+        """Probability and bin edges (the same as np.histogram with 'auto' bins capped at max_bin_num in exact mode)"""
+        if self.count == 0:
+            return np.empty(0, dtype=float), np.empty(0, dtype=float)
+        if self.is_exact:
+            values = self._exact_series().to_numpy()
+            bin_num = min(len(np.histogram_bin_edges(values, bins='auto')) - 1, max_bin_num)
+            hist, edges = np.histogram(values, bins=bin_num)
+        else:
+            values, counts = self._histogram()
+            hist, edges = np.histogram(np.clip(values, self._min, self._max), bins=max_bin_num,
+                                       range=(self._min, self._max), weights=counts)
+        return hist / self.count, edges
+
+    def _update_moments(self, count: int, mean: float, m2: float) -> None:
+        # Chan's parallel algorithm
+        total = self.count + count
+        delta = mean - self._mean
+        self._mean += delta * count / total
+        self._m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def _exact_series(self) -> pd.Series:
+        if len(self._exact_list) > 1:
+            self._exact_list = [np.concatenate(self._exact_list)]
+        return pd.Series(self._exact_list[0] if self._exact_list else [], dtype=float)
+
+    def _fold(self) -> None:
+        exact_list = self._exact_list
+        self._exact_list = None
+        for values in exact_list:
+            self._add_to_histogram(values)
+
+    def _gamma(self) -> float:
+        return (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+
+    def _add_to_histogram(self, values: np.ndarray) -> None:
+        is_zero = values == 0
+        self._zero_count += int(is_zero.sum())
+        values = values[~is_zero]
+        keys = np.ceil(np.log(np.abs(values)) / math.log(self._gamma())).astype(np.int64)
+        # shift keys so that positive values have positive keys and negative values have negative keys
+        keys = np.where(values > 0, keys + (1 << 32), -(keys + (1 << 32)))
+        for key, count in zip(*np.unique(keys, return_counts=True)):
+            self._bucket_dict[int(key)] = self._bucket_dict.get(int(key), 0) + int(count)
+
+    def _histogram(self) -> tuple[np.ndarray, np.ndarray]:
+        """Representative values (sorted) and counts of buckets"""
+        gamma = self._gamma()
+        keys = np.array(sorted(self._bucket_dict.keys()), dtype=np.int64)
+        counts = np.array([self._bucket_dict[key] for key in keys], dtype=np.int64)
+        exponents = np.abs(keys) - (1 << 32)
+        values = np.sign(keys) * 2 * np.power(gamma, exponents.astype(float)) / (gamma + 1)
+        # sorted keys are in value order for positive values, but reversed for negative values
+        order = np.argsort(values, kind='stable')
+        values, counts = values[order], counts[order]
+        if self._zero_count > 0:
+            index = int(np.searchsorted(values, 0.0))
+            values = np.insert(values, index, 0.0)
+            counts = np.insert(counts, index, self._zero_count)
+        return values, counts
+
+    def _value_at_rank(self, values: np.ndarray, cumulative_counts: np.ndarray, rank: int) -> float:
+        if rank <= 0:
+            return self._min
+        if rank >= self.count - 1:
+            return self._max
+        index = min(int(np.searchsorted(cumulative_counts, rank, side='right')), len(values) - 1)
+        return float(np.clip(values[index], self._min, self._max))
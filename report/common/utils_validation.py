@@ -16,9 +16,14 @@ Utility functions
 """
 from __future__ import annotations
 import os
+import re
+import logging
+import pickle
 from enum import Enum
 import glob
+import numpy as np
 import yaml
+from common.utils import FigureSpec, export_graph
 
 
 class Metrics(Enum):
@@ -35,6 +40,225 @@ class ResultStatus(Enum):
     DONT_CARE = 5
 
 
+class GraphOnDemand:
+    """Export graphs of validation only when they are needed
+
+    In 'failed' mode, graphs are exported only for FAILED/NOT_MEASURED results or names matching allowlist (regular expression).
+    Other graphs (FigureSpec) are appended with their data to DEFERRED_GRAPH_FILENAME in the destination directory,
+    and exported later by export_deferred_graphs (report_validation/export_deferred_graphs.py).
+    All graphs are exported as usual in 'all' mode
+    """
+    DEFERRED_GRAPH_FILENAME = 'deferred_graphs.pickle'
+    mode = 'all'
+    _allowlist_regexp = None
+
+    @classmethod
+    def configure(cls, mode: str, allowlist: str=''):
+        cls.mode = mode
+        cls._allowlist_regexp = re.compile(allowlist) if allowlist else None
+
+    @classmethod
+    def is_required(cls, result_status_list: list[str], name_list: list[str]) -> bool:
+        if cls.mode != 'failed':
+            return True
+        if any(status in (ResultStatus.FAILED.name, ResultStatus.NOT_MEASURED.name) for status in result_status_list):
+            return True
+        return cls._allowlist_regexp is not None and any(cls._allowlist_regexp.search(name) for name in name_list)
+
+    @classmethod
+    def export(cls, figure: FigureSpec, dest_dir: str, filename: str, result_status_list: list[str], name_list: list[str],
+               with_png=True, logger: logging.Logger = None) -> None:
+        """Export graph if required by the results, otherwise defer it"""
+        if cls.is_required(result_status_list, name_list) or not isinstance(figure, FigureSpec):
+            export_graph(figure, dest_dir, filename, with_png=with_png, logger=logger)
+            return
+        with open(f'{dest_dir}/{cls.DEFERRED_GRAPH_FILENAME}', 'ab') as f_deferred:
+            pickle.dump((filename, with_png, figure), f_deferred, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def export_deferred_graphs(report_dir: str, filename_regexp: str='', logger: logging.Logger = None) -> int:
+    """Export graphs deferred by GraphOnDemand in report_dir (recursively). Returns the number of exported graphs
+
+    Graphs whose filename doesn't match filename_regexp are kept deferred
+    """
+    regexp = re.compile(filename_regexp) if filename_regexp else None
+    exported_num = 0
+    for deferred_path in glob.glob(f'{report_dir}/**/{GraphOnDemand.DEFERRED_GRAPH_FILENAME}', recursive=True):
+        dest_dir = os.path.dirname(deferred_path)
+        deferred_list = []
+        with open(deferred_path, 'rb') as f_deferred:
+            while True:
+                try:
+                    deferred_list.append(pickle.load(f_deferred))
+                except EOFError:
+                    break
+        remaining_list = []
+        for filename, with_png, figure in deferred_list:
+            if regexp and not regexp.search(filename):
+                remaining_list.append((filename, with_png, figure))
+                continue
+            export_graph(figure, dest_dir, filename, with_png=with_png, logger=logger)
+            exported_num += 1
+        if remaining_list:
+            with open(deferred_path, 'wb') as f_deferred:
+                for deferred in remaining_list:
+                    pickle.dump(deferred, f_deferred, protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            os.remove(deferred_path)
+    return exported_num
+
+
+class RaggedSeries:
+    """Series of different lengths held as one flat array and offsets, to process all of them in a few vectorized passes
+
+    Series i is values[offsets[i]:offsets[i + 1]]
+    """
+    def __init__(self, values: np.ndarray, offsets: np.ndarray):
+        self.values = np.asarray(values, dtype=float)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @staticmethod
+    def from_list(values_list: list) -> RaggedSeries:
+        values_list = [np.asarray(values, dtype=float) for values in values_list]
+        offsets = np.r_[0, np.cumsum([len(values) for values in values_list], dtype=np.int64)]
+        values = np.concatenate(values_list) if values_list else np.empty(0, dtype=float)
+        return RaggedSeries(values, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def size(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @property
+    def series_id(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self)), self.size)
+
+    def get(self, index: int) -> np.ndarray:
+        return self.values[self.offsets[index]:self.offsets[index + 1]]
+
+    def select(self, index_list: np.ndarray) -> RaggedSeries:
+        """Series of index_list in the order"""
+        index_list = np.asarray(index_list, dtype=np.int64)
+        size = self.size[index_list]
+        offsets = np.r_[0, np.cumsum(size, dtype=np.int64)]
+        # position of each value in the original flat array
+        position = np.repeat(self.offsets[:-1][index_list] - offsets[:-1], size) + np.arange(offsets[-1])
+        return RaggedSeries(self.values[position], offsets)
+
+    def _from_mask(self, keep: np.ndarray) -> RaggedSeries:
+        offsets = np.r_[0, np.cumsum(np.bincount(self.series_id[keep], minlength=len(self)), dtype=np.int64)]
+        return RaggedSeries(self.values[keep], offsets)
+
+    def trail(self, trail_val=0, start_strip_num=0, end_strip_num=0) -> RaggedSeries:
+        """Apply trail_df (common.utils) to each series: drop NaN, leading/trailing trail_val and start/end_strip_num values"""
+        series = self._from_mask(~np.isnan(self.values))
+        series_id = series.series_id
+        size = series.size
+        position = np.arange(len(series.values)) - np.repeat(series.offsets[:-1], size)
+        is_other = series.values != trail_val
+        # the first (last) position which is not trail_val in each series. size if all values are trail_val
+        first_other = np.full(len(series), size)
+        np.minimum.at(first_other, series_id[is_other], position[is_other])
+        last_other = np.full(len(series), -1)
+        np.maximum.at(last_other, series_id[is_other], position[is_other])
+        start = np.where(first_other < size, first_other, size) + start_strip_num
+        # trailing trail_val is counted after the leading ones are removed (0 if nothing remains)
+        trailing_num = np.where(first_other < size, size - 1 - last_other, 0)
+        end = size - trailing_num - end_strip_num
+        keep = (position >= np.repeat(start, size)) & (position < np.repeat(end, size))
+        return series._from_mask(keep)
+
+    def calc_stats(self) -> dict[str, np.ndarray]:
+        """Calculate avg, std, min, max, percentile5_min/max/avg of each series (the same as pandas)
+
+        Values of series with less than 2 values are NaN. percentile5_avg is avg if less than 3 values are in the range
+        """
+        series_num = len(self)
+        size = self.size
+        series_id = self.series_id
+        count = np.maximum(size, 1)
+        avg = np.bincount(series_id, weights=self.values, minlength=series_num) / count
+        deviation = self.values - np.repeat(avg, size)
+        std = np.sqrt(np.bincount(series_id, weights=deviation * deviation, minlength=series_num) / np.maximum(size - 1, 1))
+
+        # sort values in each series, then min/max/quantile are picked by position
+        sorted_values = self.values[np.lexsort((self.values, series_id))]
+        start = self.offsets[:-1]
+        last = np.maximum(self.offsets[1:] - 1, start)
+        stats_dict = {'avg': avg, 'std': std}
+        if len(sorted_values) == 0:
+            sorted_values = np.zeros(1)
+        stats_dict['min'] = sorted_values[np.minimum(start, len(sorted_values) - 1)]
+        stats_dict['max'] = sorted_values[np.minimum(last, len(sorted_values) - 1)]
+        for name, q in [('percentile5_min', 0.05), ('percentile5_max', 0.95)]:
+            rank = q * np.maximum(size - 1, 0)
+            lower = np.minimum(start + np.floor(rank).astype(np.int64), len(sorted_values) - 1)
+            upper = np.minimum(start + np.ceil(rank).astype(np.int64), len(sorted_values) - 1)
+            stats_dict[name] = sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - np.floor(rank))
+
+        in_range = (self.values >= np.repeat(stats_dict['percentile5_min'], size)) & \
+                   (self.values <= np.repeat(stats_dict['percentile5_max'], size))
+        in_range_num = np.bincount(series_id[in_range], minlength=series_num)
+        in_range_sum = np.bincount(series_id[in_range], weights=self.values[in_range], minlength=series_num)
+        stats_dict['percentile5_avg'] = np.where(in_range_num > 2, in_range_sum / np.maximum(in_range_num, 1), avg)
+
+        is_valid = size >= 2
+        return {name: np.where(is_valid, values, np.nan) for name, values in stats_dict.items()}
+
+    def calc_limit_violation(self, lower_limit: np.ndarray, upper_limit: np.ndarray) -> dict[str, np.ndarray]:
+        """Calculate ratio and burst num (the longest consecutive count) of values out of limits of each series
+
+        Returns
+        -------
+        dict[str, np.ndarray]
+            ratio_lower_limit, ratio_upper_limit, burst_num_lower_limit and burst_num_upper_limit of each series
+        """
+        series_num = len(self)
+        size = self.size
+        series_id = self.series_id
+        is_series_start = np.zeros(len(self.values) + 1, dtype=bool)
+        is_series_start[self.offsets] = True
+
+        violation_dict = {}
+        for name, mask in [('lower_limit', self.values < np.repeat(lower_limit, size)),
+                           ('upper_limit', self.values > np.repeat(upper_limit, size))]:
+            count = np.bincount(series_id, weights=mask, minlength=series_num)
+            # runs of True don't continue over the boundary of series
+            padded_mask = np.r_[False, mask, False]
+            run_start = np.flatnonzero(padded_mask[1:-1] & (~padded_mask[:-2] | is_series_start[:-1]))
+            run_end = np.flatnonzero(padded_mask[1:-1] & (~padded_mask[2:] | is_series_start[1:]))
+            burst_num = np.zeros(series_num, dtype=np.int64)
+            np.maximum.at(burst_num, series_id[run_start], run_end - run_start + 1)
+            violation_dict[f'ratio_{name}'] = count / np.maximum(size, 1)
+            violation_dict[f'burst_num_{name}'] = burst_num
+        return violation_dict
+
+
+def calc_limit_violation_list(values_list: list, lower_limit_list: list[float],
+                              upper_limit_list: list[float]) -> list[tuple[float, float, int, int]]:
+    """Calculate ratio and burst num (the longest consecutive count) of values out of limits for a batch of series
+
+    Returns
+    -------
+    list[tuple[float, float, int, int]]
+        (ratio_lower_limit, ratio_upper_limit, burst_num_lower_limit, burst_num_upper_limit) for each series
+    """
+    if len(values_list) == 0:
+        return []
+    violation_dict = RaggedSeries.from_list(values_list).calc_limit_violation(lower_limit_list, upper_limit_list)
+    return [(float(ratio_lower), float(ratio_upper), int(burst_lower), int(burst_upper))
+            for ratio_lower, ratio_upper, burst_lower, burst_upper
+            in zip(violation_dict['ratio_lower_limit'], violation_dict['ratio_upper_limit'],
+                   violation_dict['burst_num_lower_limit'], violation_dict['burst_num_upper_limit'])]
+
+
+def calc_limit_violation(values, lower_limit: float, upper_limit: float) -> tuple[float, float, int, int]:
+    """Calculate ratio and burst num of values out of limits (see calc_limit_violation_list)"""
+    return calc_limit_violation_list([values], [lower_limit], [upper_limit])[0]
+
+
 def make_callback_detail_filename(node_name: str):
     return node_name.replace('/', '_')[1:] + '.html'
 
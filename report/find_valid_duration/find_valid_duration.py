@@ -20,10 +20,13 @@ import os
 import datetime
 import argparse
 import logging
+import gc
+import numpy as np
 from caret_analyze import Architecture, Application, Lttng
 from caret_analyze.plot import Plot
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
-from common.utils import create_logger, read_trace_data_duration
+from common.utils import create_logger, read_trace_data_duration, load_architecture
+from common.utils_aggregate import CHUNK_MARGIN
 
 # Suppress log for CARET
 from logging import getLogger, FATAL
@@ -37,20 +40,21 @@ warnings.simplefilter("ignore")
 _logger: logging.Logger = None
 
 
-def analyze_path(app: Application, target_path_name: str, skip_first_num: int):
-    """Analyze a path"""
-    _logger.info(f'Processing: {target_path_name}')
+def get_start_timestamps(app: Application, target_path_name: str):
+    """Get start timestamps [ns] of best case response time of a path"""
     target_path = app.get_path(target_path_name)
     target_path.include_first_callback = False
     target_path.include_last_callback = False
 
     plot_timeseries = Plot.create_response_time_timeseries_plot(target_path, case='best')
+    return plot_timeseries.to_dataframe().iloc[:, 0].to_numpy()
+
 
-    # Find the start time of the path (but choose the second one because the first one could be very long)
-    df = plot_timeseries.to_dataframe()
-    skip_first_num = min(skip_first_num, len(df) - 1)
+def get_start_date_time(target_path_name: str, start_timestamps, skip_first_num: int):
+    """Find the start time of the path (but choose the second one because the first one could be very long)"""
+    skip_first_num = min(skip_first_num, len(start_timestamps) - 1)
     if skip_first_num >= 0:
-        start_time = df.iloc[skip_first_num, 0]
+        start_time = start_timestamps[skip_first_num]
         start_date_time = datetime.datetime.fromtimestamp(start_time * 1.0e-9)
     else:
         start_date_time = None
@@ -58,14 +62,14 @@ def analyze_path(app: Application, target_path_name: str, skip_first_num: int):
     return start_date_time
 
 
-def analyze(args, lttng: Lttng, arch: Architecture, app: Application):
-    """Analyze paths"""
-    global _logger
-    if _logger is None:
-        _logger = create_logger(__name__, logging.DEBUG if args.verbose else logging.INFO)
-    _logger.info('<<< Analyze Paths: Start >>>')
+def analyze_path(app: Application, target_path_name: str, skip_first_num: int):
+    """Analyze a path"""
+    _logger.info(f'Processing: {target_path_name}')
+    return get_start_date_time(target_path_name, get_start_timestamps(app, target_path_name), skip_first_num)
+
 
-    # Verify each path
+def verify_paths(arch: Architecture):
+    """Verify each path"""
     for target_path in arch.paths:
         target_path_name = target_path.path_name
         path = arch.get_path(target_path_name)
@@ -74,15 +78,9 @@ def analyze(args, lttng: Lttng, arch: Architecture, app: Application):
         if not ret_verify:
             sys.exit(-1)
 
-    # Analyze each path
-    start_date_time_list = []
-    for target_path in arch.paths:
-        target_path_name = target_path.path_name
-        start_date_time = analyze_path(app, target_path_name, args.skip_first_num)
-        if start_date_time:
-            start_date_time_list.append(start_date_time)
 
-    bt, et = lttng.get_trace_range()
+def calc_strip(bt: datetime.datetime, et: datetime.datetime, start_date_time_list: list[datetime.datetime], duration: float):
+    """Calculate start strip and end strip [sec] to analyze duration [sec] after all the paths start"""
     lttng_duration = (et - bt).total_seconds()
     _logger.info(f'lttng_bt = {bt}, lttng_et = {et}, lttng_duration = {lttng_duration}')
 
@@ -91,13 +89,87 @@ def analyze(args, lttng: Lttng, arch: Architecture, app: Application):
         start_strip = max(start_strip_list)
     else:
         start_strip = 0.0
-    end_strip = (et - (bt + datetime.timedelta(seconds=start_strip + args.duration))).total_seconds()
+    end_strip = (et - (bt + datetime.timedelta(seconds=start_strip + duration))).total_seconds()
 
     _logger.info(f'start_strip = {start_strip}, end_strip = {end_strip}')
-    _logger.info('<<< Analyze Paths: Finish >>>')
     return max(0, start_strip), max(0, end_strip)
 
 
+def analyze(args, lttng: Lttng, arch: Architecture, app: Application):
+    """Analyze paths"""
+    global _logger
+    if _logger is None:
+        _logger = create_logger(__name__, logging.DEBUG if args.verbose else logging.INFO)
+    _logger.info('<<< Analyze Paths: Start >>>')
+    verify_paths(arch)
+
+    # Analyze each path
+    start_date_time_list = []
+    for target_path in arch.paths:
+        target_path_name = target_path.path_name
+        start_date_time = analyze_path(app, target_path_name, args.skip_first_num)
+        if start_date_time:
+            start_date_time_list.append(start_date_time)
+
+    bt, et = lttng.get_trace_range()
+    start_strip, end_strip = calc_strip(bt, et, start_date_time_list, args.duration)
+    _logger.info('<<< Analyze Paths: Finish >>>')
+    return start_strip, end_strip
+
+
+def analyze_by_chunk(args, trace_data: str | list[str], arch: Architecture, chunk_duration: float):
+    """Analyze paths reading trace data in windows of chunk_duration [sec] until the start of all the paths are found
+
+    Only one window of trace data is loaded at a time (see common.utils_aggregate)
+    """
+    global _logger
+    if _logger is None:
+        _logger = create_logger(__name__, logging.DEBUG if args.verbose else logging.INFO)
+    _logger.info('<<< Analyze Paths: Start >>>')
+    verify_paths(arch)
+
+    target_path_name_list = [target_path.path_name for target_path in arch.paths]
+    start_timestamps_dict = {target_path_name: [] for target_path_name in target_path_name_list}
+    window_start = 0.0
+    while True:
+        _logger.info(f'Read trace data window: {window_start:.1f} - {window_start + chunk_duration:.1f} [sec]')
+        lttng = read_trace_data_duration(trace_data, window_start, chunk_duration + CHUNK_MARGIN)
+        bt, et = lttng.get_trace_range()
+        begin_timestamp = int(bt.timestamp() * 1e9) + int(window_start * 1e9)
+        end_timestamp = begin_timestamp + int(chunk_duration * 1e9)
+        app = Application(arch, lttng)
+        for target_path_name in target_path_name_list:
+            if sum(len(start_timestamps) for start_timestamps in start_timestamps_dict[target_path_name]) > args.skip_first_num:
+                continue
+            _logger.info(f'Processing: {target_path_name}')
+            try:
+                start_timestamps = get_start_timestamps(app, target_path_name)
+            except:
+                _logger.debug(f'  No response time in the window: {target_path_name}')
+                continue
+            # records belong to the window where they start, so that records in the margin are not counted twice
+            start_timestamps_dict[target_path_name].append(
+                start_timestamps[(start_timestamps >= begin_timestamp) & (start_timestamps < end_timestamp)])
+        del app, lttng
+        gc.collect()
+        window_start += chunk_duration
+        is_all_found = all(sum(len(start_timestamps) for start_timestamps in start_timestamps_list) > args.skip_first_num
+                           for start_timestamps_list in start_timestamps_dict.values())
+        if is_all_found or window_start >= (et - bt).total_seconds():
+            break
+
+    start_date_time_list = []
+    for target_path_name, start_timestamps_list in start_timestamps_dict.items():
+        start_timestamps = np.concatenate(start_timestamps_list) if start_timestamps_list else np.empty(0)
+        start_date_time = get_start_date_time(target_path_name, start_timestamps, args.skip_first_num)
+        if start_date_time:
+            start_date_time_list.append(start_date_time)
+
+    start_strip, end_strip = calc_strip(bt, et, start_date_time_list, args.duration)
+    _logger.info('<<< Analyze Paths: Finish >>>')
+    return start_strip, end_strip
+
+
 def parse_arg():
     """Parse arguments"""
     parser = argparse.ArgumentParser(
@@ -127,7 +199,7 @@ def main():
 
     lttng = read_trace_data_duration(args.trace_data[0], 0, args.load_duration, False)
 
-    arch = Architecture('yaml', args.architecture_file_path)
+    arch = load_architecture(args.architecture_file_path, _logger)
     app = Application(arch, lttng)
 
     start_strip, end_strip = analyze(args, lttng, arch, app)
@@ -0,0 +1,89 @@
+#!/bin/sh
+
+# shellcheck disable=SC2154
+
+set -e
+
+# Variable settings
+script_path=$(dirname "$0")/..
+trace_data_name=$(basename "${trace_data}")
+report_dir_name=output/report_"${trace_data_name}"
+val_dir_name=output/val_"${trace_data_name}"
+is_path_analysis_only=${is_path_analysis_only:-false}
+is_html_only=${is_html_only:-false}
+trace_cache_dir=${trace_cache_dir-output/trace_cache}
+jobs=${jobs:-1}
+export_jobs=${export_jobs:-0}
+search_jobs=${search_jobs:-1}
+search_memory_limit=${search_memory_limit:-0}
+path_search_cache_dir=${path_search_cache_dir-output/path_search_cache}
+chunk_duration=${chunk_duration:-0}
+message_flow_window=${message_flow_window:-false}
+graph_mode=${graph_mode:-all}
+graph_allowlist=${graph_allowlist:-}
+find_valid_duration=${find_valid_duration:-false}
+duration=${duration:-1200}
+
+mkdir -p "${report_dir_name}"
+mkdir -p "${val_dir_name}"
+
+# Save misc files
+for dir_name in "${report_dir_name}" "${val_dir_name}"; do
+    if [ -f "${trace_data}"/caret_record_info.yaml ]; then
+        cp "${trace_data}"/caret_record_info.yaml "${dir_name}"/.
+    fi
+    cp "${component_list_json}" "${dir_name}"/.
+    cp "${target_path_json}" "${dir_name}"/.
+done
+cp "${callback_list_csv}" "${val_dir_name}"/.
+
+if ! ${is_html_only}; then
+    # Analyze and validate
+    python3 "${script_path}"/report_all/report_all.py "${trace_data}" "${report_dir_name}" "${val_dir_name}" \
+        --sub_trace_data="${sub_trace_data}" \
+        --component_list_json="${component_list_json}" \
+        --start_strip "${start_strip}" \
+        --end_strip "${end_strip}" \
+        --sim_time "${sim_time}" \
+        --target_path_json="${target_path_json}" \
+        --max_node_depth="${max_node_depth}" \
+        --timeout="${timeout}" \
+        --search_jobs="${search_jobs}" \
+        --search_memory_limit="${search_memory_limit}" \
+        --path_search_cache_dir="${path_search_cache_dir}" \
+        --find_valid_duration="${find_valid_duration}" \
+        --duration="${duration}" \
+        --callback_list_filename="${callback_list_csv}" \
+        --topic_list_filename="topic_list.csv" \
+        --expectation_topic_csv_filename="topic_list_pubsub.csv" \
+        --expectation_callback_csv_filename="${callback_list_csv}" \
+        --is_path_analysis_only="${is_path_analysis_only}" \
+        --trace_cache_dir="${trace_cache_dir}" \
+        --jobs="${jobs}" \
+        --export_jobs="${export_jobs}" \
+        --chunk_duration="${chunk_duration}" \
+        --message_flow_window="${message_flow_window}" \
+        --graph_mode="${graph_mode}" \
+        --graph_allowlist="${graph_allowlist}" \
+        -f -v
+fi
+
+# Make html pages of analysis report
+python3 "${script_path}"/analyze_node/make_report_analyze_node.py "${report_dir_name}"
+python3 "${script_path}"/analyze_path/make_report_analyze_path.py "${report_dir_name}"
+python3 "${script_path}"/track_path/make_report_track_path.py "${report_dir_name}" "${report_store_dir}" --relpath_from_report_store_dir="${relpath_from_report_store_dir}"
+python3 "${script_path}"/analyze_topic/make_report_analyze_topic.py "${report_dir_name}"
+python3 "${script_path}"/report_analysis/make_html_analysis.py "${trace_data}" "${report_dir_name}" --note_text_top "${note_text_top}" --note_text_bottom "${note_text_bottom}" --num_back 3
+
+# Make html pages of validation report
+python3 "${script_path}"/validate_callback/make_report_validate_callback.py "${val_dir_name}" --component_list_json="${component_list_json}"
+python3 "${script_path}"/validate_topic/make_report_validate_topic.py "${val_dir_name}" --component_list_json="${component_list_json}"
+if ! ${is_path_analysis_only} && ! ${is_html_only}; then
+    python3 "${script_path}"/trace_validation_failure/make_report_trace_validation_failure.py "${val_dir_name}"
+fi
+python3 "${script_path}"/validate_callback/make_report_validate_callback.py "${val_dir_name}" --component_list_json="${component_list_json}"
+python3 "${script_path}"/analyze_path/make_report_analyze_path.py "${val_dir_name}"
+python3 "${script_path}"/track_path/make_report_track_path.py "${val_dir_name}" "${report_store_dir}" --relpath_from_report_store_dir="${relpath_from_report_store_dir}"
+python3 "${script_path}"/report_validation/make_html_validation.py "${trace_data}" "${val_dir_name}" --component_list_json="${component_list_json}" --note_text_top="${note_text_top}" --note_text_bottom="${note_text_bottom}" --num_back=3
+
+echo "<<< OK. All report pages are created >>>"
@@ -0,0 +1,75 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Script to make analysis reports and validation reports from one trace load
+"""
+from __future__ import annotations
+import sys
+import os
+import argparse
+import logging
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
+from common.utils import create_logger, make_destination_dir
+from common.utils_pipeline import add_report_arguments, add_validation_arguments
+from common.utils_pipeline import prepare_report_arguments, prepare_validation_arguments, run_report
+from analyze_node import analyze_node
+from analyze_topic import analyze_topic
+from validate_topic import generate_expectation_list, validate_topic
+from validate_callback import validate_callback
+
+
+def parse_arg():
+    """Parse arguments"""
+    parser = argparse.ArgumentParser(
+                description='Script to make analysis reports and validation reports')
+    add_report_arguments(parser)
+    parser.add_argument('validation_dir', nargs=1, type=str,
+                        help='Directory of validation report')
+
+    # options for validation
+    add_validation_arguments(parser)
+
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    """Main function"""
+    args = parse_arg()
+    logger = create_logger(__name__, logging.DEBUG if args.verbose else logging.INFO)
+    prepare_report_arguments(args, logger)
+    args.validation_dir = args.validation_dir[0]
+    logger.debug(f'validation_dir: {args.validation_dir}')
+    prepare_validation_arguments(args, logger)
+    make_destination_dir(args.validation_dir, False, logger)
+
+    def analyze_and_validate_components(args, lttng, arch, app, trace_cache, trace_aggregate):
+        xaxis_type = 'sim_time' if args.sim_time else 'system_time'
+
+        # Analyze
+        analyze_node.analyze(args, lttng, arch, app, args.dest_dir + '/analyze_node', trace_cache, trace_aggregate)
+        analyze_topic.analyze(args, lttng, arch, app, args.dest_dir + '/analyze_topic', trace_cache, trace_aggregate)
+
+        # Validate
+        generate_expectation_list.create_topic_from_callback(args.callback_list_filename, args.validation_dir, args.topic_list_filename)
+        generate_expectation_list.generate_list(args.verbose, arch, args.validation_dir, args.component_list_json, args.topic_list_filename, args.expectation_topic_csv_filename)
+        validate_topic.validate(args.verbose, arch, app, args.validation_dir, args.force, args.component_list_json, os.path.join(args.validation_dir, args.expectation_topic_csv_filename), xaxis_type, trace_cache, args.jobs, trace_aggregate)
+        validate_callback.validate(args.verbose, arch, app, args.validation_dir, args.force, args.component_list_json, args.expectation_callback_csv_filename, xaxis_type, trace_cache, args.jobs, trace_aggregate)
+
+    # Architecture, trace data, path report and trace cache are created once and shared by both reports
+    run_report(args, logger, analyze_and_validate_components, [args.dest_dir, args.validation_dir], keep_trace_cache=True)
+
+
+if __name__ == '__main__':
+    main()
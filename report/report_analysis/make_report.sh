@@ -12,6 +12,14 @@ report_dir_name=output/report_"${trace_data_name}"
 another_report_dir_name=output/val_"${trace_data_name}"
 is_path_analysis_only=${is_path_analysis_only:-false}
 is_html_only=${is_html_only:-false}
+trace_cache_dir=${trace_cache_dir-output/trace_cache}
+jobs=${jobs:-1}
+export_jobs=${export_jobs:-0}
+search_jobs=${search_jobs:-1}
+search_memory_limit=${search_memory_limit:-0}
+path_search_cache_dir=${path_search_cache_dir-output/path_search_cache}
+chunk_duration=${chunk_duration:-0}
+message_flow_window=${message_flow_window:-false}
 
 mkdir -p "${report_dir_name}"
 
@@ -43,9 +51,17 @@ if ${use_python}; then
             --target_path_json="${target_path_json}" \
             --max_node_depth="${max_node_depth}" \
             --timeout="${timeout}" \
+            --search_jobs="${search_jobs}" \
+            --search_memory_limit="${search_memory_limit}" \
+            --path_search_cache_dir="${path_search_cache_dir}" \
             --find_valid_duration="${find_valid_duration}" \
             --duration="${duration}" \
             --is_path_analysis_only="${is_path_analysis_only}" \
+            --trace_cache_dir="${trace_cache_dir}" \
+            --jobs="${jobs}" \
+            --export_jobs="${export_jobs}" \
+            --chunk_duration="${chunk_duration}" \
+            --message_flow_window="${message_flow_window}" \
             -f -v
     fi
 
@@ -57,8 +73,8 @@ if ${use_python}; then
     python3 "${script_path}"/report_analysis/make_html_analysis.py "${trace_data}" "${report_dir_name}" --note_text_top "${note_text_top}" --note_text_bottom "${note_text_bottom}" --num_back 3
 else
     # Path analysis
-    python3 "${script_path}"/analyze_path/add_path_to_architecture.py "${trace_data}" --target_path_json="${target_path_json}" --architecture_file_path=architecture_path.yaml --max_node_depth="${max_node_depth}" --timeout="${timeout}" -v
-    python3 "${script_path}"/analyze_path/analyze_path.py "${trace_data}" "${report_dir_name}" --architecture_file_path=architecture_path.yaml --start_strip "${start_strip}" --end_strip "${end_strip}" --sim_time "${sim_time}" -f -v -m "${draw_all_message_flow}"
+    python3 "${script_path}"/analyze_path/add_path_to_architecture.py "${trace_data}" --target_path_json="${target_path_json}" --architecture_file_path=architecture_path.yaml --max_node_depth="${max_node_depth}" --timeout="${timeout}" --search_jobs="${search_jobs}" --search_memory_limit="${search_memory_limit}" --path_search_cache_dir="${path_search_cache_dir}" -v
+    python3 "${script_path}"/analyze_path/analyze_path.py "${trace_data}" "${report_dir_name}" --architecture_file_path=architecture_path.yaml --start_strip "${start_strip}" --end_strip "${end_strip}" --sim_time "${sim_time}" --jobs="${jobs}" --export_jobs="${export_jobs}" -f -v -m "${draw_all_message_flow}" --message_flow_window="${message_flow_window}"
     python3 "${script_path}"/analyze_path/make_report_analyze_path.py "${report_dir_name}"
 
     # Track of response time
@@ -0,0 +1,59 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Script to export graphs deferred in validation reports created with --graph_mode=failed
+"""
+import sys
+import os
+import argparse
+import logging
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
+from common.utils import create_logger, GraphExporter, flush_graph
+from common.utils_validation import export_deferred_graphs
+
+_logger: logging.Logger = None
+
+
+def parse_arg():
+    """Parse arguments"""
+    parser = argparse.ArgumentParser(
+                description='Script to export graphs deferred in validation reports')
+    parser.add_argument('report_directory', nargs=1, type=str)
+    parser.add_argument('--filter', type=str, default='',
+                        help='Regular expression of graph filenames to be exported (all if empty)')
+    parser.add_argument('--export_jobs', type=int, default=0,
+                        help='The number of processes to export graphs in background (0: export in the main process)')
+    parser.add_argument('-v', '--verbose', action='store_true', default=False)
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    """Main function"""
+    global _logger
+    args = parse_arg()
+    _logger = create_logger(__name__, logging.DEBUG if args.verbose else logging.INFO)
+
+    _logger.debug(f'report_directory: {args.report_directory[0]}')
+    _logger.debug(f'filter: {args.filter}')
+    _logger.debug(f'export_jobs: {args.export_jobs}')
+    GraphExporter.start(args.export_jobs)
+
+    exported_num = export_deferred_graphs(args.report_directory[0], args.filter, _logger)
+    flush_graph()
+    _logger.info(f'{exported_num} graphs are exported')
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,16 @@ report_dir_name=output/val_"${trace_data_name}"
 another_report_dir_name=output/report_"${trace_data_name}"
 is_path_analysis_only=${is_path_analysis_only:-false}
 is_html_only=${is_html_only:-false}
+trace_cache_dir=${trace_cache_dir-output/trace_cache}
+jobs=${jobs:-1}
+export_jobs=${export_jobs:-0}
+search_jobs=${search_jobs:-1}
+search_memory_limit=${search_memory_limit:-0}
+path_search_cache_dir=${path_search_cache_dir-output/path_search_cache}
+chunk_duration=${chunk_duration:-0}
+message_flow_window=${message_flow_window:-false}
+graph_mode=${graph_mode:-all}
+graph_allowlist=${graph_allowlist:-}
 
 mkdir -p "${report_dir_name}"
 
@@ -44,6 +54,9 @@ if ${use_python}; then
             --target_path_json="${target_path_json}" \
             --max_node_depth="${max_node_depth}" \
             --timeout="${timeout}" \
+            --search_jobs="${search_jobs}" \
+            --search_memory_limit="${search_memory_limit}" \
+            --path_search_cache_dir="${path_search_cache_dir}" \
             --find_valid_duration="${find_valid_duration}" \
             --duration="${duration}" \
             --report_directory="${report_dir_name}" \
@@ -52,6 +65,13 @@ if ${use_python}; then
             --expectation_topic_csv_filename="topic_list_pubsub.csv" \
             --expectation_callback_csv_filename="${callback_list_csv}" \
             --is_path_analysis_only="${is_path_analysis_only}" \
+            --trace_cache_dir="${trace_cache_dir}" \
+            --jobs="${jobs}" \
+            --export_jobs="${export_jobs}" \
+            --chunk_duration="${chunk_duration}" \
+            --message_flow_window="${message_flow_window}" \
+            --graph_mode="${graph_mode}" \
+            --graph_allowlist="${graph_allowlist}" \
             -f -v
     fi
 
@@ -84,8 +104,8 @@ else
     python3 "${script_path}"/validate_callback/make_report_validate_callback.py "${report_dir_name}" --component_list_json="${component_list_json}"
 
     # Path analysis
-    python3 "${script_path}"/analyze_path/add_path_to_architecture.py "${trace_data}" --target_path_json="${target_path_json}" --architecture_file_path=architecture_path.yaml --max_node_depth="${max_node_depth}" --timeout="${timeout}" -v
-    python3 "${script_path}"/analyze_path/analyze_path.py "${trace_data}" "${report_dir_name}" --architecture_file_path=architecture_path.yaml --start_strip "${start_strip}" --end_strip "${end_strip}" --sim_time "${sim_time}" -f -v -m "${draw_all_message_flow}"
+    python3 "${script_path}"/analyze_path/add_path_to_architecture.py "${trace_data}" --target_path_json="${target_path_json}" --architecture_file_path=architecture_path.yaml --max_node_depth="${max_node_depth}" --timeout="${timeout}" --search_jobs="${search_jobs}" --search_memory_limit="${search_memory_limit}" --path_search_cache_dir="${path_search_cache_dir}" -v
+    python3 "${script_path}"/analyze_path/analyze_path.py "${trace_data}" "${report_dir_name}" --architecture_file_path=architecture_path.yaml --start_strip "${start_strip}" --end_strip "${end_strip}" --sim_time "${sim_time}" --jobs="${jobs}" --export_jobs="${export_jobs}" -f -v -m "${draw_all_message_flow}" --message_flow_window="${message_flow_window}"
     python3 "${script_path}"/analyze_path/make_report_analyze_path.py "${report_dir_name}"
 
     # Track of response time
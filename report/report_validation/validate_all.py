@@ -18,60 +18,24 @@ from __future__ import annotations
 import sys
 import os
 import argparse
-from distutils.util import strtobool
 import logging
-from caret_analyze import Architecture, Application
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
-from common.utils import create_architecture_from_lttng, create_logger, read_trace_data
+from common.utils import create_logger
+from common.utils_pipeline import add_report_arguments, add_validation_arguments
+from common.utils_pipeline import prepare_report_arguments, prepare_validation_arguments, run_report
 from validate_topic import generate_expectation_list, validate_topic
 from validate_callback import validate_callback
-from analyze_path import add_path_to_architecture, analyze_path
-from find_valid_duration import find_valid_duration
 
 
 def parse_arg():
     """Parse arguments"""
     parser = argparse.ArgumentParser(
                 description='Script to make validation reports')
-    parser.add_argument('trace_data', nargs=1, type=str)
-    parser.add_argument('dest_dir', nargs=1, type=str)
-    parser.add_argument('--sub_trace_data', type=str, default='')
-    parser.add_argument('--component_list_json', type=str, default='')
-    parser.add_argument('--start_strip', type=float, default=0.0,
-                        help='Start strip [sec] to load trace data')
-    parser.add_argument('--end_strip', type=float, default=0.0,
-                        help='End strip [sec] to load trace data')
-    parser.add_argument('--sim_time', type=strtobool, default=False)
-    parser.add_argument('--is_path_analysis_only', type=strtobool, default=False)
-    parser.add_argument('-f', '--force', action='store_true', default=False,
-                        help='Overwrite report directory')
-    parser.add_argument('-v', '--verbose', action='store_true', default=False)
-
-    # options for add_path
-    parser.add_argument('--target_path_json', type=str, default='target_path.json')
-    parser.add_argument('--architecture_file', type=str, default='architecture.yaml')
-    parser.add_argument('--architecture_file_path', type=str, default='architecture_path.yaml')
-    parser.add_argument('--use_latest_message', action='store_true', default=True)
-    parser.add_argument('--max_node_depth', type=int, default=15)
-    parser.add_argument('--timeout', type=int, default=120)
-
-    # options for path analysis
-    parser.add_argument('-m', '--message_flow', type=strtobool, default=False,
-                        help='Output message flow graph')
-
-    # options for find_valid_duration
-    parser.add_argument('--find_valid_duration', type=strtobool, default=False)
-    parser.add_argument('--duration', type=float, default=1200.0,
-                        help='Duration [sec] to load trace data')
-    parser.add_argument('--skip_first_num', type=int, default=1,
-                        help='The number to skip the first n-th trace data')
+    add_report_arguments(parser)
 
     # options for validation
     parser.add_argument('--report_directory', type=str, default='')
-    parser.add_argument('--callback_list_filename', type=str, default='callback_list.csv')
-    parser.add_argument('--topic_list_filename', type=str, default='topic_list.csv')
-    parser.add_argument('--expectation_topic_csv_filename', type=str, default='expectation_topic.csv')
-    parser.add_argument('--expectation_callback_csv_filename', type=str, default='expectation_callback.csv')
+    add_validation_arguments(parser)
 
     args = parser.parse_args()
     return args
@@ -81,74 +45,18 @@ def main():
     """Main function"""
     args = parse_arg()
     logger = create_logger(__name__, logging.DEBUG if args.verbose else logging.INFO)
-    args.trace_data = args.trace_data[0]
-    logger.debug(f'trace_data: {args.trace_data}')
-    args.dest_dir = args.dest_dir[0]
-    logger.debug(f'dest_dir: {args.dest_dir}')
-    logger.debug(f'sub_trace_data: {args.sub_trace_data}')
-    logger.debug(f'component_list_json: {args.component_list_json}')
-    logger.debug(f'start_strip: {args.start_strip}, end_strip: {args.end_strip}')
-    logger.debug(f'sim_time: {args.sim_time}')
-    logger.debug(f'is_path_analysis_only: {args.is_path_analysis_only}')
-    logger.debug(f'target_path_json: {args.target_path_json}')
-    if not os.path.isabs(args.architecture_file):
-        args.architecture_file = os.path.join(args.dest_dir, args.architecture_file)
-    logger.debug(f'architecture_file: {args.architecture_file}')
-    if not os.path.isabs(args.architecture_file_path):
-        args.architecture_file_path = os.path.join(args.dest_dir, args.architecture_file_path)
-    logger.debug(f'architecture_file_path: {args.architecture_file_path}')
-    logger.debug(f'use_latest_message: {args.use_latest_message}')
-    logger.debug(f'max_node_depth: {args.max_node_depth}')
-    logger.debug(f'timeout: {args.timeout}')
-    args.message_flow = True if args.message_flow == 1 else False
-    logger.debug(f'message_flow: {args.message_flow}')
-    logger.debug(f'find_valid_duration: {args.find_valid_duration}')
-    logger.debug(f'duration: {args.duration}')
-    logger.debug(f'skip_first_num: {args.skip_first_num}')
+    prepare_report_arguments(args, logger)
     logger.debug(f'report_directory: {args.report_directory}')
-    logger.debug(f'callback_list_filename: {args.callback_list_filename}')
-    logger.debug(f'topic_list_filename: {args.topic_list_filename}')
-    logger.debug(f'expectation_topic_csv_filename: {args.expectation_topic_csv_filename}')
-    logger.debug(f'expectation_callback_csv_filename: {args.expectation_callback_csv_filename}')
-
-    trace_data = args.trace_data if args.sub_trace_data == '' else [args.trace_data, args.sub_trace_data]
-
-    # Create architecture for path analysis
-    # 　Run add_path_to_architecture in a subprocess to avoid memory leak from search_paths
-    create_architecture_from_lttng(add_path_to_architecture.add_path_to_architecture, args, trace_data)
-    arch = Architecture('yaml', args.architecture_file)
-    arch_path = Architecture('yaml', args.architecture_file_path)
+    prepare_validation_arguments(args, logger)
 
-    # Read trace data
-    start_strip, end_strip = (0, 0) if args.find_valid_duration else (args.start_strip, args.end_strip )
-    lttng = read_trace_data(trace_data, start_strip, end_strip, False)
-
-    # Find duration to be analyzed
-    #  Run path analysis and find start point(sec) where the topic runs in the paths
-    if args.find_valid_duration:
-        app_path = Application(arch_path, lttng)
-        valid_start, valid_end = find_valid_duration.analyze(args, lttng, arch_path, app_path)
-        args.start_strip = valid_start + args.start_strip
-        args.end_strip = valid_end + args.end_strip
-        logger.info(f'Find valid duration. start_strip: {args.start_strip}, end_strip: {args.end_strip}')
-        logger.info(f'Reload trace data')
-        lttng = read_trace_data(trace_data, args.start_strip, args.end_strip, False)
-
-    # Analyze and validate
-    if os.path.exists(args.dest_dir + '/analyze_path/index.html'):
-        logger.info(f'Skip creating path report to save time')
-    else:
-        app_path = Application(arch_path, lttng)
-        analyze_path.analyze(args, lttng, arch_path, app_path, args.dest_dir + '/analyze_path')
-        del app_path
-
-    if not args.is_path_analysis_only:
-        app = Application(arch, lttng)
+    def validate_components(args, lttng, arch, app, trace_cache, trace_aggregate):
         xaxis_type = 'sim_time' if args.sim_time else 'system_time'
         generate_expectation_list.create_topic_from_callback(args.callback_list_filename, args.report_directory, args.topic_list_filename)
         generate_expectation_list.generate_list(args.verbose, arch, args.report_directory, args.component_list_json, args.topic_list_filename, args.expectation_topic_csv_filename)
-        validate_topic.validate(args.verbose, arch, app, args.report_directory, args.force, args.component_list_json, os.path.join(args.report_directory, args.expectation_topic_csv_filename), xaxis_type)
-        validate_callback.validate(args.verbose, arch, app, args.report_directory, args.force, args.component_list_json, args.expectation_callback_csv_filename, xaxis_type)
+        validate_topic.validate(args.verbose, arch, app, args.report_directory, args.force, args.component_list_json, os.path.join(args.report_directory, args.expectation_topic_csv_filename), xaxis_type, trace_cache, args.jobs, trace_aggregate)
+        validate_callback.validate(args.verbose, arch, app, args.report_directory, args.force, args.component_list_json, args.expectation_callback_csv_filename, xaxis_type, trace_cache, args.jobs, trace_aggregate)
+
+    run_report(args, logger, validate_components)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,115 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Fuzz tests of pub/sub frequency matching in check_callback_sub against the previous per-element implementation
+"""
+import logging
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('caret_analyze')
+from check_callback_sub import check_callback_sub
+
+
+def calc_frequency_by_loop(timestamp_df: pd.DataFrame, timestamp_name: str) -> tuple[list[float], list[int]]:
+    """The previous implementation of calc_frequency"""
+    timestamp_list: list[float] = []
+    frequency_list: list[int] = []
+
+    timestamp_name = [s for s in timestamp_df.columns if timestamp_name in s][0]
+    timestamp_series = timestamp_df[timestamp_name]
+    timestamp_series = timestamp_series.sort_values()
+
+    if len(timestamp_series) < 2:
+        return [], []
+    timestamp_series *= 1e-9
+    timestamp_series -= timestamp_series[0]
+
+    timestamp_start_1sec = timestamp_series[0]
+    timestamp_list.append(timestamp_start_1sec)
+    frequency_list.append(1)
+
+    for timestamp in timestamp_series:
+        if (timestamp - timestamp_start_1sec) < 1.0:
+            frequency_list[-1] += 1
+        else:
+            timestamp_start_1sec = timestamp
+            timestamp_list.append(timestamp_start_1sec)
+            frequency_list.append(1)
+
+    return timestamp_list, frequency_list
+
+
+def match_pubsub_freq_by_loop(pub_freq: tuple[list[float], list[int]], sub_freq: tuple[list[float], list[int]]):
+    """The previous implementation of match_pubsub_freq (without warning)"""
+    timestamp_list = []
+    pub_freq_list = []
+    sub_freq_list = []
+    index_to_start_check = 0
+    maximum_gap_time = 1.0
+    for index_pub in range(len(pub_freq[0])):
+        pub_time = pub_freq[0][index_pub]
+        matched_sub_index = -1
+        for index_sub in range(index_to_start_check, len(sub_freq[0])):
+            gap_time = sub_freq[0][index_sub] - pub_time
+            if gap_time < 0:
+                continue
+            gap_time_next = sub_freq[0][index_sub + 1] - pub_time if index_sub < len(sub_freq[0]) - 1 else -1
+            if gap_time_next < 0:
+                break
+            if gap_time < gap_time_next and gap_time < maximum_gap_time:
+                matched_sub_index = index_sub
+                break
+        if matched_sub_index != -1:
+            index_to_start_check = matched_sub_index + 1
+            timestamp_list.append(pub_time)
+            pub_freq_list.append(pub_freq[1][index_pub])
+            sub_freq_list.append(sub_freq[1][matched_sub_index])
+
+    return timestamp_list, pub_freq_list, sub_freq_list
+
+
+def create_timestamp_df(rng: np.random.Generator, column_name: str) -> pd.DataFrame:
+    """Timestamps [ns] of random frequency with pauses, bursts and duplicates (not sorted)"""
+    base_timestamp = 1_700_000_000 * 10**9 + int(rng.integers(0, 3 * 10**9))
+    interval_list = []
+    for _ in range(rng.integers(1, 6)):
+        period_ns = int(rng.choice([10**7, 10**8, 3 * 10**8, 10**9, 2 * 10**9]))
+        num = int(rng.integers(0, 40))
+        interval_list.append(np.full(num, period_ns) + rng.integers(-period_ns // 10, period_ns // 10 + 1, num))
+        interval_list.append(rng.integers(0, 5 * 10**9, 1))   # pause
+    intervals = np.concatenate(interval_list)
+    intervals[rng.random(len(intervals)) < 0.05] = 0      # duplicated timestamp
+    timestamps = base_timestamp + np.cumsum(intervals)
+    order = np.arange(len(timestamps))
+    if rng.random() < 0.3:
+        swap = rng.integers(1, max(len(order), 2), 3)
+        order[swap - 1], order[swap] = order[swap], order[swap - 1]
+    return pd.DataFrame({f'/topic/{column_name}': timestamps[order]})
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_match_pubsub_freq(seed, monkeypatch):
+    monkeypatch.setattr(check_callback_sub, '_logger', logging.getLogger(__name__), raising=False)
+    rng = np.random.default_rng(seed)
+    for _ in range(20):
+        pub_df = create_timestamp_df(rng, 'rclcpp_publish_timestamp')
+        sub_df = create_timestamp_df(rng, 'callback_start_timestamp')
+        sub_df.iloc[:, 0] += int(rng.integers(0, 2 * 10**8))    # latency
+        pub_freq = check_callback_sub.calc_pub_freq(pub_df)
+        sub_freq = check_callback_sub.calc_sub_freq(sub_df)
+        assert pub_freq == calc_frequency_by_loop(pub_df.copy(), 'rclcpp_publish_timestamp')
+        assert sub_freq == calc_frequency_by_loop(sub_df.copy(), 'callback_start_timestamp')
+        assert check_callback_sub.match_pubsub_freq(pub_freq, sub_freq) == match_pubsub_freq_by_loop(pub_freq, sub_freq)
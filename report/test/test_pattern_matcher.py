@@ -0,0 +1,91 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of PatternMatcher and ComponentManager against re.search over each pattern
+"""
+import itertools
+import json
+import re
+import pytest
+
+pytest.importorskip('caret_analyze')
+from common.utils import PatternMatcher, ComponentManager
+
+NAME_LIST = ['/sensing/lidar/top/crop_box_filter', '/sensing/camera/decompressor', '/perception/object_recognition/tracker',
+             '/planning/scenario_planning/lane_driving', '/control/trajectory_follower', '/Control/vehicle_cmd_gate',
+             '/rviz2', '/transform_listener_impl_55d5', '/_ros2cli_1234', '', '/a/b/c']
+PATTERN_LIST_LIST = [
+    [r'^/sensing', r'^/perception', r'^/planning', r'^/control'],
+    [r'lidar|camera', r'^/(planning|control)/'],             # with a group (not combined)
+    [r'^/control', r'(?i)^/control'],                        # global flag in the middle of combined pattern
+    [r'^/transform_listener_impl', r'^/rviz', r'_ros2cli_'],
+    [r'.*'],
+    [],
+]
+
+
+def find_by_re(pattern_list: list[str], name: str) -> int:
+    return next((index for index, pattern in enumerate(pattern_list) if re.search(pattern, name)), -1)
+
+
+@pytest.mark.parametrize('pattern_list', PATTERN_LIST_LIST)
+def test_pattern_matcher(pattern_list):
+    matcher = PatternMatcher(pattern_list)
+    for name in NAME_LIST * 2:   # the second time is memoized
+        assert matcher.find(name) == find_by_re(pattern_list, name), name
+        assert matcher.match_any(name) == (find_by_re(pattern_list, name) >= 0), name
+
+
+def check_if_external_by_re(external_topic_list: list[list[str]], topic_name: str, node_name: str) -> bool:
+    """The previous implementation in ComponentManager.check_if_external_in/out_topic"""
+    for topic_regexp, node_regexp in external_topic_list:
+        if re.search(topic_regexp, topic_name):
+            if (node_name != '') and (node_regexp != '') and (not re.search(node_regexp, node_name)):
+                continue
+            return True
+    return False
+
+
+def test_component_manager(tmp_path):
+    component_list_json = {
+        'component_dict': {'sensing': r'^/sensing', 'perception': r'^/perception', 'control': r'(?i)^/control'},
+        'external_in_topic_list': [[r'^/sensing/.*/pointcloud', r'^/sensing/lidar'], [r'^/initialpose', '']],
+        'external_out_topic_list': [[r'^/control/command', '']],
+        'ignore_list': [r'^/rviz', r'^/transform_listener_impl', r'_ros2cli_'],
+    }
+    component_list_json_path = f'{tmp_path}/component_list.json'
+    with open(component_list_json_path, 'w', encoding='utf-8') as f_json:
+        json.dump(component_list_json, f_json)
+    component_manager = ComponentManager()
+    component_manager.initialize(component_list_json_path)
+
+    topic_name_list = ['/sensing/lidar/pointcloud', '/initialpose', '/control/command/control_cmd', '/tf']
+    for _ in range(2):
+        for name in NAME_LIST:
+            index = find_by_re(list(component_list_json['component_dict'].values()), name)
+            expected = list(component_list_json['component_dict'].keys())[index] if index >= 0 else 'other'
+            assert component_manager.get_component_name(name) == expected
+            assert component_manager.check_if_ignore(name) == (find_by_re(component_list_json['ignore_list'], name) >= 0)
+        for topic_name, node_name in itertools.product(topic_name_list, NAME_LIST):
+            assert component_manager.check_if_external_in_topic(topic_name, node_name) == \
+                check_if_external_by_re(component_list_json['external_in_topic_list'], topic_name, node_name)
+            assert component_manager.check_if_external_out_topic(topic_name, node_name) == \
+                check_if_external_by_re(component_list_json['external_out_topic_list'], topic_name, node_name)
+
+    # memoized results are updated when patterns are changed
+    component_list_json['component_dict'] = {'all': r'.*'}
+    with open(component_list_json_path, 'w', encoding='utf-8') as f_json:
+        json.dump(component_list_json, f_json)
+    component_manager.initialize(component_list_json_path)
+    assert component_manager.get_component_name('/sensing/lidar/top/crop_box_filter') == 'all'
@@ -0,0 +1,122 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of TraceCache: extraction from records, save/load and cache key
+"""
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('caret_analyze')
+from common.utils import TraceCache, extract_timestamps, load_trace_cache
+
+
+class Records:
+    """Target (callback, publisher, etc.) which has records dataframe as CARET"""
+    def __init__(self, records_dict: dict[str, list], **attributes):
+        self.records_dict = records_dict
+        self.call_num = 0
+        for name, value in attributes.items():
+            setattr(self, name, value)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        self.call_num += 1
+        if self.records_dict is None:
+            raise ValueError('no records')
+        return pd.DataFrame({name: pd.Series(values, dtype='Int64') for name, values in self.records_dict.items()})
+
+
+class App:
+    def __init__(self):
+        self.callbacks = [
+            Records({'/node/timer_0/callback_start_timestamp': [10, 20, 30], '/node/timer_0/callback_end_timestamp': [11, 21, None]},
+                    callback_name='/node/timer_0'),
+            Records(None, callback_name='/node/timer_never_called'),
+        ]
+        self.publishers = [Records({'/node/topic/rclcpp_publish_timestamp': [5, None, 25]}, node_name='/node', topic_name='/topic')]
+        self.subscriptions = [Records({'/node/subscription_0/callback_start_timestamp': [40]}, callback_name='/node/subscription_0')]
+        self.communications = [
+            Records({'/topic/rclcpp_publish_timestamp': [5, 25], '/sub/callback_start_timestamp': [7, None]},
+                    topic_name='/topic', publish_node_name='/node', subscribe_node_name='/sub')]
+
+    def call_num(self) -> int:
+        return sum(target.call_num for target in self.callbacks + self.publishers + self.subscriptions + self.communications)
+
+
+def assert_app_cache(trace_cache: TraceCache):
+    callback_start, callback_end = trace_cache.get_callback('/node/timer_0')
+    np.testing.assert_array_equal(callback_start, [10, 20, 30])
+    np.testing.assert_array_equal(callback_end, [11, 21, TraceCache.MISSING])
+    assert [len(values) for values in trace_cache.get_callback('/node/timer_never_called')] == [0, 0]
+    assert trace_cache.get_callback('/node/unknown') is None
+    np.testing.assert_array_equal(trace_cache.get_publisher('/node', '/topic'), [5, 25])
+    np.testing.assert_array_equal(trace_cache.get_subscription('/node/subscription_0'), [40])
+    publish, callback_start = trace_cache.get_communication('/topic', '/node', '/sub')
+    np.testing.assert_array_equal(publish, [5, 25])
+    np.testing.assert_array_equal(callback_start, [7, TraceCache.MISSING])
+
+
+def test_extract_timestamps():
+    records_df = pd.DataFrame({'/cb/callback_start_timestamp': pd.Series([1, None, 3], dtype='Int64'),
+                               '/cb/callback_end_timestamp': pd.Series([2, 3, None], dtype='Int64')})
+    start, end = extract_timestamps(records_df, ['callback_start_timestamp', 'callback_end_timestamp'])
+    np.testing.assert_array_equal(start, [1, 3])
+    np.testing.assert_array_equal(end, [2, TraceCache.MISSING])
+    _, missing = extract_timestamps(records_df, ['callback_start_timestamp', 'unknown_timestamp'])
+    np.testing.assert_array_equal(missing, [TraceCache.MISSING] * 2)
+    assert [len(values) for values in extract_timestamps(records_df, ['unknown_timestamp'])] == [0]
+
+
+def test_save_load(tmp_path):
+    trace_cache = TraceCache.from_app(App())
+    path_timestamps = (np.array([100, 200], dtype=np.int64), np.array([3 * 10**6, 4 * 10**6], dtype=np.int64))
+    trace_cache.set_group('path', {TraceCache.make_path_name('target_path', 'best'): path_timestamps})
+    assert_app_cache(trace_cache)
+
+    cache_path = f'{tmp_path}/cache'
+    trace_cache.save(cache_path)
+    trace_cache.save(cache_path)   # overwrite
+    loaded_cache = TraceCache.load(cache_path)
+    assert_app_cache(loaded_cache)
+    assert isinstance(loaded_cache.columns['callback']['callback_start_timestamp'], np.memmap)
+    start_timestamps, response_time = loaded_cache.get_path('target_path', 'best')
+    np.testing.assert_array_equal(start_timestamps, path_timestamps[0])
+    np.testing.assert_array_equal(response_time, path_timestamps[1])
+    assert loaded_cache.get_path('target_path', 'worst') is None
+    assert TraceCache.load(f'{tmp_path}/not_exist') is None
+
+
+def test_load_trace_cache(tmp_path):
+    trace_data = f'{tmp_path}/trace'
+    os.makedirs(trace_data)
+    with open(f'{trace_data}/metadata', 'w', encoding='utf-8') as f_trace:
+        f_trace.write('0')
+    trace_cache_dir = f'{tmp_path}/trace_cache'
+    assert load_trace_cache('', trace_data, 0, 0, App()) is None
+    assert load_trace_cache(trace_cache_dir, trace_data, 0, 0) is None
+
+    app = App()
+    assert_app_cache(load_trace_cache(trace_cache_dir, trace_data, 0, 0, app))
+    call_num = app.call_num()
+    # records are not extracted again on a cache hit
+    assert_app_cache(load_trace_cache(trace_cache_dir, trace_data, 0, 0, app))
+    assert app.call_num() == call_num
+
+    # key depends on strip and trace data
+    assert TraceCache.make_key(trace_data, 0, 0) != TraceCache.make_key(trace_data, 1, 0)
+    key = TraceCache.make_key(trace_data, 0, 0)
+    os.utime(f'{trace_data}/metadata', (0, os.path.getmtime(f'{trace_data}/metadata') + 10))
+    assert TraceCache.make_key(trace_data, 0, 0) != key
+    assert load_trace_cache(trace_cache_dir, trace_data, 0, 0) is None
@@ -0,0 +1,114 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of aggregates merged over time windows (chunked mode) against calculation of the whole series
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip('caret_analyze')
+from common.utils_aggregate import FrequencyBins, LimitViolation, SeriesAggregate
+from common.utils_metrics import calc_frequency
+from common.utils_stats import StatsSketch
+from common.utils_validation import calc_limit_violation
+
+INTERVAL_NS = 10**9
+BASE_TIMESTAMP = 1_700_000_000 * 10**9
+
+
+def create_boundary_list(seed: int, num: int) -> list[int]:
+    """Random boundaries including empty and one-value windows"""
+    rng = np.random.default_rng(seed)
+    return sorted(rng.integers(0, num, 8).tolist() + [0, 1, 2, 3, num - 1, num - 1])
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_frequency_bins_merge(seed):
+    rng = np.random.default_rng(seed)
+    timestamps = np.sort(BASE_TIMESTAMP + rng.integers(0, 20 * INTERVAL_NS, 3000))
+    timestamps[100:110] = BASE_TIMESTAMP + 5 * INTERVAL_NS   # on an interval boundary
+    timestamps.sort()
+    expected_timestamps, expected_frequency = calc_frequency(timestamps, BASE_TIMESTAMP, int(timestamps[-1]))
+
+    chunk_list = np.split(timestamps, create_boundary_list(seed, len(timestamps)))
+    merged = FrequencyBins()
+    for index in rng.permutation(len(chunk_list)):   # windows may be merged in any order
+        merged.merge(FrequencyBins.from_timestamps(chunk_list[index], BASE_TIMESTAMP, INTERVAL_NS))
+    counts = np.zeros(merged.last_index + 1, dtype=np.int64)
+    counts[merged.first_index:] = merged.counts
+    np.testing.assert_array_equal(counts, expected_frequency)
+    assert merged.count == len(timestamps)
+    assert (merged.first_timestamp, merged.last_timestamp) == (timestamps[0], timestamps[-1])
+    assert len(expected_timestamps) == merged.last_index + 1
+
+
+def create_values(seed: int, num: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return np.repeat(rng.normal(100.0, 30.0, num), rng.integers(1, 6, num))
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_limit_violation_merge(seed):
+    values = create_values(seed, 500)
+    values[:20] = 0.0      # runs across window boundaries
+    values[-20:] = 300.0
+    for boundary_list in [create_boundary_list(seed, len(values)), [5, 10, 15, len(values) - 10]]:
+        violation = LimitViolation(60.0, 140.0)
+        for chunk in np.split(values, boundary_list):
+            chunk_violation = LimitViolation(60.0, 140.0)
+            chunk_violation.add(chunk)
+            violation.merge(chunk_violation)
+        ratio_lower, ratio_upper, burst_lower, burst_upper = calc_limit_violation(values, 60.0, 140.0)
+        assert violation.to_dict() == {'ratio_lower_limit': pytest.approx(ratio_lower), 'ratio_upper_limit': pytest.approx(ratio_upper),
+                                       'burst_num_lower_limit': burst_lower, 'burst_num_upper_limit': burst_upper}
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('num', [1, 2, 3, 4, 50, 30000])
+def test_series_aggregate_merge(seed, num):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(100.0, 30.0, num)
+    values[rng.integers(0, num, num // 10)] = np.nan
+    timestamps = BASE_TIMESTAMP + np.arange(num, dtype=np.int64) * 10**6
+    limit_list = [(60.0, 140.0)]
+    merged = SeriesAggregate(limit_list)
+    for chunk in np.split(np.arange(num), create_boundary_list(seed, num) if num > 3 else [1, 1]):
+        merged.merge(SeriesAggregate.from_timeseries(timestamps[chunk], values[chunk], limit_list))
+
+    valid_values = values[~np.isnan(values)]
+    assert merged.count == len(valid_values)
+    for start_strip_num in [0, 1]:
+        for end_strip_num in [0, 1, 2]:
+            expected = valid_values[start_strip_num:max(len(valid_values) - end_strip_num, start_strip_num)]
+            sketch = merged.get_sketch(start_strip_num, end_strip_num)
+            expected_sketch = StatsSketch.from_values(expected, max_exact_num=SeriesAggregate.SKETCH_EXACT_NUM)
+            assert sketch.count == len(expected)
+            if len(expected) == 0:
+                continue
+            assert sketch.mean() == pytest.approx(expected.mean(), rel=1e-9)
+            assert (sketch.min(), sketch.max()) == (expected.min(), expected.max())
+            assert sketch.quantile(0.5) == pytest.approx(expected_sketch.quantile(0.5), rel=1e-9)
+            ratio_lower, ratio_upper, burst_lower, burst_upper = calc_limit_violation(expected, 60.0, 140.0)
+            violation_dict = merged.calc_limit_violation(60.0, 140.0, start_strip_num, end_strip_num)
+            assert violation_dict['ratio_lower_limit'] == pytest.approx(ratio_lower)
+            assert violation_dict['ratio_upper_limit'] == pytest.approx(ratio_upper)
+            assert (violation_dict['burst_num_lower_limit'], violation_dict['burst_num_upper_limit']) == (burst_lower, burst_upper)
+    assert merged.calc_limit_violation(0.0, 1.0) is None
+
+    # spikes are kept in downsampled timeseries for graphs
+    graph_timestamps, graph_values = merged.get_timeseries()
+    assert len(graph_values) <= SeriesAggregate.TIMESERIES_POINT_NUM * 2
+    if len(valid_values) > 0:
+        assert (graph_values.min(), graph_values.max()) == (valid_values.min(), valid_values.max())
+        assert np.all(np.diff(graph_timestamps) > 0)
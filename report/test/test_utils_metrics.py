@@ -0,0 +1,142 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of CallbackMetrics against dataframe (pandas) calculation in the same way as CARET timeseries plot
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('caret_analyze')
+from common import utils_metrics
+from common.utils_metrics import CallbackMetrics, FREQUENCY_INTERVAL_NS, compare_with_caret
+from common.utils_aggregate import TraceAggregate, AggregatedCallbackMetrics
+
+
+class RecordsCallback:
+    """Callback which has records of callback_start/callback_end as CARET"""
+    def __init__(self, callback_name: str, start_timestamps: np.ndarray, end_timestamps: np.ndarray):
+        self.callback_name = callback_name
+        self.records_df = pd.DataFrame({
+            f'{callback_name}/callback_start_timestamp': pd.Series(start_timestamps, dtype='Int64'),
+            f'{callback_name}/callback_end_timestamp': pd.Series(end_timestamps, dtype='Int64'),
+        })
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return self.records_df
+
+
+def create_callbacks(seed: int) -> list[RecordsCallback]:
+    rng = np.random.default_rng(seed)
+    callback_list = []
+    base_timestamp = 1_700_000_000 * 10**9
+    for index, num in enumerate([2000, 300, 1]):
+        start = np.sort(base_timestamp + rng.integers(0, 10 * 10**9, num) + index * 3 * 10**9)
+        end = (start + rng.integers(10**5, 10**7, num)).astype(float)
+        end[-1] = np.nan   # interrupted at the end of trace
+        callback_list.append(RecordsCallback(f'/node/callback_{index}', start, end))
+    callback_list.append(RecordsCallback('/node/callback_not_called', [], []))
+    return callback_list
+
+
+def calculate_by_dataframe(callbacks: list[RecordsCallback], metrics: str) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """Calculate metrics from records dataframe in the same way as CARET timeseries plot"""
+    df_dict = {callback.callback_name: callback.to_dataframe().set_axis(['start', 'end'], axis=1) for callback in callbacks}
+    result = {}
+    if metrics == 'frequency':
+        start_list = [df['start'].dropna() for df in df_dict.values() if len(df['start'].dropna()) > 0]
+        base_timestamp = min(int(start.iloc[0]) for start in start_list)
+        until_timestamp = max(int(start.iloc[-1]) for start in start_list)
+        for callback_name, df in df_dict.items():
+            start = df['start'].dropna().astype('int64')
+            if len(start) == 0:
+                result[callback_name] = (np.empty(0, dtype=np.int64), np.empty(0))
+                continue
+            interval_num = max(int(start.iloc[-1]), until_timestamp) - base_timestamp
+            counts = start.groupby((start - base_timestamp) // FREQUENCY_INTERVAL_NS).count() \
+                .reindex(range(interval_num // FREQUENCY_INTERVAL_NS + 1), fill_value=0)
+            result[callback_name] = (base_timestamp + counts.index.to_numpy(dtype=np.int64) * FREQUENCY_INTERVAL_NS,
+                                     counts.to_numpy(dtype=float))
+    elif metrics == 'period':
+        for callback_name, df in df_dict.items():
+            start = df['start'].dropna().astype('int64')
+            result[callback_name] = (start.iloc[:-1].to_numpy(dtype=np.int64), start.diff().iloc[1:].to_numpy(dtype=float) / 1e6)
+    elif metrics == 'latency':
+        for callback_name, df in df_dict.items():
+            df = df.dropna().astype('int64')
+            result[callback_name] = (df['start'].to_numpy(dtype=np.int64), (df['end'] - df['start']).to_numpy(dtype=float) / 1e6)
+    return result
+
+
+class DataframePlot:
+    """Timeseries plot of CARET layout (|callback timestamp|callback value|...) calculated by calculate_by_dataframe"""
+    def __init__(self, callbacks: list[RecordsCallback], metrics: str):
+        column_list = []
+        series_list = []
+        for callback_name, (timestamps, values) in calculate_by_dataframe(callbacks, metrics).items():
+            column_list += [(callback_name, 'timestamp [ns]'), (callback_name, metrics)]
+            series_list += [pd.Series(timestamps, dtype=float), pd.Series(values, dtype=float)]
+        self.df = pd.concat(series_list, axis=1)
+        self.df.columns = pd.MultiIndex.from_tuples(column_list)
+
+    def to_dataframe(self, xaxis_type: str) -> pd.DataFrame:
+        return self.df
+
+
+@pytest.mark.parametrize('metrics', ['frequency', 'period', 'latency'])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_calculate_is_same_as_dataframe(metrics, seed):
+    callbacks = create_callbacks(seed)
+    expected = calculate_by_dataframe(callbacks, metrics)
+    result = CallbackMetrics().calculate(callbacks, metrics.capitalize())
+    assert result.keys() == expected.keys()
+    for callback_name, (timestamps, values) in result.items():
+        np.testing.assert_array_equal(timestamps, expected[callback_name][0])
+        np.testing.assert_allclose(values, expected[callback_name][1], rtol=1e-12)
+
+
+def test_calculate_without_calls():
+    assert CallbackMetrics().calculate([RecordsCallback('/node/callback', [], [])], 'frequency') == {}
+
+
+class ShiftedPlot(DataframePlot):
+    """Plot whose second value of the first callback is different"""
+    def __init__(self, callbacks: list[RecordsCallback], metrics: str):
+        super().__init__(callbacks, metrics)
+        self.df.iloc[1, 1] += 1
+
+
+def set_plot(monkeypatch, plot_class):
+    for metrics in ['frequency', 'period', 'latency']:
+        monkeypatch.setattr(utils_metrics.Plot, f'create_{metrics}_timeseries_plot',
+                            lambda callbacks, metrics=metrics: plot_class(callbacks, metrics), raising=False)
+
+
+@pytest.mark.parametrize('metrics', ['frequency', 'period', 'latency'])
+def test_compare_with_caret(monkeypatch, metrics):
+    callbacks = create_callbacks(0)
+    set_plot(monkeypatch, DataframePlot)
+    assert compare_with_caret(CallbackMetrics(), callbacks, metrics) == []
+
+    set_plot(monkeypatch, ShiftedPlot)
+    mismatch_list = compare_with_caret(CallbackMetrics(), callbacks, metrics)
+    assert len(mismatch_list) == 1 and '/node/callback_0' in mismatch_list[0]
+
+
+def test_has_all_values():
+    assert all(CallbackMetrics().has_all_values(metrics) for metrics in ['Frequency', 'Period', 'Latency'])
+    aggregated_metrics = AggregatedCallbackMetrics(TraceAggregate(0))
+    assert aggregated_metrics.has_all_values('Frequency')
+    assert not aggregated_metrics.has_all_values('Period')
+    assert not aggregated_metrics.has_all_values('Latency')
@@ -0,0 +1,152 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of PathSearcher against brute-force enumeration of routes, and search in worker processes
+"""
+import random
+import re
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip('caret_analyze')
+from common.utils_path_search import PathSearcher, PathSearchTimeout, search_list_in_process, search_in_process
+
+
+def create_arch(edge_list: list[tuple[str, str, str]]) -> SimpleNamespace:
+    """Architecture which has communications only"""
+    return SimpleNamespace(communications=[
+        SimpleNamespace(publish_node_name=publish_node_name, topic_name=topic_name, subscribe_node_name=subscribe_node_name)
+        for publish_node_name, topic_name, subscribe_node_name in edge_list])
+
+
+def match_entry_list(node_names: list[str], topic_names: list[str], entry_list: list[tuple[str, str]]) -> bool:
+    """Check if entries match nodes (and their sub or pub topic) in order"""
+    entry_index = 0
+    for index, node_name in enumerate(node_names):
+        sub_topic_name = topic_names[index - 1] if index > 0 else None
+        pub_topic_name = topic_names[index] if index < len(topic_names) else None
+        while entry_index < len(entry_list):
+            node_regexp, topic_regexp = entry_list[entry_index]
+            if not re.fullmatch(node_regexp, node_name):
+                break
+            if topic_regexp and not ((sub_topic_name and re.fullmatch(topic_regexp, sub_topic_name))
+                                     or (pub_topic_name and re.fullmatch(topic_regexp, pub_topic_name))):
+                break
+            entry_index += 1
+    return entry_index == len(entry_list)
+
+
+def search_by_brute_force(edge_list: list[tuple[str, str, str]], waypoint_list: list[str], entry_list: list[tuple[str, str]],
+                          max_depth: int) -> list[tuple[list[str], list[str]]]:
+    """Enumerate all simple routes from the first waypoint to the last, then filter them by constraints"""
+    edge_dict = {}
+    for publish_node_name, topic_name, subscribe_node_name in sorted(set(edge_list)):
+        edge_dict.setdefault(publish_node_name, []).append((topic_name, subscribe_node_name))
+    route_list = []
+
+    def visit(node_names: list[str], topic_names: list[str]):
+        if node_names[-1] == waypoint_list[-1]:
+            route_list.append((node_names.copy(), topic_names.copy()))
+            return
+        for topic_name, next_node_name in edge_dict.get(node_names[-1], []):
+            if next_node_name not in node_names:
+                visit(node_names + [next_node_name], topic_names + [topic_name])
+    visit([waypoint_list[0]], [])
+
+    depth_route_list = []
+    for node_names, topic_names in route_list:
+        if not all(waypoint in node_names for waypoint in waypoint_list):
+            continue
+        position_list = [node_names.index(waypoint) for waypoint in waypoint_list]
+        if position_list != sorted(position_list):
+            continue
+        depth = max(end - start for start, end in zip(position_list, position_list[1:]))
+        if depth <= max_depth and match_entry_list(node_names, topic_names, entry_list):
+            depth_route_list.append((depth, node_names, topic_names))
+    if not depth_route_list:
+        return []
+    min_depth = min(depth for depth, _, _ in depth_route_list)
+    return sorted((node_names, topic_names) for depth, node_names, topic_names in depth_route_list if depth == min_depth)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_search(seed):
+    rng = random.Random(seed)
+    for _ in range(30):
+        node_name_list = [f'/node_{i}' for i in range(rng.randint(4, 9))]
+        edge_list = [(rng.choice(node_name_list), f'/topic_{rng.randint(0, 5)}', rng.choice(node_name_list))
+                     for _ in range(rng.randint(5, 25))]
+        edge_list = [edge for edge in edge_list if edge[0] != edge[2]]
+        waypoint_list = rng.sample(node_name_list, rng.randint(2, 3))
+        entry_list = [(waypoint, None) for waypoint in waypoint_list]
+        if rng.random() < 0.5:
+            entry_list.insert(1, (r'/node_[0-9]', f'/topic_{rng.randint(0, 5)}'))
+        max_depth = rng.randint(1, 5)
+        path_searcher = PathSearcher(create_arch(edge_list), lambda node_name: True, lambda topic_name: True)
+        assert path_searcher.search(waypoint_list, entry_list, max_depth) == \
+            search_by_brute_force(edge_list, waypoint_list, entry_list, max_depth)
+
+
+def test_search_filter():
+    edge_list = [('/a', '/t0', '/b'), ('/b', '/t1', '/c'), ('/a', '/tf', '/c'), ('/a', '/t2', '/d'), ('/d', '/t3', '/c')]
+    path_searcher = PathSearcher(create_arch(edge_list), lambda node_name: node_name != '/d', lambda topic_name: topic_name != '/tf')
+    assert path_searcher.search(['/a', '/c'], [('/a', None), ('/c', None)], 5) == [(['/a', '/b', '/c'], ['/t0', '/t1'])]
+    assert path_searcher.search(['/a'], [], 5) == []
+    # fingerprint depends only on the graph after filters
+    filtered_searcher = PathSearcher(create_arch(edge_list[:2]), lambda node_name: True, lambda topic_name: True)
+    assert path_searcher.fingerprint() == filtered_searcher.fingerprint()
+
+
+def test_search_timeout():
+    node_name_list = [f'/node_{i}' for i in range(12)]
+    edge_list = [(publish_node_name, '/topic', subscribe_node_name)
+                 for publish_node_name in node_name_list for subscribe_node_name in node_name_list
+                 if publish_node_name != subscribe_node_name]
+    path_searcher = PathSearcher(create_arch(edge_list), lambda node_name: True, lambda topic_name: True)
+    progress_list = []
+    # no route matches the entry, so all routes within the depth are expanded
+    with pytest.raises(PathSearchTimeout) as e:
+        path_searcher.search(['/node_0', '/node_1'], [('/not_exist', None)], 11, timeout=1e-6, progress_callback=progress_list.append)
+    assert e.value.progress['expanded_num'] > 0
+    assert progress_list[-1] == e.value.progress
+
+
+def create_complete_graph_searcher(node_num: int) -> PathSearcher:
+    node_name_list = [f'/node_{i}' for i in range(node_num)]
+    edge_list = [(publish_node_name, '/topic', subscribe_node_name)
+                 for publish_node_name in node_name_list for subscribe_node_name in node_name_list
+                 if publish_node_name != subscribe_node_name]
+    return PathSearcher(create_arch(edge_list), lambda node_name: True, lambda topic_name: True)
+
+
+def test_search_list_in_process():
+    path_searcher = create_complete_graph_searcher(5)
+    search_args_list = [(['/node_0', f'/node_{i}'], [('/node_0', None), ('/node_2', None), (f'/node_{i}', None)], 3)
+                        for i in [1, 3, 4]]
+    result_list = search_list_in_process(path_searcher, search_args_list, jobs=2)
+    assert result_list == [path_searcher.search(*search_args) for search_args in search_args_list]
+    assert all(len(result) > 0 for result in result_list)
+
+
+def test_search_list_in_process_timeout():
+    path_searcher = create_complete_graph_searcher(12)
+    search_args_list = [(['/node_0', '/node_1'], [('/node_0', None), ('/node_1', None)], 1),
+                        (['/node_0', '/node_1'], [('/not_exist', None)], 11)]
+    result_list = search_list_in_process(path_searcher, search_args_list, jobs=2, timeout=0.5)
+    assert result_list[0] == [(['/node_0', '/node_1'], ['/topic'])]
+    # the worker is killed by timeout, and the last reported progress is kept
+    assert type(result_list[1]) is PathSearchTimeout
+    assert result_list[1].progress['expanded_num'] > 0
+    with pytest.raises(PathSearchTimeout):
+        search_in_process(path_searcher, *search_args_list[1], timeout=0.5)
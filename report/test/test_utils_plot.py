@@ -0,0 +1,63 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of downsample_minmax against pandas groupby
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from common.utils_plot import downsample_minmax
+
+
+def downsample_by_groupby(timestamps: np.ndarray, values: np.ndarray, bucket_num: int) -> tuple[np.ndarray, np.ndarray]:
+    df = pd.DataFrame({'timestamp': timestamps, 'value': values}).dropna().sort_values('timestamp', kind='stable')
+    df = df.reset_index(drop=True)
+    span = int(df['timestamp'].iloc[-1]) - int(df['timestamp'].iloc[0]) + 1
+    bucket = (df['timestamp'] - df['timestamp'].iloc[0]) * bucket_num // span
+    value_group = df['value'].groupby(bucket)
+    index = np.unique(np.r_[0, len(df) - 1, value_group.idxmin().to_numpy(), value_group.idxmax().to_numpy()])
+    return df['timestamp'].to_numpy()[index], df['value'].to_numpy()[index]
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('bucket_num', [1, 7, 100])
+def test_downsample_minmax(seed, bucket_num):
+    rng = np.random.default_rng(seed)
+    timestamps = np.sort(1_700_000_000 * 10**9 + rng.integers(0, 10**10, 10000))
+    values = rng.choice([1.0, 2.0, 3.0, np.nan], 10000) + rng.normal(0.0, 0.1, 10000).round(1)
+    values[5000] = 1000.0  # spike
+    expected_timestamps, expected_values = downsample_by_groupby(timestamps, values, bucket_num)
+    downsampled_timestamps, downsampled_values = downsample_minmax(timestamps, values, bucket_num)
+    np.testing.assert_array_equal(downsampled_timestamps, expected_timestamps)
+    np.testing.assert_array_equal(downsampled_values, expected_values)
+    assert len(downsampled_values) <= bucket_num * 2 + 2
+    assert 1000.0 in downsampled_values
+
+
+def test_downsample_minmax_unsorted():
+    rng = np.random.default_rng(3)
+    timestamps = rng.permutation(np.arange(1000, dtype=np.int64) * 10**6)
+    values = rng.normal(0.0, 1.0, 1000)
+    expected_timestamps, expected_values = downsample_by_groupby(timestamps, values, 10)
+    downsampled_timestamps, downsampled_values = downsample_minmax(timestamps, values, 10)
+    np.testing.assert_array_equal(downsampled_timestamps, expected_timestamps)
+    np.testing.assert_array_equal(downsampled_values, expected_values)
+
+
+def test_downsample_minmax_small():
+    timestamps = np.array([3, 1, 2], dtype=np.int64)
+    values = np.array([1.0, np.nan, 2.0])
+    downsampled_timestamps, downsampled_values = downsample_minmax(timestamps, values, 10)
+    np.testing.assert_array_equal(downsampled_timestamps, [3, 2])
+    np.testing.assert_array_equal(downsampled_values, [1.0, 2.0])
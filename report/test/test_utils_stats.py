@@ -0,0 +1,104 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of StatsSketch against pandas
+"""
+import math
+import numpy as np
+import pandas as pd
+import pytest
+from common.utils_stats import StatsSketch
+
+
+def create_values(seed: int, num: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    values = rng.lognormal(mean=1.0, sigma=0.8, size=num)
+    values[rng.integers(0, num, num // 100)] = 0.0
+    values[rng.integers(0, num, num // 100)] = np.nan
+    return values
+
+
+def assert_stats(sketch: StatsSketch, values: np.ndarray, quantile_rtol: float):
+    series = pd.Series(values).dropna()
+    assert sketch.count == len(series)
+    assert sketch.mean() == pytest.approx(series.mean(), rel=1e-9)
+    assert sketch.std() == pytest.approx(series.std(), rel=1e-9)
+    assert sketch.min() == series.min()
+    assert sketch.max() == series.max()
+    for q in [0.0, 0.05, 0.5, 0.95, 1.0]:
+        exact = series.quantile(q)
+        assert abs(sketch.quantile(q) - exact) <= quantile_rtol * abs(exact) + 1e-12, q
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_exact(seed):
+    values = create_values(seed, 5000)
+    sketch = StatsSketch.from_values(values)
+    assert sketch.is_exact
+    assert_stats(sketch, values, 0.0)
+    lower, upper = np.nanquantile(values, 0.05), np.nanquantile(values, 0.95)
+    series = pd.Series(values).dropna()
+    mean, count = sketch.mean_between(lower, upper)
+    assert count == ((series >= lower) & (series <= upper)).sum()
+    assert mean == pytest.approx(series[(series >= lower) & (series <= upper)].mean(), rel=1e-12)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_folded(seed):
+    values = create_values(seed, 50000)
+    sketch = StatsSketch.from_values(values, relative_accuracy=0.001, max_exact_num=1000)
+    assert not sketch.is_exact
+    assert_stats(sketch, values, 0.001)
+
+
+def test_negative_values():
+    values = create_values(3, 20000) - 3.0
+    sketch = StatsSketch.from_values(values, max_exact_num=100)
+    assert not sketch.is_exact
+    assert_stats(sketch, values, 0.001)
+
+
+@pytest.mark.parametrize('max_exact_num', [100000, 1000])
+@pytest.mark.parametrize('chunk_num', [1, 3, 10])
+def test_merge(max_exact_num, chunk_num):
+    values = create_values(4, 30000)
+    single = StatsSketch.from_values(values, max_exact_num=max_exact_num)
+    merged = StatsSketch(max_exact_num=max_exact_num)
+    for chunk in np.array_split(values, chunk_num):
+        merged.merge(StatsSketch.from_values(chunk, max_exact_num=max_exact_num))
+    assert merged.is_exact == single.is_exact
+    assert merged.count == single.count
+    assert merged.mean() == pytest.approx(single.mean(), rel=1e-9)
+    assert merged.std() == pytest.approx(single.std(), rel=1e-9)
+    assert (merged.min(), merged.max()) == (single.min(), single.max())
+    for q in [0.05, 0.5, 0.95]:
+        assert merged.quantile(q) == pytest.approx(single.quantile(q), rel=1e-12)
+
+
+def test_merge_exact_into_folded():
+    values = create_values(5, 20000)
+    folded = StatsSketch.from_values(values[:15000], max_exact_num=1000)
+    exact = StatsSketch.from_values(values[15000:], max_exact_num=100000)
+    exact.merge(folded)
+    assert not exact.is_exact
+    assert_stats(exact, values, 0.001)
+
+
+def test_empty():
+    sketch = StatsSketch.from_values([np.nan])
+    assert sketch.count == 0
+    assert math.isnan(sketch.mean())
+    assert len(sketch.histogram()[0]) == 0
+    sketch.merge(StatsSketch())
+    assert sketch.count == 0
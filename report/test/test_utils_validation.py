@@ -0,0 +1,114 @@
+# Copyright 2022 Tier IV, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of vectorized validation kernels (RaggedSeries) against the previous per-series implementation
+"""
+from itertools import groupby
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('caret_analyze')
+from common.utils import trail_df
+from common.utils_validation import RaggedSeries, calc_limit_violation_list, calc_limit_violation
+
+
+def calc_limit_violation_by_groupby(values: pd.Series, lower_limit: float, upper_limit: float) -> tuple[float, float, int, int]:
+    """The previous implementation in Result.validate()"""
+    ratio_lower_limit = float((values < lower_limit).sum() / len(values))
+    ratio_upper_limit = float((values > upper_limit).sum() / len(values))
+    flag_group = [(flag, len(list(group))) for flag, group in groupby(values, key=lambda x: x < lower_limit)]
+    group = [x[1] for x in flag_group if x[0]]
+    burst_num_lower_limit = max(group) if len(group) > 0 else 0
+    flag_group = [(flag, len(list(group))) for flag, group in groupby(values, key=lambda x: x > upper_limit)]
+    group = [x[1] for x in flag_group if x[0]]
+    burst_num_upper_limit = max(group) if len(group) > 0 else 0
+    return ratio_lower_limit, ratio_upper_limit, burst_num_lower_limit, burst_num_upper_limit
+
+
+def create_values_list(seed: int) -> list[pd.Series]:
+    rng = np.random.default_rng(seed)
+    values_list = []
+    for num in rng.integers(2, 300, 50):
+        # runs of values out of limits
+        values = np.repeat(rng.normal(100.0, 30.0, num), rng.integers(1, 5, num))
+        values_list.append(pd.Series(values))
+    values_list += [pd.Series([200.0, 200.0]), pd.Series([0.0, 0.0, 0.0]), pd.Series([100.0, 100.0])]
+    return values_list
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_calc_limit_violation_list(seed):
+    values_list = create_values_list(seed)
+    rng = np.random.default_rng(seed)
+    lower_limit_list = list(rng.uniform(40.0, 90.0, len(values_list)))
+    upper_limit_list = list(rng.uniform(110.0, 160.0, len(values_list)))
+    result_list = calc_limit_violation_list(values_list, lower_limit_list, upper_limit_list)
+    for values, lower_limit, upper_limit, result in zip(values_list, lower_limit_list, upper_limit_list, result_list):
+        assert result == calc_limit_violation_by_groupby(values, lower_limit, upper_limit)
+        assert result == calc_limit_violation(values, lower_limit, upper_limit)
+
+
+def test_calc_limit_violation_series_boundary():
+    # a run at the end of a series doesn't continue into the next series
+    result_list = calc_limit_violation_list([[1.0, 0.0, 0.0], [0.0, 0.0, 1.0], [0.0]], [0.5] * 3, [2.0] * 3)
+    assert [result[2] for result in result_list] == [2, 2, 1]
+    assert calc_limit_violation_list([], [], []) == []
+
+
+def calc_stats_by_dataframe(values: pd.Series) -> dict[str, float]:
+    """The previous implementation in Stats of validate_callback"""
+    stats = {'avg': float(values.mean()), 'std': float(values.std()), 'min': float(values.min()), 'max': float(values.max()),
+             'percentile5_min': float(values.quantile(0.05)), 'percentile5_max': float(values.quantile(0.95))}
+    df_percentile5 = values[(values >= stats['percentile5_min']) & (values <= stats['percentile5_max'])]
+    stats['percentile5_avg'] = float(df_percentile5.mean()) if len(df_percentile5) > 2 else stats['avg']
+    return stats
+
+
+def create_trail_values_list(seed: int) -> list[pd.Series]:
+    rng = np.random.default_rng(seed)
+    values_list = []
+    for num in rng.integers(0, 30, 100):
+        values = rng.choice([0.0, 0.0, np.nan, 1.0, 2.5, 3.0], num)
+        values_list.append(pd.Series(values))
+    return values_list + [pd.Series([], dtype=float), pd.Series([0.0, 0.0]), pd.Series([np.nan])]
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('start_strip_num, end_strip_num', [(0, 0), (0, 2), (1, 2)])
+def test_ragged_series_trail(seed, start_strip_num, end_strip_num):
+    values_list = create_trail_values_list(seed)
+    ragged_series = RaggedSeries.from_list(values_list).trail(start_strip_num=start_strip_num, end_strip_num=end_strip_num)
+    assert len(ragged_series) == len(values_list)
+    for index, values in enumerate(values_list):
+        expected = trail_df(values, start_strip_num=start_strip_num, end_strip_num=end_strip_num)
+        np.testing.assert_array_equal(ragged_series.get(index), expected.to_numpy())
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_ragged_series_calc_stats(seed):
+    values_list = [values.dropna() for values in create_values_list(seed)] + [pd.Series([1.0]), pd.Series([], dtype=float)]
+    stats_dict = RaggedSeries.from_list(values_list).calc_stats()
+    for index, values in enumerate(values_list):
+        if len(values) < 2:
+            assert all(np.isnan(stats_dict[name][index]) for name in stats_dict)
+            continue
+        for name, value in calc_stats_by_dataframe(values).items():
+            assert stats_dict[name][index] == pytest.approx(value, rel=1e-9), name
+
+
+def test_ragged_series_select():
+    values_list = [[1.0, 2.0], [], [3.0], [4.0, 5.0, 6.0]]
+    ragged_series = RaggedSeries.from_list(values_list).select([3, 1, 0])
+    assert [list(ragged_series.get(index)) for index in range(len(ragged_series))] == [[4.0, 5.0, 6.0], [], [1.0, 2.0]]
@@ -31,7 +31,7 @@ from anytree import Node, RenderTree
 import flask
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
-from common.utils import create_logger
+from common.utils import create_logger, load_architecture
 
 _logger = create_logger(__name__)
 app = flask.Flask(__name__)
@@ -183,7 +183,7 @@ def create_trace_list(dest_dir: str, report_dir: str):
     # topic_stats_file_list = glob.glob(f'{report_dir}/validate_topic/**/stats_FREQUENCY.yaml', recursive=True)
     # topic_stats_list = create_stats_list(topic_stats_file_list)
 
-    arch = Architecture('yaml', report_dir + '/architecture.yaml')
+    arch = load_architecture(report_dir + '/architecture.yaml', _logger)
     tree_root = trace_failure(callback_stats_list, arch)
 
     # for pre, fill, node in RenderTree(tree_root):
@@ -14,7 +14,7 @@
 """
 Script to validate callback functions
 """
-from typing import List, Optional, Tuple
+from typing import List, Optional
 import sys
 import os
 from pathlib import Path
@@ -22,18 +22,20 @@ import argparse
 from distutils.util import strtobool
 import logging
 import re
-from itertools import groupby
 import csv
 import yaml
-import pandas as pd
+import numpy as np
 from caret_analyze import Architecture, Application
 from caret_analyze.runtime.node import Node
 from caret_analyze.runtime.callback import CallbackBase, CallbackType
-from caret_analyze.plot import Plot
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
-from common.utils import create_logger, make_destination_dir, read_trace_data, export_graph, trail_df, get_callback_legend
-from common.utils import ComponentManager
-from common.utils_validation import Metrics, ResultStatus
+from common.utils import create_logger, make_destination_dir, read_trace_data, get_callback_legend
+from common.utils import run_in_parallel, GraphExporter, flush_graph
+from common.utils import ComponentManager, TraceCache, load_trace_cache
+from common.utils_metrics import CallbackMetrics
+from common.utils_aggregate import TraceAggregate, AggregatedCallbackMetrics
+from common.utils_stats import StatsSketch
+from common.utils_validation import Metrics, ResultStatus, GraphOnDemand, RaggedSeries
 
 # Suppress log for CARET
 from logging import getLogger, FATAL
@@ -47,15 +49,6 @@ warnings.simplefilter("ignore")
 _logger: logging.Logger = None
 
 
-def get_node_plot(callbacks: list[CallbackBase], metrics: Metrics):
-    if metrics == Metrics.FREQUENCY:
-        return Plot.create_frequency_timeseries_plot(callbacks)
-    elif metrics == Metrics.PERIOD:
-        return Plot.create_period_timeseries_plot(callbacks)
-    elif metrics == Metrics.LATENCY:
-        return Plot.create_latency_timeseries_plot(callbacks)
-
-
 class Expectation():
     id = 0
 
@@ -85,12 +78,7 @@ class Expectation():
 
     @staticmethod
     def find_expectation(expectation_list: list, callback: CallbackBase):
-        for expectation in expectation_list:
-            if re.search(expectation.node_name, callback.node_name) and expectation.callback_type == callback.callback_type:
-                if (callback.callback_type == CallbackType.TIMER and expectation.period_ns == callback.timer.period_ns) or \
-                   (callback.callback_type == CallbackType.SUBSCRIPTION and expectation.topic_name == callback.subscription.topic_name):
-                    return expectation
-        return None
+        return ExpectationIndex(expectation_list).find(callback)
 
     @staticmethod
     def _read_expectation_csv(expectation_csv_filename: str) -> List[dict]:
@@ -170,6 +158,34 @@ class Expectation():
         return expectation_list
 
 
+class ExpectationIndex():
+    """Index to find the expectation of callback
+
+    Expectations are bucketed by (callback_type, period_ns or topic_name) and node name patterns are compiled once.
+    The first matched expectation in the original (CSV) order is returned, the same as scanning the list
+    """
+    def __init__(self, expectation_list: List[Expectation]):
+        self._bucket_dict: dict[tuple, list[tuple[re.Pattern, Expectation]]] = {}
+        for expectation in expectation_list:
+            trigger = expectation.period_ns if expectation.callback_type == CallbackType.TIMER else expectation.topic_name
+            key = (expectation.callback_type.type_name, trigger)
+            self._bucket_dict.setdefault(key, []).append((re.compile(expectation.node_name), expectation))
+        self._cache: dict[tuple, Optional[Expectation]] = {}
+
+    def find(self, callback: CallbackBase) -> Optional[Expectation]:
+        if callback.callback_type == CallbackType.TIMER:
+            key = (callback.callback_type.type_name, callback.timer.period_ns)
+        elif callback.callback_type == CallbackType.SUBSCRIPTION:
+            key = (callback.callback_type.type_name, callback.subscription.topic_name)
+        else:
+            return None
+        cache_key = (key, callback.node_name)
+        if cache_key not in self._cache:
+            self._cache[cache_key] = next((expectation for node_name_regexp, expectation in self._bucket_dict.get(key, [])
+                                           if node_name_regexp.search(callback.node_name)), None)
+        return self._cache[cache_key]
+
+
 class Stats():
 
     def __init__(self):
@@ -191,8 +207,8 @@ class Stats():
         self.percentile5_avg = -1
 
     @staticmethod
-    def from_df(component_name: str, node_name: str, callback: CallbackBase,
-                metrics: Metrics, graph_filename: str, df_callback: pd.DataFrame):
+    def from_callback(component_name: str, node_name: str, callback: CallbackBase,
+                      metrics: Metrics, graph_filename: str):
         stats = Stats()
         stats.component_name = component_name
         stats.node_name = node_name
@@ -203,23 +219,23 @@ class Stats():
         stats.subscribe_topic_name = callback.subscribe_topic_name if callback.callback_type == CallbackType.SUBSCRIPTION else ''
         stats.metrics = metrics.name
         stats.graph_filename = graph_filename
+        return stats
 
-        df_callback = df_callback.iloc[:, 1]                  # get metrics value only
-        df_callback = trail_df(df_callback, end_strip_num=2)  # remove the last data because freq becomes small
-
-        if len(df_callback) >= 2:
-            stats.avg = float(df_callback.mean())
-            stats.std = float(df_callback.std())
-            stats.min = float(df_callback.min())
-            stats.max = float(df_callback.max())
-            stats.percentile5_min = float(df_callback.quantile(0.05))
-            stats.percentile5_max = float(df_callback.quantile(0.95))
-            df_percentile5 = df_callback[(df_callback >= stats.percentile5_min) & (df_callback <= stats.percentile5_max)]
-            stats.percentile5_avg = float(df_percentile5.mean()) if len(df_percentile5) > 2 else stats.avg
-        else:
-            _logger.info(f'This callback is not called: {node_name}: {callback.callback_name}')
-            return None, None
-        return stats, df_callback
+    def set_stats(self, stats_dict: dict[str, np.ndarray], index: int):
+        """Set stats calculated by RaggedSeries.calc_stats"""
+        for name in ['avg', 'std', 'min', 'max', 'percentile5_min', 'percentile5_max', 'percentile5_avg']:
+            setattr(self, name, float(stats_dict[name][index]))
+
+    def set_stats_from_sketch(self, sketch: StatsSketch):
+        """Set stats calculated from sketch (the same as RaggedSeries.calc_stats except for quantile error)"""
+        self.avg = sketch.mean()
+        self.std = sketch.std()
+        self.min = sketch.min()
+        self.max = sketch.max()
+        self.percentile5_min = sketch.quantile(0.05)
+        self.percentile5_max = sketch.quantile(0.95)
+        percentile5_avg, percentile5_num = sketch.mean_between(self.percentile5_min, self.percentile5_max)
+        self.percentile5_avg = percentile5_avg if percentile5_num > 2 else self.avg
 
     @staticmethod
     def from_expectation(component_name: str, expectation: Expectation, metrics: Metrics):
@@ -262,102 +278,128 @@ class Result():
             self.expectation_ratio = expectation.ratio
             self.expectation_burst_num = expectation.burst_num
 
-    def validate(self, df_callback: pd.DataFrame, expectation: Expectation):
-        if expectation.value <= 0:
-            # it's not expected to be tested but don't use OUT_OF_SCOPE
-            self.result_status = ResultStatus.DONT_CARE.name
-            return
-        if len(df_callback) >= 2:
-            self.result_status = ResultStatus.PASS.name
-            self.ratio_lower_limit = float((df_callback < expectation.lower_limit).sum() / len(df_callback))
-            self.ratio_upper_limit = float((df_callback > expectation.upper_limit).sum() / len(df_callback))
-            if self.ratio_lower_limit > expectation.ratio:
-                self.result_ratio_lower_limit = ResultStatus.FAILED.name
-            if self.ratio_upper_limit > expectation.ratio:
-                self.result_ratio_upper_limit = ResultStatus.FAILED.name
-
-            flag_group = [(flag, len(list(group))) for flag, group in groupby(df_callback, key=lambda x: x < expectation.lower_limit)]
-            group = [x[1] for x in flag_group if x[0]]
-            self.burst_num_lower_limit = max(group) if len(group) > 0 else 0
-            flag_group = [(flag, len(list(group))) for flag, group in groupby(df_callback, key=lambda x: x > expectation.upper_limit)]
-            group = [x[1] for x in flag_group if x[0]]
-            self.burst_num_upper_limit = max(group) if len(group) > 0 else 0
-            if self.burst_num_lower_limit > expectation.burst_num:
-                self.result_burst_num_lower_limit = ResultStatus.FAILED.name
-            if self.burst_num_upper_limit > expectation.burst_num:
-                self.result_burst_num_upper_limit = ResultStatus.FAILED.name
-
-        if self.result_ratio_lower_limit == ResultStatus.FAILED.name or \
-           self.result_ratio_upper_limit == ResultStatus.FAILED.name or \
-           self.result_burst_num_lower_limit == ResultStatus.FAILED.name or\
-           self.result_burst_num_upper_limit == ResultStatus.FAILED.name:
-            self.result_status = ResultStatus.FAILED.name
-
-
-def create_stats_for_node(node: Node, metrics: Metrics, dest_dir: str, component_name: str, xaxis_type: str,
-                          not_display_callback_list=[]) -> dict[str, Tuple[Stats, pd.DataFrame]]:
-    stats_list = {}
-    try:
-        timeseries_plot = get_node_plot(node.callbacks, metrics)
-        df_node = timeseries_plot.to_dataframe(xaxis_type=xaxis_type)
-    except:
-        _logger.info(f'This node is not called: {node.node_name}')
-        return stats_list
-
-    graph_filename = metrics.name + node.node_name.replace('/', '_')
-    graph_filename = graph_filename[:250]
-    has_valid_data = False
-    for callback in node.callbacks:
-        df_callback = df_node[callback.callback_name]
-        stats, df = Stats.from_df(component_name, node.node_name, callback, metrics, graph_filename, df_callback)
-        if stats:
-            has_valid_data = True
-            stats_list[callback.callback_name] = stats, df
-
-    if has_valid_data:
-        try:
-            # Don't display callbacks with high frequency because it takes very long time
-            callbacks = node.callbacks
-            for not_display_callback in not_display_callback_list:
-                if not_display_callback in node.callback_names:
-                    _logger.info(f'{not_display_callback} is not displayed in graph')
-                    callbacks.remove(node.get_callback(not_display_callback))
-            timeseries_plot = get_node_plot(callbacks, metrics)
-            figure = timeseries_plot.figure(xaxis_type=xaxis_type)  # note: this API is heavy when callback runs with high frequency
-            figure.y_range.start = 0
-            export_graph(figure, dest_dir, graph_filename, with_png=False, logger=_logger)
-        except:
-            _logger.info('Failed to export graph')
+    @staticmethod
+    def validate_batch(result_list: list['Result'], limit_violation: dict[str, np.ndarray], expectation_list: List[Expectation]):
+        """Validate results at once
 
-    return stats_list
+        limit_violation (see RaggedSeries.calc_limit_violation) and expectation_list are aligned with result_list
+        """
+        if len(result_list) == 0:
+            return
+        expectation_table = {name: np.array([getattr(expectation, name) for expectation in expectation_list], dtype=float)
+                             for name in ['value', 'ratio', 'burst_num']}
+        is_failed = {name: values > expectation_table['ratio' if name.startswith('ratio') else 'burst_num']
+                     for name, values in limit_violation.items()}
+        # it's not expected to be tested but don't use OUT_OF_SCOPE
+        is_dont_care = expectation_table['value'] <= 0
+
+        for index, result in enumerate(result_list):
+            if is_dont_care[index]:
+                result.result_status = ResultStatus.DONT_CARE.name
+                continue
+            result.result_status = ResultStatus.PASS.name
+            for name, values in limit_violation.items():
+                setattr(result, name, values[index].item())
+                if is_failed[name][index]:
+                    setattr(result, f'result_{name}', ResultStatus.FAILED.name)
+                    result.result_status = ResultStatus.FAILED.name
 
 
 def validate_callback(component_name: str, target_node_list: list[Node], metrics: Metrics, dest_dir: str,
-                      xaxis_type: str, expectation_list: List[Expectation] = [], not_display_callback_list=[]) -> list[Result]:
-    expectation_validated_list = expectation_list.copy()   # keep original because there may be multiple callbacks with the same parameters in a node
-    result_info_list: list[Result] = []
+                      xaxis_type: str, callback_metrics: CallbackMetrics, expectation_list: List[Expectation] = []) -> list[Result]:
+    """Validate callbacks in nodes
+
+    Measured series of all the callbacks are held as one RaggedSeries, so that stats and limit violation are calculated at once.
+    If callback_metrics doesn't have all the values (trace data aggregated in windows), sketch and limit violation of each callback are used
+    """
+    expectation_index = ExpectationIndex(expectation_list)
+    validated_expectation_id_set = set()   # keep original list because there may be multiple callbacks with the same parameters in a node
+    has_all_values = callback_metrics.has_all_values(metrics.name)
+
+    row_list: list[tuple[Node, CallbackBase]] = []
+    values_list = []
+    sketch_list: list[StatsSketch] = []
     for node in target_node_list:
         _logger.debug(f'Processing ({metrics.name}): {node.node_name}')
-        stats_list = create_stats_for_node(node, metrics, dest_dir, component_name, xaxis_type, not_display_callback_list)
-
+        if has_all_values:
+            measurement = callback_metrics.calculate(node.callbacks, metrics.name)
+        else:
+            measurement = callback_metrics.calculate_sketch(node.callbacks, metrics.name, end_strip_num=2)
+        if not measurement:
+            _logger.info(f'This node is not called: {node.node_name}')
+            continue
         for callback in node.callbacks:
-            if callback.callback_name not in stats_list:
-                # Not measured
-                continue
-            # Measured
-            expectation = Expectation.find_expectation(expectation_list, callback)
-            stats = stats_list[callback.callback_name][0]
-            df_callback = stats_list[callback.callback_name][1]
-            result = Result(stats, expectation)
-            if expectation:
+            row_list.append((node, callback))
+            if has_all_values:
+                values_list.append(measurement[callback.callback_name][1])
+            else:
+                sketch_list.append(measurement[callback.callback_name])
+    if has_all_values:
+        series = RaggedSeries.from_list(values_list).trail(end_strip_num=2)  # remove the last data because freq becomes small
+        series_size = series.size
+        stats_dict = series.calc_stats()
+    else:
+        series_size = [sketch.count for sketch in sketch_list]
+
+    result_info_list: list[Result] = []
+    node_result_dict: dict[str, tuple[Node, list[Result]]] = {}
+    validation_index_list: list[int] = []
+    validation_result_list: list[Result] = []
+    validation_expectation_list: list[Expectation] = []
+    violation_list: list[dict[str, float]] = []
+    for index, (node, callback) in enumerate(row_list):
+        if series_size[index] < 2:
+            # Not measured
+            _logger.info(f'This callback is not called: {node.node_name}: {callback.callback_name}')
+            continue
+        # Measured
+        graph_filename = metrics.name + node.node_name.replace('/', '_')
+        graph_filename = graph_filename[:250]
+        stats = Stats.from_callback(component_name, node.node_name, callback, metrics, graph_filename)
+        if has_all_values:
+            stats.set_stats(stats_dict, index)
+        else:
+            stats.set_stats_from_sketch(sketch_list[index])
+        expectation = expectation_index.find(callback)
+        result = Result(stats, expectation)
+        if expectation:
+            validated_expectation_id_set.add(expectation.id)
+            violation = None
+            if not has_all_values:
+                violation = callback_metrics.calc_limit_violation(callback, metrics.name, expectation.lower_limit,
+                                                                  expectation.upper_limit, end_strip_num=2)
+            if has_all_values or violation:
                 # Measured and to be validated
-                result.validate(df_callback, expectation)
-                if expectation in expectation_validated_list:
-                    expectation_validated_list.remove(expectation)
-            result_info_list.append(result)
+                validation_index_list.append(index)
+                validation_result_list.append(result)
+                validation_expectation_list.append(expectation)
+                violation_list.append(violation)
+            else:
+                _logger.warning(f'Limit violation is not aggregated, so not validated: {node.node_name}: {callback.callback_name}')
+        result_info_list.append(result)
+        node_result_dict.setdefault(node.node_name, (node, []))[1].append(result)
+
+    if has_all_values:
+        limit_violation = series.select(validation_index_list).calc_limit_violation(
+            np.array([expectation.lower_limit for expectation in validation_expectation_list], dtype=float),
+            np.array([expectation.upper_limit for expectation in validation_expectation_list], dtype=float))
+    else:
+        limit_violation = {name: np.array([violation[name] for violation in violation_list]) for name in violation_list[0]} if violation_list else {}
+    Result.validate_batch(validation_result_list, limit_violation, validation_expectation_list)
+
+    # Create graphs after validation, so that only graphs of failed callbacks are exported in graphs-on-demand mode
+    for node, node_result_list in node_result_dict.values():
+        try:
+            # Each series is downsampled, so callbacks with high frequency can be displayed
+            figure = callback_metrics.create_timeseries_figure(node, node.callbacks, metrics.name, xaxis_type, y_range_start=0)
+        except:
+            _logger.info('Failed to create graph')
+            continue
+        GraphOnDemand.export(figure, dest_dir, node_result_list[0].stats.graph_filename, [result.result_status for result in node_result_list],
+                             [node.node_name], with_png=False, logger=_logger)
 
-    for expectation in expectation_validated_list:
-        if expectation.value > 0:
+    for expectation in expectation_list:
+        if expectation.id not in validated_expectation_id_set and expectation.value > 0:
             # Not measured but should be validated
             result = Result(Stats.from_expectation(component_name, expectation, metrics), expectation)
             result_info_list.append(result)
@@ -382,7 +424,9 @@ def save_stats(app: Application, result_list: list[Result], component_name: str,
         yaml.safe_dump(result_var_list, f_yaml, encoding='utf-8', allow_unicode=True, sort_keys=False)
 
 
-def validate_component(app: Application, component_name: str, dest_dir: str, force: bool, expectation_csv_filename: str, xaxis_type: str):
+def validate_component(app: Application, component_name: str, dest_dir: str, force: bool,
+                       frequency_expectation_list: List[Expectation], latency_expectation_list: List[Expectation],
+                       xaxis_type: str, callback_metrics: CallbackMetrics):
     """Validate callback for each component"""
     dest_dir = f'{dest_dir}/validate_callback/{component_name}'
     make_destination_dir(dest_dir, force, _logger)
@@ -393,36 +437,24 @@ def validate_component(app: Application, component_name: str, dest_dir: str, for
             target_node_list.append(node)
 
     # validate callback frequency
-    frequency_expectation_list = Expectation.read_frequency_expectations(expectation_csv_filename, component_name)
-    result_list = validate_callback(component_name, target_node_list, Metrics.FREQUENCY, dest_dir, xaxis_type,
+    result_list = validate_callback(component_name, target_node_list, Metrics.FREQUENCY, dest_dir, xaxis_type, callback_metrics,
                                     expectation_list=frequency_expectation_list)
     save_stats(app, result_list, component_name, dest_dir, Metrics.FREQUENCY.name)
 
-    # callbacks with high frequency is not displayed
-    THRESHOLD_FREQ_NOT_DISPLAY = 200
-    not_display_callback_list = []
-    for result in result_list:
-        average_freq = result.stats['avg']
-        is_numeric = isinstance(average_freq, int) or isinstance(average_freq, float)
-        if is_numeric and average_freq >= THRESHOLD_FREQ_NOT_DISPLAY:
-            not_display_callback_list.append(result.stats['callback_name'])
-
     # validate callback period
-    result_list = validate_callback(component_name, target_node_list, Metrics.PERIOD, dest_dir, xaxis_type,
-                                    not_display_callback_list=not_display_callback_list)
+    result_list = validate_callback(component_name, target_node_list, Metrics.PERIOD, dest_dir, xaxis_type, callback_metrics)
     save_stats(app, result_list, component_name, dest_dir, Metrics.PERIOD.name)
 
     # validate callback latency
-    latency_expectation_list = Expectation.read_latency_expectations(expectation_csv_filename, component_name)
-    result_list = validate_callback(component_name, target_node_list, Metrics.LATENCY, dest_dir, xaxis_type,
-                                    expectation_list=latency_expectation_list,
-                                    not_display_callback_list=not_display_callback_list)
+    result_list = validate_callback(component_name, target_node_list, Metrics.LATENCY, dest_dir, xaxis_type, callback_metrics,
+                                    expectation_list=latency_expectation_list)
     save_stats(app, result_list, component_name, dest_dir, Metrics.LATENCY.name)
 
 
 def validate(verbose, arch: Architecture, app: Application, dest_dir: str, force: bool,
-             component_list_json: str, expectation_csv_filename: str, xaxis_type: str):
-    """Validate callback"""
+             component_list_json: str, expectation_csv_filename: str, xaxis_type: str,
+             trace_cache: TraceCache = None, jobs: int = 1, trace_aggregate: TraceAggregate = None):
+    """Validate callback (from trace_aggregate if given, see common.utils_aggregate)"""
     global _logger
     if _logger is None:
         _logger = create_logger(__name__, logging.DEBUG if verbose else logging.INFO)
@@ -431,10 +463,18 @@ def validate(verbose, arch: Architecture, app: Application, dest_dir: str, force
 
     make_destination_dir(dest_dir + '/validate_callback', force, _logger)
     ComponentManager().initialize(component_list_json, _logger)
+    callback_metrics = AggregatedCallbackMetrics(trace_aggregate) if trace_aggregate else CallbackMetrics(trace_cache)
 
+    # Read expectations in advance so that expectation id doesn't depend on the number of jobs
+    task_list = []
     for component_name, _ in ComponentManager().component_dict.items():
-        validate_component(app, component_name, dest_dir, force, expectation_csv_filename, xaxis_type)
+        frequency_expectation_list = Expectation.read_frequency_expectations(expectation_csv_filename, component_name)
+        latency_expectation_list = Expectation.read_latency_expectations(expectation_csv_filename, component_name)
+        task_list.append((app, component_name, dest_dir, force, frequency_expectation_list, latency_expectation_list,
+                          xaxis_type, callback_metrics))
+    run_in_parallel(validate_component, task_list, jobs)
 
+    flush_graph()
     _logger.info('<<< Validate callback finish >>>')
 
 
@@ -450,6 +490,16 @@ def parse_arg():
     parser.add_argument('--end_strip', type=float, default=0.0,
                         help='End strip [sec] to load trace data')
     parser.add_argument('--sim_time', type=strtobool, default=False)
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='The number of processes to validate in parallel')
+    parser.add_argument('--export_jobs', type=int, default=0,
+                        help='The number of processes to export graphs in background (0: export in the main process)')
+    parser.add_argument('--trace_cache_dir', type=str, default='',
+                        help='Directory to store timestamps extracted from trace data (disabled if empty)')
+    parser.add_argument('--graph_mode', type=str, default='all', choices=['all', 'failed'],
+                        help='failed: export graphs of FAILED/NOT_MEASURED items only, and defer the others (see export_deferred_graphs.py)')
+    parser.add_argument('--graph_allowlist', type=str, default='',
+                        help='Regular expression of topic/node names whose graphs are always exported in failed graph mode')
     parser.add_argument('-f', '--force', action='store_true', default=False,
                         help='Overwrite report directory')
     parser.add_argument('-v', '--verbose', action='store_true', default=False)
@@ -468,6 +518,12 @@ def main():
     _logger.debug(f'expectation_csv_filename: {args.expectation_csv_filename}')
     _logger.debug(f'start_strip: {args.start_strip}, end_strip: {args.end_strip}')
     _logger.debug(f'sim_time: {args.sim_time}')
+    _logger.debug(f'jobs: {args.jobs}')
+    _logger.debug(f'export_jobs: {args.export_jobs}')
+    GraphExporter.start(args.export_jobs)
+    _logger.debug(f'trace_cache_dir: {args.trace_cache_dir}')
+    _logger.debug(f'graph_mode: {args.graph_mode}, graph_allowlist: {args.graph_allowlist}')
+    GraphOnDemand.configure(args.graph_mode, args.graph_allowlist)
     dest_dir = args.report_directory if args.report_directory != '' else f'val_{Path(args.trace_data[0]).stem}'
     _logger.debug(f'dest_dir: {dest_dir}')
     xaxis_type = 'sim_time' if args.sim_time else 'system_time'
@@ -475,8 +531,10 @@ def main():
     lttng = read_trace_data(args.trace_data[0], args.start_strip, args.end_strip, False)
     arch = Architecture('lttng', str(args.trace_data[0]))
     app = Application(arch, lttng)
+    trace_cache = load_trace_cache(args.trace_cache_dir, args.trace_data[0], args.start_strip, args.end_strip, app, _logger)
 
-    validate(args.verbose, arch, app, dest_dir, args.force, args.component_list_json, args.expectation_csv_filename, xaxis_type)
+    validate(args.verbose, arch, app, dest_dir, args.force, args.component_list_json, args.expectation_csv_filename, xaxis_type,
+             trace_cache, args.jobs)
 
 
 if __name__ == '__main__':
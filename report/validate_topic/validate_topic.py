@@ -24,7 +24,6 @@ from distutils.util import strtobool
 import logging
 import re
 import copy
-from itertools import groupby
 import csv
 import yaml
 import numpy as np
@@ -35,9 +34,14 @@ from caret_analyze.runtime.callback import CallbackBase, CallbackType
 from caret_analyze.runtime.communication import Communication, Subscription, Publisher
 from caret_analyze.plot import Plot
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/..')
-from common.utils import create_logger, make_destination_dir, read_trace_data, export_graph, trail_df
-from common.utils import ComponentManager
-from common.utils_validation import Metrics, ResultStatus
+from common.utils import create_logger, make_destination_dir, read_trace_data, trail_df
+from common.utils import ComponentManager, run_in_parallel, GraphExporter, flush_graph
+from common.utils import TraceCache, load_trace_cache, FigureSpec
+from common.utils_metrics import CommunicationMetrics, Y_AXIS_LABEL
+from common.utils_aggregate import TraceAggregate, AggregatedCommunicationMetrics
+from common.utils_plot import create_timeseries_figure, timeseries_from_dataframe
+from common.utils_validation import Metrics, ResultStatus, GraphOnDemand, calc_limit_violation
+from common.utils_stats import StatsSketch
 
 
 # Suppress log for CARET
@@ -52,16 +56,6 @@ warnings.simplefilter("ignore")
 _logger: logging.Logger = None
 
 
-def get_comm_plot(comm: Communication, metrics: Metrics):
-    # todo: create_communication_frequency_plot doesn't work (it's stuck and consumes too much memory)
-    if metrics == Metrics.FREQUENCY:
-        return Plot.create_frequency_timeseries_plot([comm.publisher, comm.subscription])
-    elif metrics == Metrics.PERIOD:
-        return Plot.create_period_timeseries_plot([comm.publisher, comm.subscription])
-    elif metrics == Metrics.LATENCY:
-        return Plot.create_latency_timeseries_plot(comm)
-
-
 def get_callback_plot(callback: CallbackBase, metrics: Metrics):
     if metrics == Metrics.FREQUENCY:
         return Plot.create_frequency_timeseries_plot([callback])
@@ -89,36 +83,56 @@ class Expectation():
 
     @staticmethod
     def find_expectation(expectation_list: list, topic_name, publish_node_name, subscribe_node_name):
+        return Expectation.make_expectation_dict(expectation_list).get((topic_name, publish_node_name, subscribe_node_name))
+
+    @staticmethod
+    def make_expectation_dict(expectation_list: list) -> dict[tuple[str, str, str], 'Expectation']:
+        """Make dict to find expectation by (topic_name, publish_node_name, subscribe_node_name). The first one in the list is used"""
+        expectation_dict = {}
         for expectation in expectation_list:
-            if expectation.topic_name == topic_name and \
-                expectation.publish_node_name == publish_node_name and expectation.subscribe_node_name == subscribe_node_name:
-                return expectation
-        return None
+            expectation_dict.setdefault((expectation.topic_name, expectation.publish_node_name, expectation.subscribe_node_name), expectation)
+        return expectation_dict
 
     @staticmethod
-    def from_csv(expectation_csv_filename: str, publish_component_name: Optional[str], subscribe_component_name: Optional[str], lower_limit_scale=0.8, upper_limit_scale=1.2, ratio=0.2, burst_num=5) -> List:
-        expectation_list: list[Expectation] = []
+    def read_csv(expectation_csv_filename: str) -> dict[tuple[str, str], list[dict]]:
+        """Read expectation csv, and group rows by (publish_component_name, subscribe_component_name)"""
+        row_dict: dict[tuple[str, str], list[dict]] = {}
         if not os.path.isfile(expectation_csv_filename):
             _logger.error(f"Unable to read expectation csv: {expectation_csv_filename}")
-            return []
+            return row_dict
         with open(expectation_csv_filename, 'r', encoding='utf-8') as csvfile:
             for row in csv.DictReader(csvfile, ['topic_name', 'publish_node_name', 'publish_component_name', 'subscribe_node_name', 'subscribe_component_name', 'value']):
+                row_dict.setdefault((row['publish_component_name'], row['subscribe_component_name']), []).append(row)
+        return row_dict
+
+    @staticmethod
+    def from_rows(row_list: list[dict], lower_limit_scale=0.8, upper_limit_scale=1.2, ratio=0.2, burst_num=5) -> List:
+        """Create expectations from rows of expectation csv (see read_csv)"""
+        expectation_list: list[Expectation] = []
+        for row in row_list:
+            try:
                 try:
-                    if (publish_component_name is not None and row['publish_component_name'] != publish_component_name) \
-                        or (subscribe_component_name is not None and row['subscribe_component_name'] != subscribe_component_name):
-                        continue
-                    try:
-                        value = float(row['value'])
-                    except ValueError:
-                        value = 0
-                    expectation = Expectation(row['topic_name'], row['publish_node_name'], row['publish_component_name'],
-                        row['subscribe_node_name'], row['subscribe_component_name'], value, value * lower_limit_scale, value * upper_limit_scale, ratio if value > 1 else 0.5, burst_num)
-                except:
-                    _logger.error(f"Error at reading: {row['topic_name']}")
-                    return None
-                expectation_list.append(expectation)
+                    value = float(row['value'])
+                except ValueError:
+                    value = 0
+                expectation = Expectation(row['topic_name'], row['publish_node_name'], row['publish_component_name'],
+                    row['subscribe_node_name'], row['subscribe_component_name'], value, value * lower_limit_scale, value * upper_limit_scale, ratio if value > 1 else 0.5, burst_num)
+            except:
+                _logger.error(f"Error at reading: {row['topic_name']}")
+                return None
+            expectation_list.append(expectation)
         return expectation_list
 
+    @staticmethod
+    def from_csv(expectation_csv_filename: str, publish_component_name: Optional[str], subscribe_component_name: Optional[str], lower_limit_scale=0.8, upper_limit_scale=1.2, ratio=0.2, burst_num=5) -> List:
+        row_list = []
+        for (read_publish_component_name, read_subscribe_component_name), rows in Expectation.read_csv(expectation_csv_filename).items():
+            if (publish_component_name is not None and read_publish_component_name != publish_component_name) \
+                or (subscribe_component_name is not None and read_subscribe_component_name != subscribe_component_name):
+                continue
+            row_list.extend(rows)
+        return Expectation.from_rows(row_list, lower_limit_scale, upper_limit_scale, ratio, burst_num)
+
 class Stats():
     def __init__(self):
         self.topic_name = ''
@@ -137,7 +151,9 @@ class Stats():
         self.percentile5_avg = -1
 
     @staticmethod
-    def from_df(component_pair: tuple[str], topic_name, publish_node_name, subscribe_node_name, metrics: Metrics, graph_filename: str, df_comm: pd.DataFrame):
+    def from_df(component_pair: tuple[str], topic_name, publish_node_name, subscribe_node_name, metrics: Metrics, graph_filename: str, df_comm: pd.DataFrame,
+                sketch: StatsSketch = None):
+        """Stats from dataframe, or from sketch if given (e.g. values of df_comm are downsampled for graph)"""
         stats = Stats()
         stats.topic_name = topic_name
         stats.publish_node_name = publish_node_name
@@ -150,19 +166,24 @@ class Stats():
         df_comm = df_comm.iloc[:, 1]                  # get metrics value only (use value of publish. df=|time|pub|time|sub|)
         df_comm = trail_df(df_comm, end_strip_num=2)  # remove the last data because freq becomes small
 
-        if len(df_comm) >= 2:
-            stats.avg = float(df_comm.mean())
-            stats.std = float(df_comm.std())
-            stats.min = float(df_comm.min())
-            stats.max = float(df_comm.max())
-            stats.percentile5_min = float(df_comm.quantile(0.05))
-            stats.percentile5_max = float(df_comm.quantile(0.95))
-            df_percentile5 = df_comm[(df_comm >= stats.percentile5_min) & (df_comm <= stats.percentile5_max)]
-            stats.percentile5_avg = float(df_percentile5.mean()) if len(df_percentile5) > 2 else stats.avg
+        sketch = sketch if sketch is not None else StatsSketch.from_values(df_comm)
+        if sketch.count >= 2:
+            stats.calculate_from_sketch(sketch)
         else:
             return None, None
         return stats, df_comm
 
+    def calculate_from_sketch(self, sketch: StatsSketch):
+        """Calculate stats from sketch (which may be merged from multiple chunks)"""
+        self.avg = sketch.mean()
+        self.std = sketch.std()
+        self.min = sketch.min()
+        self.max = sketch.max()
+        self.percentile5_min = sketch.quantile(0.05)
+        self.percentile5_max = sketch.quantile(0.95)
+        percentile5_avg, percentile5_num = sketch.mean_between(self.percentile5_min, self.percentile5_max)
+        self.percentile5_avg = percentile5_avg if percentile5_num > 2 else self.avg
+
     @staticmethod
     def from_expectation(expectation: Expectation, metrics: Metrics):
         stats = Stats()
@@ -209,19 +230,13 @@ class Result():
             return
         if len(df_topic) >= 2:
             self.result_status = ResultStatus.PASS.name
-            self.ratio_lower_limit = float((df_topic < expectation.lower_limit).sum() / len(df_topic))
-            self.ratio_upper_limit = float((df_topic > expectation.upper_limit).sum() / len(df_topic))
+            self.ratio_lower_limit, self.ratio_upper_limit, self.burst_num_lower_limit, self.burst_num_upper_limit = \
+                calc_limit_violation(df_topic, expectation.lower_limit, expectation.upper_limit)
             if self.ratio_lower_limit > expectation.ratio:
                 self.result_ratio_lower_limit = ResultStatus.FAILED.name
             # if self.ratio_upper_limit > expectation.ratio:
             #     self.result_ratio_upper_limit = ResultStatus.FAILED.name
 
-            flag_group = [(flag, len(list(group))) for flag, group in groupby(df_topic, key=lambda x: x < expectation.lower_limit)]
-            group = [x[1] for x in flag_group if x[0]]
-            self.burst_num_lower_limit = max(group) if len(group) > 0 else 0
-            flag_group = [(flag, len(list(group))) for flag, group in groupby(df_topic, key=lambda x: x > expectation.upper_limit)]
-            group = [x[1] for x in flag_group if x[0]]
-            self.burst_num_upper_limit = max(group) if len(group) > 0 else 0
             if self.burst_num_lower_limit > expectation.burst_num:
                 self.result_burst_num_lower_limit = ResultStatus.FAILED.name
             # if self.burst_num_upper_limit > expectation.burst_num:
@@ -234,93 +249,104 @@ class Result():
                 self.result_status = ResultStatus.FAILED.name
 
 
-def create_stats_for_comm(component_pair: tuple[str], comm: Communication, metrics: Metrics, dest_dir: str, xaxis_type: str) -> Tuple[Stats, pd.DataFrame]:
+def create_stats_for_comm(component_pair: tuple[str], comm: Communication, metrics: Metrics, dest_dir: str, xaxis_type: str,
+                          comm_metrics: CommunicationMetrics) -> Tuple[Stats, pd.DataFrame, FigureSpec]:
+    """Calculate stats of communication. Graph is not exported here but returned (see GraphOnDemand)"""
     try:
-        timeseries_plot = get_comm_plot(comm, metrics)
-        figure = timeseries_plot.figure(xaxis_type=xaxis_type)
-        figure.y_range.start = 0
+        df_comm = comm_metrics.to_dataframe(comm, metrics.name, xaxis_type)
         graph_filename = metrics.name + comm.topic_name.replace('/', '_') + comm.publish_node_name.replace('/', '_') + comm.subscribe_node_name.replace('/', '_')
         graph_filename = graph_filename[:250]
-        df_comm = timeseries_plot.to_dataframe(xaxis_type=xaxis_type)
-        stats, df = Stats.from_df(component_pair, comm.topic_name, comm.publish_node_name, comm.subscribe_node_name, metrics, graph_filename, df_comm)
+        sketch = None if comm_metrics.has_all_values(metrics.name) else comm_metrics.get_sketch(comm, metrics.name, df_comm, end_strip_num=2)
+        stats, df = Stats.from_df(component_pair, comm.topic_name, comm.publish_node_name, comm.subscribe_node_name, metrics, graph_filename, df_comm, sketch)
         if stats:
-            export_graph(figure, dest_dir, graph_filename, with_png=False, logger=_logger)
+            figure = comm_metrics.create_timeseries_figure(comm, metrics.name, df_comm, xaxis_type, y_range_start=0)
         else:
             raise Exception()
     except:
         _logger.info(f'This comm is invalid: {comm.topic_name}: {comm.publish_node_name} -> {comm.subscribe_node_name}')
-        return None, None
+        return None, None, None
 
-    return stats, df
+    return stats, df, figure
 
-def create_stats_for_callback_as_topic(app: Application, component_pair: tuple[str], expectation: Expectation, metrics: Metrics, dest_dir: str, xaxis_type: str) -> Tuple[Stats, pd.DataFrame]:
+def create_topic_callback_dict(app: Application) -> dict[str, str]:
+    """Make dict of topic name and callback name of the first subscription to the topic"""
+    topic_callback_dict = {}
+    for subscription in app.subscriptions:
+        topic_callback_dict.setdefault(subscription.topic_name, subscription.callback_name)
+    return topic_callback_dict
+
+
+def create_stats_for_callback_as_topic(app: Application, component_pair: tuple[str], expectation: Expectation, metrics: Metrics, dest_dir: str, xaxis_type: str,
+                                       topic_callback_dict: dict[str, str], comm_metrics: CommunicationMetrics) -> Tuple[Stats, pd.DataFrame, FigureSpec]:
+    """Calculate stats of subscription callback as topic. Graph is not exported here but returned (see GraphOnDemand)"""
     try:
         callback = None
-        for subscription in app.subscriptions:
-            if subscription.topic_name == expectation.topic_name:
-                callback = app.get_callback(subscription.callback_name)
-                break
+        if expectation.topic_name in topic_callback_dict:
+            callback = app.get_callback(topic_callback_dict[expectation.topic_name])
         if callback:
-            timeseries_plot = get_callback_plot(callback, metrics)
-            figure = timeseries_plot.figure(xaxis_type=xaxis_type)
-            figure.y_range.start = 0
-            figure.width = 1000
-            figure.height = 350
             graph_filename = metrics.name + callback.subscribe_topic_name.replace('/', '_') + '_unknown' + callback.node_name.replace('/', '_')
             graph_filename = graph_filename[:250]
-            df_comm = timeseries_plot.to_dataframe(xaxis_type=xaxis_type)
+            df_comm = comm_metrics.callback_to_dataframe(callback, metrics.name, xaxis_type)
+            if df_comm is None:
+                df_comm = get_callback_plot(callback, metrics).to_dataframe(xaxis_type=xaxis_type)
 
             stats, df = Stats.from_df(component_pair, callback.subscribe_topic_name, expectation.publish_node_name, callback.node_name, metrics, graph_filename, df_comm)
             if stats:
-                export_graph(figure, dest_dir, graph_filename, with_png=False, logger=_logger)
+                timeseries_dict = {f'subscribe: {callback.node_name}': timeseries for timeseries in timeseries_from_dataframe(df_comm).values()}
+                figure = FigureSpec(create_timeseries_figure, timeseries_dict, Y_AXIS_LABEL[metrics.name.lower()], y_range_start=0,
+                                    x_axis_label='system time [s]' if xaxis_type == 'system_time' else 'simulation time [s]')
             else:
                 raise Exception()
         else:
             raise Exception
     except:
         _logger.info(f'This callback is invalid: {expectation.topic_name}')
-        return None, None
+        return None, None, None
 
-    return stats, df
+    return stats, df, figure
 
 
-def validate_topic(app: Application, component_pair: tuple[str], target_comm_list: list[Communication], metrics: Metrics, dest_dir: str, xaxis_type: str, expectation_list: List[Expectation] = []) -> list[Result]:
-    expectation_validated_list = expectation_list.copy()   # keep original because there may be multiple callbacks with the same parameters in a node
+def validate_topic(app: Application, component_pair: tuple[str], target_comm_list: list[Communication], metrics: Metrics, dest_dir: str, xaxis_type: str,
+                   comm_metrics: CommunicationMetrics, topic_callback_dict: dict[str, str], expectation_list: List[Expectation] = []) -> list[Result]:
+    expectation_dict = Expectation.make_expectation_dict(expectation_list)
+    validated_expectation_id_set = set()   # keep original list because there may be multiple callbacks with the same parameters in a node
     result_info_list: list[Result] = []
 
     for comm in target_comm_list:
         _logger.debug(f'Processing ({metrics.name}): {component_pair}, {comm.topic_name}: {comm.publish_node_name} -> {comm.subscribe_node_name}')
-        stats, df = create_stats_for_comm(component_pair, comm, metrics, dest_dir, xaxis_type)
+        stats, df, figure = create_stats_for_comm(component_pair, comm, metrics, dest_dir, xaxis_type, comm_metrics)
         if stats is None:
             continue
 
         # Measured
-        expectation = Expectation.find_expectation(expectation_list, comm.topic_name, comm.publish_node_name, comm.subscribe_node_name)
+        expectation = expectation_dict.get((comm.topic_name, comm.publish_node_name, comm.subscribe_node_name))
         result = Result(stats, expectation)
         if expectation:
             # Measured and to be validated
             result.validate(df, expectation)
-            if expectation in expectation_validated_list:
-                expectation_validated_list.remove(expectation)
+            validated_expectation_id_set.add(expectation.id)
         result_info_list.append(result)
+        GraphOnDemand.export(figure, dest_dir, stats.graph_filename, [result.result_status], [comm.topic_name], with_png=False, logger=_logger)
 
-    for expectation in expectation_validated_list.copy():
+    for expectation in expectation_list:
         # Comm was invalid. Try to validate using subscription callback
-        if metrics != Metrics.FREQUENCY:
+        if metrics != Metrics.FREQUENCY or expectation.id in validated_expectation_id_set:
             continue
         _logger.debug(f'Processing as callback({metrics.name}): {component_pair}, {expectation.topic_name}: {expectation.publish_node_name} -> {expectation.subscribe_node_name}')
-        stats, df = create_stats_for_callback_as_topic(app, component_pair, expectation, metrics, dest_dir, xaxis_type)
+        stats, df, figure = create_stats_for_callback_as_topic(app, component_pair, expectation, metrics, dest_dir, xaxis_type, topic_callback_dict,
+                                                                comm_metrics)
         if stats is None:
             continue
 
         # Measured and to be validated
         result = Result(stats, expectation)
         result.validate(df, expectation)
-        expectation_validated_list.remove(expectation)
+        validated_expectation_id_set.add(expectation.id)
         result_info_list.append(result)
+        GraphOnDemand.export(figure, dest_dir, stats.graph_filename, [result.result_status], [expectation.topic_name], with_png=False, logger=_logger)
 
-    for expectation in expectation_validated_list:
-        if expectation.value > 0:
+    for expectation in expectation_list:
+        if expectation.id not in validated_expectation_id_set and expectation.value > 0:
             # Not measured but should be validated
             result = Result(Stats.from_expectation(expectation, metrics), expectation)
             result_info_list.append(result)
@@ -344,40 +370,28 @@ def save_stats(result_list: list[Result], metrics_str: str, dest_dir: str, is_ap
         yaml.safe_dump(result_var_list, f_yaml, encoding='utf-8', allow_unicode=True, sort_keys=False)
 
 
-def validate_component_pair(app: Application, component_pair: tuple[str], dest_dir: str, force: bool, expectation_csv_filename: str, xaxis_type: str):
+def validate_component_pair(app: Application, component_pair: tuple[str], target_comm_list: list[Communication], dest_dir: str, force: bool,
+                            expectation_list: List[Expectation], xaxis_type: str, comm_metrics: CommunicationMetrics,
+                            topic_callback_dict: dict[str, str]):
     """Validate callback for component pair"""
     dest_dir = f'{dest_dir}/validate_topic/{component_pair[0]}-{component_pair[1]}'
 
-    target_comm_list: list[Communication] = []
-    for comm in app.communications:
-        if ComponentManager().check_if_ignore(comm.publish_node_name) \
-            or ComponentManager().check_if_ignore(comm.subscribe_node_name)\
-            or ComponentManager().check_if_ignore(comm.topic_name):
-            continue
-        publish_component_name = ComponentManager().get_component_name(comm.publish_node_name)
-        subscribe_component_name = ComponentManager().get_component_name(comm.subscribe_node_name)
-        if ComponentManager().check_if_external_in_topic(comm.topic_name, comm.subscribe_node_name):
-            publish_component_name = 'external'
-        elif ComponentManager().check_if_external_out_topic(comm.topic_name, comm.publish_node_name):
-            subscribe_component_name = 'external'
-        if publish_component_name == component_pair[0] and subscribe_component_name == component_pair[1]:
-            target_comm_list.append(comm)
-
     make_destination_dir(dest_dir, force, _logger)
 
-    result_list = validate_topic(app, component_pair, target_comm_list, Metrics.FREQUENCY, dest_dir, xaxis_type, Expectation.from_csv(expectation_csv_filename, component_pair[0], component_pair[1]))
+    result_list = validate_topic(app, component_pair, target_comm_list, Metrics.FREQUENCY, dest_dir, xaxis_type, comm_metrics, topic_callback_dict, expectation_list)
     save_stats(result_list, Metrics.FREQUENCY.name, dest_dir)
 
-    result_list = validate_topic(app, component_pair, target_comm_list, Metrics.PERIOD, dest_dir, xaxis_type)
+    result_list = validate_topic(app, component_pair, target_comm_list, Metrics.PERIOD, dest_dir, xaxis_type, comm_metrics, topic_callback_dict)
     save_stats(result_list, Metrics.PERIOD.name, dest_dir)
 
-    result_list = validate_topic(app, component_pair, target_comm_list, Metrics.LATENCY, dest_dir, xaxis_type)
+    result_list = validate_topic(app, component_pair, target_comm_list, Metrics.LATENCY, dest_dir, xaxis_type, comm_metrics, topic_callback_dict)
     save_stats(result_list, Metrics.LATENCY.name, dest_dir)
 
 
 def validate(verbose, arch: Architecture, app: Application, dest_dir: str, force: bool,
-             component_list_json: str, expectation_csv_filename: str, xaxis_type: str):
-    """Validate topic"""
+             component_list_json: str, expectation_csv_filename: str, xaxis_type: str,
+             trace_cache: TraceCache = None, jobs: int = 1, trace_aggregate: TraceAggregate = None):
+    """Validate topic (from trace_aggregate if given, see common.utils_aggregate)"""
     global _logger
     if _logger is None:
         _logger = create_logger(__name__, logging.DEBUG if verbose else logging.INFO)
@@ -388,8 +402,26 @@ def validate(verbose, arch: Architecture, app: Application, dest_dir: str, force
 
     make_destination_dir(dest_dir + '/validate_topic', force, _logger)
 
+    comm_metrics = AggregatedCommunicationMetrics(trace_aggregate) if trace_aggregate else CommunicationMetrics(trace_cache)
+
+    # Partition communications into component pairs only once
+    comm_list_dict: dict[tuple[str, str], list[Communication]] = {}
+    for comm in app.communications:
+        component_pair = ComponentManager().get_comm_component_pair(comm.topic_name, comm.publish_node_name, comm.subscribe_node_name)
+        if component_pair is not None:
+            comm_list_dict.setdefault(component_pair, []).append(comm)
+
+    topic_callback_dict = create_topic_callback_dict(app)
+
+    # Read expectations in advance so that expectation id doesn't depend on the number of jobs
+    expectation_row_dict = Expectation.read_csv(expectation_csv_filename)
+    task_list = []
     for component_pair in ComponentManager().get_component_pair_list(with_external=True):
-        validate_component_pair(app, component_pair, dest_dir, force, expectation_csv_filename, xaxis_type)
+        expectation_list = Expectation.from_rows(expectation_row_dict.get(tuple(component_pair), []))
+        task_list.append((app, component_pair, comm_list_dict.get(tuple(component_pair), []), dest_dir, force,
+                          expectation_list, xaxis_type, comm_metrics, topic_callback_dict))
+    run_in_parallel(validate_component_pair, task_list, jobs)
+    flush_graph()
 
     _logger.info(f'<<< Validate topic finish >>>')
 
@@ -407,6 +439,16 @@ def parse_arg():
     parser.add_argument('--end_strip', type=float, default=0.0,
                         help='End strip [sec] to load trace data')
     parser.add_argument('--sim_time', type=strtobool, default=False)
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='The number of processes to validate in parallel')
+    parser.add_argument('--export_jobs', type=int, default=0,
+                        help='The number of processes to export graphs in background (0: export in the main process)')
+    parser.add_argument('--trace_cache_dir', type=str, default='',
+                        help='Directory to store timestamps extracted from trace data (disabled if empty)')
+    parser.add_argument('--graph_mode', type=str, default='all', choices=['all', 'failed'],
+                        help='failed: export graphs of FAILED/NOT_MEASURED items only, and defer the others (see export_deferred_graphs.py)')
+    parser.add_argument('--graph_allowlist', type=str, default='',
+                        help='Regular expression of topic/node names whose graphs are always exported in failed graph mode')
     parser.add_argument('-f', '--force', action='store_true', default=False,
                         help='Overwrite report directory')
     parser.add_argument('-v', '--verbose', action='store_true', default=False)
@@ -425,6 +467,12 @@ def main():
     _logger.debug(f'expectation_csv_filename: {args.expectation_csv_filename}')
     _logger.debug(f'start_strip: {args.start_strip}, end_strip: {args.end_strip}')
     _logger.debug(f'sim_time: {args.sim_time}')
+    _logger.debug(f'jobs: {args.jobs}')
+    _logger.debug(f'export_jobs: {args.export_jobs}')
+    GraphExporter.start(args.export_jobs)
+    _logger.debug(f'trace_cache_dir: {args.trace_cache_dir}')
+    _logger.debug(f'graph_mode: {args.graph_mode}, graph_allowlist: {args.graph_allowlist}')
+    GraphOnDemand.configure(args.graph_mode, args.graph_allowlist)
     dest_dir = args.report_directory if args.report_directory != '' else f'val_{Path(args.trace_data[0]).stem}'
     _logger.debug(f'dest_dir: {dest_dir}')
     xaxis_type = 'sim_time' if args.sim_time else 'system_time'
@@ -432,8 +480,10 @@ def main():
     lttng = read_trace_data(args.trace_data[0], args.start_strip, args.end_strip, False)
     arch = Architecture('lttng', str(args.trace_data[0]))
     app = Application(arch, lttng)
+    trace_cache = load_trace_cache(args.trace_cache_dir, args.trace_data[0], args.start_strip, args.end_strip, app, _logger)
 
-    validate(args.verbose, arch, app, dest_dir, args.force, args.component_list_json, args.expectation_csv_filename, xaxis_type)
+    validate(args.verbose, arch, app, dest_dir, args.force, args.component_list_json, args.expectation_csv_filename, xaxis_type,
+             trace_cache, args.jobs)
 
 
 if __name__ == '__main__':